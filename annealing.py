@@ -0,0 +1,387 @@
+import os
+import numpy as np
+from time import time
+from multiprocessing import Pool, Process, Lock, cpu_count, shared_memory
+from simulation import Simulation_Base
+from energy import Ordering_Energy, get_lib_books_points_cum
+from instrumentation import recorder
+
+
+class Full_Energy():
+    # Same interface as Ordering_Energy for energy functions that only evaluate complete orderings
+    def __init__(self, energy_func, ind_libs):
+        self.energy_func = energy_func
+        self.reset(ind_libs)
+
+    def reset(self, ind_libs):
+        self.ind_libs = np.array(ind_libs)
+        self.energy = self.energy_func(self.ind_libs)
+        self.pending = None
+
+    def propose(self, lo, window):
+        ind_libs_next = self.ind_libs.copy()
+        ind_libs_next[lo:lo+len(window)] = window
+        energy_next = self.energy_func(ind_libs_next)
+        self.pending = (ind_libs_next, energy_next)
+        return energy_next
+
+    def accept(self):
+        self.ind_libs, self.energy = self.pending
+        self.pending = None
+
+    def get_energies(self, orderings):
+        return np.array([self.energy_func(ind_libs) for ind_libs in orderings]), None, None
+
+    def propose_orderings(self, orderings):
+        energies = self.get_energies(orderings)[0]
+        self.pending_orderings = (orderings, energies)
+        return energies
+
+    def accept_ordering(self, k):
+        orderings, energies = self.pending_orderings
+        self.ind_libs, self.energy = orderings[k].copy(), energies[k]
+        self.pending_orderings = None
+
+
+class Ordering_Energy_Factory():
+    # Picklable recipe for an Ordering_Energy, so worker processes can build their own
+    def __init__(self, number, exponent_book_points=1):
+        self.number = number
+        self.exponent_book_points = exponent_book_points
+
+    def __call__(self, ind_libs):
+        simulation = Simulation_Base(self.number, silent=True)
+        lib_books_points_cum = get_lib_books_points_cum(simulation, self.exponent_book_points)
+        return Ordering_Energy(simulation.num_days, simulation.lib_days, simulation.lib_ships, lib_books_points_cum, ind_libs)
+
+
+class Move_Shift():
+    def __init__(self, boundary, max_distance):
+        self.boundary = boundary
+        self.max_distance = max_distance
+
+    def __call__(self, rng, ind_libs):
+        lo = rng.randint(0, self.boundary - 1)
+        dist_max = rng.randint(1, min(self.boundary-lo, self.max_distance))
+        dist = rng.randint(1, dist_max+1)
+        hi = lo + dist
+        if rng.rand() > 0.5:
+            return lo, np.concatenate([ind_libs[lo+1:hi], ind_libs[lo:lo+1]])
+        return lo, np.concatenate([ind_libs[hi-1:hi], ind_libs[lo:hi-1]])
+
+
+class Move_Swap():
+    def __init__(self, boundary, max_distance):
+        self.boundary = boundary
+        self.max_distance = max_distance
+
+    def __call__(self, rng, ind_libs):
+        lo = rng.randint(0, self.boundary - 1)
+        dist_max = rng.randint(1, min(self.boundary-lo, self.max_distance))
+        dist = rng.randint(1, dist_max+1)
+        return get_swap(ind_libs, lo, lo + dist)
+
+
+class Move_Explore():
+    # Swaps a library in front of the boundary with one behind it
+    def __init__(self, boundary):
+        self.boundary = boundary
+
+    def __call__(self, rng, ind_libs):
+        lo = rng.randint(0, self.boundary - 1)
+        hi = rng.randint(self.boundary, len(ind_libs))
+        return get_swap(ind_libs, lo, hi)
+
+
+class Move_Random_Swap():
+    def __call__(self, rng, ind_libs):
+        lo, hi = rng.randint(0, len(ind_libs), size=2)
+        if lo > hi:
+            lo, hi = hi, lo
+        return get_swap(ind_libs, lo, hi)
+
+
+def get_swap(ind_libs, lo, hi):
+    window = ind_libs[lo:hi+1].copy()
+    window[0] = ind_libs[hi]
+    window[-1] = ind_libs[lo]
+    return lo, window
+
+
+class Geometric_Schedule():
+    def __init__(self, factor=1.05, interval=10000, temperature_min=0):
+        self.factor = factor
+        self.interval = interval
+        self.temperature_min = temperature_min
+
+    def __call__(self, step, temperature):
+        if step % self.interval == 0:
+            return max(temperature / self.factor, self.temperature_min)
+        return temperature
+
+
+class Annealer():
+    # With num_tries > 1 every step draws num_tries proposals and evaluates them as one batch. rule "mtm" is
+    # multiple-try Metropolis (Liu, Liang and Wong), which keeps the Boltzmann distribution for symmetric
+    # moves, "best" takes the lowest energy proposal through the usual Metropolis test.
+    def __init__(self, energy, moves, temperature, schedule=None, seed=None, num_tries=1, rule="mtm"):
+        self.energy = energy
+        self.moves = moves
+        self.temperature = temperature
+        self.schedule = schedule
+        # Without a seed the global numpy generator is used, like the notebooks do
+        self.rng = np.random if seed is None else np.random.RandomState(seed)
+        self.step = 0
+        self.switch = 0
+        self.energy_best = energy.energy
+        self.ind_libs_best = np.array(energy.ind_libs)
+        # Plain lists, counting has to stay cheap when the recorder is off
+        self.num_proposals = [0] * len(moves)
+        self.num_accepted = [0] * len(moves)
+        self.num_tries = num_tries
+        self.rule = rule
+
+    def get_orderings(self, ind_libs, num):
+        orderings = np.tile(ind_libs, (num, 1))
+        switches = []
+        for k in range(num):
+            switch = self.rng.randint(len(self.moves)) if len(self.moves) > 1 else self.switch
+            lo, window = self.moves[switch](self.rng, ind_libs)
+            orderings[k, lo:lo+len(window)] = window
+            switches.append(switch)
+        return orderings, switches
+
+    def get_weights(self, energies, energy_min):
+        return np.exp((energy_min - energies) / self.temperature)
+
+    def transition_batch(self):
+        orderings, switches = self.get_orderings(self.energy.ind_libs, self.num_tries)
+        energies = self.energy.propose_orderings(orderings)
+        for switch in switches:
+            self.num_proposals[switch] += 1
+        if self.rule == "best":
+            k = int(np.argmin(energies))
+            tresh = np.exp(min(0, (self.energy.energy - energies[k]) / self.temperature))
+        else:
+            # Pick a proposal by its Boltzmann weight, then weigh it against num_tries - 1 proposals drawn
+            # around it plus the current ordering
+            energy_min = energies.min()
+            weights = self.get_weights(energies, energy_min)
+            cum_weights = np.cumsum(weights)
+            k = min(int(np.searchsorted(cum_weights, self.rng.rand() * cum_weights[-1], side='right')), self.num_tries - 1)
+            references = self.get_orderings(orderings[k], self.num_tries - 1)[0]
+            energies_reference = np.append(self.energy.get_energies(references)[0], self.energy.energy)
+            energy_min = min(energy_min, energies_reference.min())
+            tresh = min(1, self.get_weights(energies, energy_min).sum() / self.get_weights(energies_reference, energy_min).sum())
+        if self.rng.rand() < tresh:
+            self.energy.accept_ordering(k)
+            self.num_accepted[switches[k]] += 1
+            if self.energy.energy < self.energy_best:
+                self.energy_best = self.energy.energy
+                self.ind_libs_best = np.array(self.energy.ind_libs)
+            return True
+        return False
+
+    def transition(self):
+        if self.num_tries > 1:
+            return self.transition_batch()
+        if len(self.moves) > 1:
+            self.switch = self.rng.randint(len(self.moves))
+        lo, window = self.moves[self.switch](self.rng, self.energy.ind_libs)
+        energy_next = self.energy.propose(lo, window)
+        self.num_proposals[self.switch] += 1
+        tresh = np.exp(min(0, (self.energy.energy - energy_next) / self.temperature))
+        if self.rng.rand() < tresh:
+            self.energy.accept()
+            self.num_accepted[self.switch] += 1
+            if self.energy.energy < self.energy_best:
+                self.energy_best = self.energy.energy
+                self.ind_libs_best = np.array(self.energy.ind_libs)
+            return True
+        return False
+
+    def run(self, num_steps):
+        t0 = time()
+        num_proposals = list(self.num_proposals)
+        num_accepted = list(self.num_accepted)
+        for _ in range(num_steps):
+            self.transition()
+            if self.schedule is not None:
+                self.temperature = self.schedule(self.step, self.temperature)
+            self.step += 1
+        if recorder.enabled:
+            self.record(time() - t0, num_steps, num_proposals, num_accepted)
+        return self.energy_best
+
+    def record(self, seconds, num_steps, num_proposals, num_accepted):
+        recorder.add_time("annealing.run", seconds)
+        recorder.count("annealing.steps", num_steps)
+        recorder.set("annealing.proposals_per_second", num_steps * self.num_tries / max(seconds, 1e-9))
+        for switch, move in enumerate(self.moves):
+            name = "annealing.{}.{}".format(switch, type(move).__name__)
+            recorder.count(name + ".proposals", self.num_proposals[switch] - num_proposals[switch])
+            recorder.count(name + ".accepted", self.num_accepted[switch] - num_accepted[switch])
+            recorder.set(name + ".acceptance_rate", self.num_accepted[switch] / max(self.num_proposals[switch], 1))
+        recorder.append("annealing.temperature", (self.step, float(self.temperature)))
+        recorder.append("annealing.energy", (self.step, float(self.energy.energy), float(self.energy_best)))
+
+
+class Replica():
+    def __init__(self, ind_libs, temperature, seed):
+        self.ind_libs = np.array(ind_libs)
+        self.temperature = temperature
+        self.rng_state = np.random.RandomState(seed).get_state()
+        self.energy = None
+        self.energy_best = np.inf
+        self.ind_libs_best = None
+
+
+def get_temperatures(temperature_min, temperature_max, num_replicas):
+    return np.geomspace(temperature_min, temperature_max, num_replicas)
+
+def init_worker(energy_factory, moves, ind_libs, num_tries=1, rule="mtm"):
+    global worker_energy, worker_moves, worker_tries
+    worker_energy = energy_factory(ind_libs)
+    worker_moves = moves
+    worker_tries = (num_tries, rule)
+
+def run_replica(args):
+    replica, num_steps = args
+    worker_energy.reset(replica.ind_libs)
+    annealer = Annealer(worker_energy, worker_moves, replica.temperature, seed=0, num_tries=worker_tries[0], rule=worker_tries[1])
+    annealer.rng.set_state(replica.rng_state)
+    annealer.run(num_steps)
+    replica.ind_libs = np.array(worker_energy.ind_libs)
+    replica.energy = worker_energy.energy
+    replica.rng_state = annealer.rng.get_state()
+    if annealer.energy_best < replica.energy_best:
+        replica.energy_best = annealer.energy_best
+        replica.ind_libs_best = annealer.ind_libs_best
+    return replica
+
+def exchange_replicas(replicas, rng, offset):
+    # Metropolis exchange between neighbouring temperatures, the rng states stay with their temperature
+    num_swaps = 0
+    for i in range(offset, len(replicas) - 1, 2):
+        a, b = replicas[i], replicas[i+1]
+        tresh = np.exp(min(0, (a.energy - b.energy) * (1 / a.temperature - 1 / b.temperature)))
+        if rng.rand() < tresh:
+            a.ind_libs, b.ind_libs = b.ind_libs, a.ind_libs
+            a.energy, b.energy = b.energy, a.energy
+            num_swaps += 1
+    return num_swaps
+
+def run_parallel_tempering(energy_factory, moves, ind_libs, temperatures, num_rounds, steps_per_round, seed=1337, num_workers=None, num_tries=1, rule="mtm"):
+    if num_workers is None:
+        num_workers = min(cpu_count(), len(temperatures))
+    seeds = np.random.SeedSequence(seed).generate_state(len(temperatures) + 1)
+    rng = np.random.RandomState(seeds[0])
+    replicas = [Replica(ind_libs, temperature, replica_seed) for temperature, replica_seed in zip(temperatures, seeds[1:])]
+
+    if num_workers > 1:
+        pool = Pool(num_workers, initializer=init_worker, initargs=(energy_factory, moves, ind_libs, num_tries, rule))
+        map_func = pool.map
+    else:
+        pool = None
+        init_worker(energy_factory, moves, ind_libs, num_tries, rule)
+        map_func = lambda func, args: list(map(func, args))
+    try:
+        for num_round in range(num_rounds):
+            replicas = map_func(run_replica, [(replica, steps_per_round) for replica in replicas])
+            num_swaps = exchange_replicas(replicas, rng, num_round % 2)
+            recorder.count("parallel_tempering.exchanges", num_swaps)
+            recorder.count("parallel_tempering.exchange_attempts", (len(replicas) - num_round % 2) // 2)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    replica_best = min(replicas, key=lambda replica: replica.energy_best)
+    return replica_best.ind_libs_best, replica_best.energy_best, replicas
+
+
+class Shared_Best():
+    # Best energy and ordering found by any worker, kept in shared memory as [version, energy, ind_libs...]
+    def __init__(self, ind_libs, energy=np.inf):
+        self.length = len(ind_libs)
+        self.shm = shared_memory.SharedMemory(create=True, size=8 * (self.length + 2))
+        self.lock = Lock()
+        # Forked workers inherit this object, only the creating process may unlink the segment
+        self.owner_pid = os.getpid()
+        self.attach()
+        self.version[0] = 0
+        self.energy[0] = energy
+        self.ind_libs[:] = ind_libs
+
+    def attach(self):
+        self.version = np.ndarray(1, dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self.energy = np.ndarray(1, dtype=np.float64, buffer=self.shm.buf, offset=8)
+        self.ind_libs = np.ndarray(self.length, dtype=np.int64, buffer=self.shm.buf, offset=16)
+
+    def __getstate__(self):
+        return self.shm.name, self.length, self.lock, self.owner_pid
+
+    def __setstate__(self, state):
+        name, self.length, self.lock, self.owner_pid = state
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.attach()
+
+    def get_energy(self):
+        return float(self.energy[0])
+
+    def get(self):
+        # Seqlock read, the version is odd while a publish is in progress
+        while True:
+            version = int(self.version[0])
+            if version % 2 == 0:
+                energy = float(self.energy[0])
+                ind_libs = self.ind_libs.copy()
+                if int(self.version[0]) == version:
+                    return energy, ind_libs
+
+    def publish(self, energy, ind_libs):
+        if energy >= self.energy[0]:
+            return False
+        with self.lock:
+            if energy >= self.energy[0]:
+                return False
+            self.version[0] += 1
+            self.energy[0] = energy
+            self.ind_libs[:] = ind_libs
+            self.version[0] += 1
+        return True
+
+    def close(self):
+        del self.version, self.energy, self.ind_libs
+        self.shm.close()
+        if os.getpid() == self.owner_pid:
+            self.shm.unlink()
+
+
+def run_shared_worker(energy_factory, moves, ind_libs, temperature, seed, shared_best, num_steps, sync_interval, num_tries=1, rule="mtm"):
+    energy = energy_factory(ind_libs)
+    annealer = Annealer(energy, moves, temperature, seed=seed, num_tries=num_tries, rule=rule)
+    for start in range(0, num_steps, sync_interval):
+        annealer.run(min(sync_interval, num_steps - start))
+        shared_best.publish(annealer.energy_best, annealer.ind_libs_best)
+        if shared_best.get_energy() < energy.energy:
+            energy_shared, ind_libs_shared = shared_best.get()
+            energy.reset(ind_libs_shared)
+    shared_best.close()
+
+def run_shared(energy_factory, moves, ind_libs, temperature, num_steps, sync_interval=100, num_workers=None, seed=1337, num_tries=1, rule="mtm"):
+    # Independent chains that only meet through Shared_Best every sync_interval steps
+    if num_workers is None:
+        num_workers = cpu_count()
+    seeds = np.random.SeedSequence(seed).generate_state(num_workers)
+    shared_best = Shared_Best(ind_libs)
+    processes = []
+    for worker_seed in seeds:
+        p = Process(target=run_shared_worker, args=(energy_factory, moves, ind_libs, temperature, worker_seed, shared_best, num_steps, sync_interval, num_tries, rule))
+        p.start()
+        processes.append(p)
+    for p in processes:
+        p.join()
+    energy_best, ind_libs_best = shared_best.get()
+    shared_best.close()
+    return ind_libs_best, energy_best
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from time import time
+from instrumentation import recorder
+
+
+def get_solver_tag(solver):
+    # Class and limits of the wrapped solver, a time or gap limited result must not answer for another solver
+    settings = [(name, getattr(solver, name)) for name in ("time_limit", "gap", "threads") if hasattr(solver, name)]
+    return type(solver).__name__ + repr(settings)
+
+
+class Assignment_Cache():
+    # Drop-in wrapper around anything with get_optimal_books_for_ordered_libs. Results are keyed by the
+    # solver and its limits, the libraries that still sign up in time, the days and the book points, so
+    # orderings that only differ behind the deadline share one entry. The optional sqlite store outlives
+    # the process and can be shared by workers.
+    def __init__(self, solver, max_size=10000, path=None):
+        self.solver = solver
+        self.num_days = solver.num_days
+        self.lib_days = solver.lib_days
+        self.book_points = solver.book_points
+        self.max_size = max_size
+        self.path = path
+        self.entries = OrderedDict()
+        self.points_digests = dict()
+        self.connection = None
+        self.connection_pid = None
+        self.num_hits = 0
+        self.num_disk_hits = 0
+        self.num_misses = 0
+        self.time_solve = 0
+        self.time_saved = 0
+
+    def get_points_digest(self, book_points):
+        # Hashing the points vector once per array object, the array is kept so its id stays unique
+        entry = self.points_digests.get(id(book_points))
+        if entry is None or entry[0] is not book_points:
+            entry = (book_points, hashlib.blake2b(np.ascontiguousarray(book_points, dtype=np.int64).tobytes(), digest_size=16).hexdigest())
+            self.points_digests[id(book_points)] = entry
+        return entry[1]
+
+    def get_num_active(self, ind_libs, days_available):
+        days_used = np.cumsum(self.lib_days[ind_libs])
+        return int(np.searchsorted(days_used, days_available))
+
+    def get_key(self, ind_libs_active, days_available, book_points, solverName=None):
+        h = hashlib.blake2b(digest_size=16)
+        # The limits are read on every call, they can change between calls like with MIP_solver.limits
+        h.update("{} {}\n".format(get_solver_tag(self.solver), solverName).encode())
+        h.update(np.ascontiguousarray(ind_libs_active, dtype=np.int64).tobytes())
+        h.update(str(int(days_available)).encode())
+        h.update(self.get_points_digest(book_points).encode())
+        return h.hexdigest()
+
+    def get_connection(self):
+        # sqlite connections must not cross a fork, every process opens its own
+        if self.connection is None or self.connection_pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS assignments (key TEXT PRIMARY KEY, lib_indptr BLOB, books BLOB, seconds REAL)")
+            self.connection_pid = os.getpid()
+        return self.connection
+
+    def read_disk(self, key):
+        row = self.get_connection().execute("SELECT lib_indptr, books, seconds FROM assignments WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.int32), np.frombuffer(row[1], dtype=np.int32), row[2]
+
+    def write_disk(self, key, entry):
+        lib_indptr, books, seconds = entry
+        with self.get_connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO assignments VALUES (?, ?, ?, ?)", (key, lib_indptr.tobytes(), books.tobytes(), seconds))
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get_optimal_books_for_ordered_libs(self, ind_libs_best, days_available=None, book_points_available=None, solverName=None):
+        if days_available is None:
+            days_available = self.num_days
+        if book_points_available is None:
+            book_points_available = self.book_points
+        ind_libs_best = np.asarray(ind_libs_best, dtype=np.int64)
+        ind_libs_active = ind_libs_best[:self.get_num_active(ind_libs_best, days_available)]
+        key = self.get_key(ind_libs_active, days_available, book_points_available, solverName)
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.num_hits += 1
+            self.entries.move_to_end(key)
+        elif self.path is not None:
+            entry = self.read_disk(key)
+            if entry is not None:
+                self.num_disk_hits += 1
+                self.put(key, entry)
+        if entry is not None:
+            self.time_saved += entry[2]
+            recorder.count("assignment_cache.hits")
+        else:
+            self.num_misses += 1
+            recorder.count("assignment_cache.misses")
+            t0 = time()
+            kwargs = dict() if solverName is None else {"solverName": solverName}
+            result = self.solver.get_optimal_books_for_ordered_libs(ind_libs_active, days_available, book_points_available, **kwargs)
+            seconds = time() - t0
+            self.time_solve += seconds
+            lib_indptr = np.zeros(len(result) + 1, dtype=np.int32)
+            np.cumsum([len(books) for lib, books in result], out=lib_indptr[1:])
+            books = np.array([book for lib, books in result for book in books], dtype=np.int32)
+            entry = (lib_indptr, books, seconds)
+            self.put(key, entry)
+            if self.path is not None:
+                self.write_disk(key, entry)
+
+        lib_indptr, books, seconds = entry
+        books = books.tolist()
+        result = [(lib, books[lib_indptr[i]:lib_indptr[i+1]]) for i, lib in enumerate(ind_libs_active.tolist())]
+        # Libraries behind the deadline ship nothing
+        return result + [(lib, []) for lib in ind_libs_best[len(ind_libs_active):].tolist()]
+
+    def get_stats(self):
+        num_calls = self.num_hits + self.num_disk_hits + self.num_misses
+        return {"calls": num_calls, "hits": self.num_hits, "disk_hits": self.num_disk_hits, "misses": self.num_misses,
+                "hit_rate": (self.num_hits + self.num_disk_hits) / max(num_calls, 1), "size": len(self.entries),
+                "time_solve": self.time_solve, "time_saved": self.time_saved}
@@ -0,0 +1,525 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import traceback
+from queue import Empty
+from time import time
+import numpy as np
+from simulation import Simulation_Base, paths, length_paths, get_path, line_to_ints, read, write_submission_arrays, read_submission_arrays
+from scoring import encode_solution
+from flow_solver import Flow_solver, get_test_ordering
+from energy import Approx_Energy, Ordering_Energy, get_lib_books_points_cum
+from greedy import get_greedy_ordering
+from mip_matrix import MIP_matrix_solver
+from mip_solver import MIP_solver, pmo
+from generator import generate, profiles
+
+
+def read_lines(number):
+    path = paths[number]
+    with open(path, 'r') as f:
+        num_books, num_libs, num_days = line_to_ints(f.readline())
+        book_points = line_to_ints(f.readline())
+        lib_books_lists = []
+        lib_num_books = []
+        lib_days = []
+        lib_ships = []
+        for lib in range(num_libs):
+            lib_num_book, lib_day, lib_ship = line_to_ints(f.readline())
+            lib_num_books.append(lib_num_book)
+            lib_days.append(lib_day)
+            lib_ships.append(lib_ship)
+            lib_books_lists.append(line_to_ints(f.readline()))
+
+        book_points = np.array(book_points)
+        lib_num_books = np.array(lib_num_books)
+        lib_days = np.array(lib_days)
+        lib_ships = np.array(lib_ships)
+
+    return num_books, num_libs, num_days, book_points, lib_num_books, lib_days, lib_ships, lib_books_lists
+
+def load_lines(number):
+    # The loader as it was before the CSR arrays, kept as reference for the benchmark
+    num_books, num_libs, num_days, book_points, lib_num_books, lib_days, lib_ships, lib_books_lists = read_lines(number)
+    lib_books_lists = [list(np.array(books)[np.argsort(book_points[books])[::-1]]) for books in lib_books_lists]
+    lib_books_sets = [set(books) for books in lib_books_lists]
+    book_num_libs = np.zeros(num_books, dtype = int)
+    book_libs_lists = [[] for _ in range(num_books)]
+    for lib, books in enumerate(lib_books_lists):
+        for book in books:
+            book_libs_lists[book].append(lib)
+        book_num_libs[books] += 1
+    return lib_books_lists, lib_books_sets, book_libs_lists
+
+def load_csr(number):
+    return Simulation_Base(number, silent=True, use_cache=False)
+
+def load_csr_with_views(number):
+    sim = Simulation_Base(number, silent=True, use_cache=False)
+    return sim.lib_books_lists, sim.lib_books_sets, sim.book_libs_lists
+
+def load_cache(number):
+    return Simulation_Base(number, silent=True)
+
+loaders = {"lines": load_lines, "csr": load_csr, "csr_views": load_csr_with_views, "cache": load_cache}
+
+def get_status_mb(field):
+    with open("/proc/self/status", 'r') as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise OSError(field + " not in /proc/self/status")
+
+def get_peak_rss():
+    try:
+        return get_status_mb("VmHWM")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def reset_peak_rss():
+    # Linux only, without the reset the peak of the imports hides the peak of small cases
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+        return get_status_mb("VmRSS")
+    except OSError:
+        return get_peak_rss()
+
+def measure(func, args, queue):
+    try:
+        rss0 = reset_peak_rss()
+        t0 = time()
+        metrics = func(*args)
+        t1 = time()
+        queue.put((t1 - t0, get_peak_rss() - rss0, metrics if isinstance(metrics, dict) else None))
+    except BaseException:
+        queue.put(traceback.format_exc())
+
+def run_isolated(func, *args, timeout=None, poll=1):
+    # Every measurement runs in a fresh interpreter so peak RSS is not polluted by earlier runs.
+    # A case that raises, dies or runs past timeout returns None instead of a result.
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    p = context.Process(target=measure, args=(func, args, queue))
+    p.start()
+    t0 = time()
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=poll)
+        except Empty:
+            if not p.is_alive():
+                # The result can still be in the pipe when the process exited right after putting it
+                try:
+                    result = queue.get(timeout=poll)
+                except Empty:
+                    result = "process exited with code {} without a result".format(p.exitcode)
+            elif timeout is not None and time() - t0 > timeout:
+                p.terminate()
+                result = "timed out after {}s".format(timeout)
+    p.join()
+    if isinstance(result, str):
+        print("{} failed: {}".format(func.__name__, result.rstrip()))
+        return None
+    return result
+
+def benchmark_load(numbers):
+    results = []
+    for number in numbers:
+        # Make sure the binary cache exists, so the "cache" loader measures a warm reload
+        Simulation_Base(number, silent=True)
+        for name, loader in loaders.items():
+            result = run_isolated(loader, number)
+            if result is None:
+                continue
+            seconds, peak_rss_mb, _ = result
+            results.append((paths[number], name, seconds, peak_rss_mb))
+            print("{:40s} {:10s} {:8.3f}s {:8.1f}MB".format(paths[number], name, seconds, peak_rss_mb))
+    return results
+
+class Approx_Energy_Reference():
+    # Simulation_E.get_energy_approx as written in the notebook
+    def __init__(self, simulation, ind_libs_available):
+        self.simulation = simulation
+        self.book_libs_current = [[] for _ in range(simulation.num_books)]
+        book_num_libs_current = np.zeros(simulation.num_books, dtype=int)
+        for lib in ind_libs_available:
+            for book in simulation.lib_books_lists[lib]:
+                self.book_libs_current[book].append(lib)
+                book_num_libs_current[book] += 1
+        self.book_libs_current = [np.array(libs, dtype=int) for libs in self.book_libs_current]
+        ind_book_available = np.where(book_num_libs_current > 0)[0]
+        book_importance = simulation.book_points[ind_book_available]
+        self.ind_book_sorted = ind_book_available[np.argsort(-book_importance)]
+
+    def get_energy(self, ind_libs):
+        sim = self.simulation
+        days_remaining = sim.num_days - np.cumsum(sim.lib_days[ind_libs])
+        ind_lib_books_ship_remaining = np.clip(days_remaining * sim.lib_ships[ind_libs], 0, None)
+        ind_lib_books_inventory_remaining = sim.lib_num_books[ind_libs]
+        lib_ind_libs = np.zeros(sim.num_libs, dtype=int)
+        for ind, lib in enumerate(ind_libs):
+            lib_ind_libs[lib] = ind
+        ind_lib_ratio = ind_lib_books_ship_remaining / ind_lib_books_inventory_remaining
+        points_total = 0
+        for book in self.ind_book_sorted:
+            ind_libs = lib_ind_libs[self.book_libs_current[book]]
+            ind_lib_best = ind_libs[np.argmax(ind_lib_ratio[ind_libs])]
+            if ind_lib_books_ship_remaining[ind_lib_best] > 0:
+                points_total += sim.book_points[book]
+                ind_lib_books_ship_remaining[ind_lib_best] -= 1
+                ind_lib_books_inventory_remaining[ind_lib_best] -= 1
+                ind_lib_ratio[ind_lib_best] = ind_lib_books_ship_remaining[ind_lib_best] / ind_lib_books_inventory_remaining[ind_lib_best]
+        return - points_total
+
+def benchmark_energy_approx(number=4, num_evals=10, seed=1337):
+    sim = Simulation_Base(number, silent=True)
+    # Same library selection as Simulation_E.init_ind_lib_current
+    ind_libs_available = np.where(sim.lib_ships / sim.lib_days >= 1)[0]
+    rng = np.random.RandomState(seed)
+    orderings = [rng.permutation(ind_libs_available) for _ in range(num_evals)]
+    results = []
+    energies = []
+    for name, energy_class in [("reference", Approx_Energy_Reference), ("compiled", Approx_Energy)]:
+        energy = energy_class(sim, ind_libs_available)
+        # The first call includes numba compilation and is not timed
+        energy.get_energy(orderings[0])
+        t0 = time()
+        energies.append([energy.get_energy(ind_libs) for ind_libs in orderings])
+        seconds = (time() - t0) / num_evals
+        results.append((paths[number], name, seconds))
+        print("{:40s} {:10s} {:10.5f}s per evaluation".format(paths[number], name, seconds))
+    print("identical energies:", energies[0] == energies[1])
+    return results
+
+def write_lines(path, list_lists):
+    # The submission writer and reader as they were before the bulk versions
+    with open(path, 'w') as f:
+        for lis in list_lists:
+            for e in lis[:-1]:
+                f.write(str(e) + " ")
+            f.write(str(lis[-1]) + "\n")
+
+def read_submission_lines(path):
+    solution = []
+    with open(path, 'r') as f:
+        num_libs = line_to_ints(f.readline())[0]
+        for i in range(num_libs):
+            lib, _ = line_to_ints(f.readline())
+            books = line_to_ints(f.readline())
+            solution.append((lib, books))
+    return solution
+
+def benchmark_submission(numbers, num_repeats=5):
+    results = []
+    for number in numbers:
+        sim = Simulation_Base(number, silent=True)
+        solution = Flow_solver(sim).get_optimal_books_for_ordered_libs(get_test_ordering(sim))
+        solution = [(int(lib), books) for lib, books in solution if len(books) > 0]
+        submission = [[len(solution)]]
+        for lib, books in solution:
+            submission += [[lib, len(books)], books]
+        encoded = encode_solution(solution)
+        fd, path = tempfile.mkstemp(suffix=".txt")
+        os.close(fd)
+        variants = [("lines", lambda: write_lines(path, submission), lambda: read_submission_lines(path)),
+                    ("bulk", lambda: write_submission_arrays(number, *encoded, atomic=False, path=path), lambda: read_submission_arrays(number, path)),
+                    ("bulk_atomic", lambda: write_submission_arrays(number, *encoded, atomic=True, path=path), lambda: read_submission_arrays(number, path))]
+        for name, write_func, read_func in variants:
+            t0 = time()
+            for _ in range(num_repeats):
+                write_func()
+            t1 = time()
+            for _ in range(num_repeats):
+                read_func()
+            t2 = time()
+            results.append((paths[number], name, (t1 - t0) / num_repeats, (t2 - t1) / num_repeats))
+            print("{:40s} {:12s} write {:8.4f}s read {:8.4f}s".format(paths[number], name, (t1 - t0) / num_repeats, (t2 - t1) / num_repeats))
+        os.remove(path)
+    return results
+
+def get_active_ordering(sim):
+    # Greedy ordering cut at the deadline, the fixed ordering of the energy, MIP and scoring cases
+    ind_libs = get_greedy_ordering(sim)
+    days_used = np.cumsum(sim.lib_days[ind_libs])
+    return ind_libs[days_used < sim.num_days]
+
+def case_read(number):
+    read(number)
+
+def case_init(number):
+    Simulation_Base(number, silent=True)
+
+def case_energy(number, min_seconds=1):
+    sim = Simulation_Base(number, silent=True)
+    ind_libs = get_greedy_ordering(sim)
+    energy = Ordering_Energy(sim.num_days, sim.lib_days, sim.lib_ships, get_lib_books_points_cum(sim), ind_libs)
+    rng = np.random.RandomState(1337)
+    num_evals = 0
+    t0 = time()
+    while time() - t0 < min_seconds:
+        lo, hi = np.sort(rng.randint(0, len(ind_libs), size=2))
+        energy.propose_swap(lo, hi)
+        num_evals += 1
+    seconds_swap = time() - t0
+    num_evals_full = 0
+    t0 = time()
+    while time() - t0 < min_seconds:
+        energy.get_energy(ind_libs)
+        num_evals_full += 1
+    return {"swaps_per_second": num_evals / seconds_swap, "energies_per_second": num_evals_full / (time() - t0)}
+
+def case_energy_approx(number, num_evals=100, min_seconds=1):
+    sim = Simulation_Base(number, silent=True)
+    ind_libs = get_greedy_ordering(sim)
+    energy = Approx_Energy(sim, ind_libs)
+    # The first call includes numba compilation and is not timed
+    energy.get_energy(ind_libs)
+    num_evals_done = 0
+    t0 = time()
+    while num_evals_done < num_evals or time() - t0 < min_seconds:
+        energy.get_energy(ind_libs)
+        num_evals_done += 1
+    return {"approx_energies_per_second": num_evals_done / (time() - t0)}
+
+def case_mip(number, time_limit=60):
+    sim = Simulation_Base(number, silent=True)
+    mip = MIP_matrix_solver(sim, time_limit=time_limit)
+    mip.get_optimal_books_for_ordered_libs(get_active_ordering(sim))
+    return {"build_seconds": mip.time_build, "solve_seconds": mip.time_solve, "num_variables": mip.num_variables, "num_constraints": mip.num_constraints}
+
+def case_flow(number):
+    sim = Simulation_Base(number, silent=True)
+    flow = Flow_solver(sim)
+    flow.get_optimal_books_for_ordered_libs(get_active_ordering(sim))
+    return {"solve_seconds": flow.time_solve}
+
+def get_case_solution(number):
+    sim = Simulation_Base(number, silent=True)
+    sim.solution = Flow_solver(sim).get_optimal_books_for_ordered_libs(get_active_ordering(sim))
+    return sim
+
+def case_score(number, num_repeats=5):
+    sim = get_case_solution(number)
+    sim.get_score()
+    t0 = time()
+    for _ in range(num_repeats):
+        sim.get_score()
+    t1 = time()
+    for _ in range(num_repeats):
+        sim.get_violations()
+    t2 = time()
+    return {"score_seconds": (t1 - t0) / num_repeats, "check_seconds": (t2 - t1) / num_repeats}
+
+def case_write(number, num_repeats=5):
+    sim = get_case_solution(number)
+    encoded = encode_solution(sim.solution)
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    t0 = time()
+    for _ in range(num_repeats):
+        write_submission_arrays(number, *encoded, atomic=True, path=path)
+    t1 = time()
+    for _ in range(num_repeats):
+        read_submission_arrays(number, path)
+    t2 = time()
+    os.remove(path)
+    return {"write_seconds": (t1 - t0) / num_repeats, "read_seconds": (t2 - t1) / num_repeats}
+
+class Model_Built(Exception):
+    pass
+
+class MIP_build_timer(MIP_solver):
+    # Stops the model methods of MIP_solver where they would solve, so the build is timed without a solver binary
+    def solve(self, solverName):
+        self.time_build = time() - self.t0
+        self.num_variables = len(self.get_variables())
+        self.num_constraints = sum(1 for _ in self.model.components(ctype=pmo.constraint._ctype))
+        raise Model_Built()
+
+def case_mip_pyomo_build(number):
+    sim = Simulation_Base(number, silent=True)
+    mip = MIP_build_timer(sim)
+    try:
+        mip.get_optimal_books_for_ordered_libs(get_active_ordering(sim))
+    except Model_Built:
+        pass
+    return {"build_seconds": mip.time_build, "num_variables": mip.num_variables, "num_constraints": mip.num_constraints}
+
+cases = {"read": case_read, "init": case_init, "energy": case_energy, "energy_approx": case_energy_approx,
+         "mip": case_mip, "mip_pyomo_build": case_mip_pyomo_build, "flow": case_flow, "score": case_score, "write": case_write}
+
+def get_best_result(runs):
+    # Noise only ever slows a run down, so times are the best of the repeated runs, the other values their median
+    result = dict()
+    for key in runs[0]:
+        values = [run[key] for run in runs]
+        if key.endswith("seconds"):
+            result[key] = float(np.min(values))
+        elif is_higher_better(key):
+            result[key] = float(np.max(values))
+        else:
+            result[key] = float(np.median(values))
+    return result
+
+def run_suite(numbers, case_names, num_repeats=3, timeout=None):
+    # results[path][case] holds wall time and peak RSS of the whole case plus the metrics the case measured itself,
+    # each the best or median of num_repeats runs. A case that failed in every run only holds its error.
+    results = dict()
+    for number in numbers:
+        # Build the binary cache outside the measurements
+        Simulation_Base(number, silent=True)
+        results[get_path(number)] = dict()
+        for name in case_names:
+            runs = []
+            for _ in range(num_repeats):
+                run = run_isolated(cases[name], number, timeout=timeout)
+                if run is not None:
+                    seconds, peak_rss_mb, metrics = run
+                    runs.append(dict(metrics or {}, seconds=seconds, peak_rss_mb=peak_rss_mb))
+            if not runs:
+                results[get_path(number)][name] = {"error": "failed in all {} runs".format(num_repeats)}
+                print("{:40s} {:14s} failed".format(get_path(number), name))
+                continue
+            result = get_best_result(runs)
+            results[get_path(number)][name] = result
+            metrics = {key: value for key, value in result.items() if key not in ("seconds", "peak_rss_mb")}
+            print("{:40s} {:14s} {:8.3f}s {:8.1f}MB {}".format(get_path(number), name, result["seconds"], result["peak_rss_mb"], ", ".join("{} {:.4g}".format(key, value) for key, value in metrics.items())))
+    return results
+
+def get_failures(results):
+    return [(path, name) for path, path_results in results.items() for name, result in path_results.items() if "error" in result]
+
+def is_higher_better(metric):
+    return metric.endswith("per_second")
+
+def compare_results(results, baseline, threshold=0.2, min_seconds=0.01, min_rss_mb=10):
+    # Metric values that got worse by more than threshold relative to the baseline, counts are not compared.
+    # Times below min_seconds and peak RSS below min_rss_mb are noise and not compared either.
+    regressions = []
+    for path, path_results in results.items():
+        for name, result in path_results.items():
+            baseline_result = baseline.get(path, dict()).get(name)
+            if baseline_result is None:
+                continue
+            # The wall time of a case includes its setup, it is only compared if the case does not time itself
+            timed = any(metric != "seconds" and (metric.endswith("seconds") or is_higher_better(metric)) for metric in result)
+            for metric, value in result.items():
+                if metric not in baseline_result or not (metric.endswith("seconds") or is_higher_better(metric) or metric == "peak_rss_mb"):
+                    continue
+                if metric == "seconds" and timed:
+                    continue
+                value_baseline = baseline_result[metric]
+                if is_higher_better(metric):
+                    ratio = value_baseline / max(value, 1e-12)
+                elif metric.endswith("seconds") and max(value, value_baseline) < min_seconds:
+                    continue
+                elif metric == "peak_rss_mb" and max(value, value_baseline) < min_rss_mb:
+                    continue
+                else:
+                    ratio = value / max(value_baseline, 1e-12)
+                if ratio > 1 + threshold:
+                    regressions.append((path, name, metric, value_baseline, value, ratio))
+    for path, name, metric, value_baseline, value, ratio in regressions:
+        print("regression {:40s} {:14s} {:24s} {:12.4g} -> {:12.4g} ({:+.0%})".format(path, name, metric, value_baseline, value, ratio - 1))
+    return regressions
+
+def benchmark_suite(numbers, case_names, output=None, baseline=None, threshold=0.2, save_baseline=False, num_repeats=3, timeout=None):
+    results = run_suite(numbers, case_names, num_repeats, timeout)
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=1)
+    regressions = []
+    if baseline is not None:
+        if save_baseline or not os.path.exists(baseline):
+            with open(baseline, 'w') as f:
+                json.dump(results, f, indent=1)
+            print("baseline written to", baseline)
+        else:
+            with open(baseline, 'r') as f:
+                regressions = compare_results(results, json.load(f), threshold)
+            print("{} regressions above {:.0%}".format(len(regressions), threshold))
+    failures = get_failures(results)
+    if failures:
+        print("{} failed cases: {}".format(len(failures), failures))
+    return results, regressions, failures
+
+def get_scaling_exponent(sizes, values):
+    # Slope of log(value) over log(size), 1 means linear growth
+    sizes, values = np.asarray(sizes, dtype=float), np.asarray(values, dtype=float)
+    mask = (sizes > 0) & (values > 0)
+    if mask.sum() < 2 or np.ptp(np.log(sizes[mask])) == 0:
+        return None
+    return np.polyfit(np.log(sizes[mask]), np.log(values[mask]), 1)[0]
+
+def benchmark_scaling(profile, scales, case_names, directory="data/generated", seed=0, output=None, num_repeats=3, timeout=None):
+    # Generated instances of growing size run through the suite cases, results[path] is laid out like run_suite
+    # with the generation itself as the "generate" case
+    os.makedirs(directory, exist_ok=True)
+    results = dict()
+    for scale in scales:
+        path = os.path.join(directory, "{}_x{:g}_s{}.txt".format(profile, scale, seed))
+        run = run_isolated(generate, path, profile, scale, seed, timeout=timeout)
+        if run is None:
+            continue
+        seconds, peak_rss_mb, metrics = run
+        print("{:40s} {:14s} {:8.3f}s {:8.1f}MB pairs {} size {:.1f}MB".format(path, "generate", seconds, peak_rss_mb, metrics["num_pairs"], metrics["size_mb"]))
+        results.update(run_suite([path], case_names, num_repeats, timeout))
+        results[path]["generate"] = dict(metrics, seconds=seconds, peak_rss_mb=peak_rss_mb)
+    print("growth exponents over (library, book) pairs, 1 is linear")
+    for name in ["generate"] + list(case_names):
+        # Failed runs are left out of the fit
+        paths_generated = [path for path in results if "error" not in results[path][name]]
+        num_pairs = [results[path]["generate"]["num_pairs"] for path in paths_generated]
+        exponents = [get_scaling_exponent(num_pairs, [results[path][name][metric] for path in paths_generated]) for metric in ["seconds", "peak_rss_mb"]]
+        print("{:14s} time {:>6s} memory {:>6s}".format(name, *["-" if e is None else "{:.2f}".format(e) for e in exponents]))
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=1)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_load = subparsers.add_parser("load")
+    parser_load.add_argument("numbers", type=int, nargs="*", default=list(range(length_paths)))
+    parser_energy_approx = subparsers.add_parser("energy_approx")
+    parser_energy_approx.add_argument("--number", type=int, default=4)
+    parser_energy_approx.add_argument("--num_evals", type=int, default=10)
+    parser_submission = subparsers.add_parser("submission")
+    parser_submission.add_argument("numbers", type=int, nargs="*", default=list(range(length_paths)))
+    parser_suite = subparsers.add_parser("suite")
+    parser_suite.add_argument("numbers", type=int, nargs="*", default=list(range(length_paths)))
+    parser_suite.add_argument("--cases", type=str, nargs="*", default=list(cases), choices=list(cases))
+    parser_suite.add_argument("--output", type=str, default=None)
+    parser_suite.add_argument("--baseline", type=str, default=None)
+    parser_suite.add_argument("--threshold", type=float, default=0.2)
+    parser_suite.add_argument("--save_baseline", action="store_true")
+    parser_suite.add_argument("--repeats", type=int, default=3)
+    parser_suite.add_argument("--timeout", type=float, default=None)
+    parser_scaling = subparsers.add_parser("scaling")
+    parser_scaling.add_argument("--profile", type=str, default="uniform", choices=list(profiles))
+    parser_scaling.add_argument("--scales", type=float, nargs="*", default=[1, 2, 5, 10])
+    parser_scaling.add_argument("--cases", type=str, nargs="*", default=list(cases), choices=list(cases))
+    parser_scaling.add_argument("--directory", type=str, default="data/generated")
+    parser_scaling.add_argument("--seed", type=int, default=0)
+    parser_scaling.add_argument("--output", type=str, default=None)
+    parser_scaling.add_argument("--repeats", type=int, default=3)
+    parser_scaling.add_argument("--timeout", type=float, default=None)
+    args = parser.parse_args()
+    if args.command == "load":
+        benchmark_load(args.numbers)
+    elif args.command == "energy_approx":
+        benchmark_energy_approx(args.number, args.num_evals)
+    elif args.command == "submission":
+        benchmark_submission(args.numbers)
+    elif args.command == "suite":
+        results, regressions, failures = benchmark_suite(args.numbers, args.cases, args.output, args.baseline, args.threshold, args.save_baseline, args.repeats, args.timeout)
+        sys.exit(1 if regressions or failures else 0)
+    elif args.command == "scaling":
+        benchmark_scaling(args.profile, args.scales, args.cases, args.directory, args.seed, args.output, args.repeats, args.timeout)
@@ -0,0 +1,152 @@
+import argparse
+import numpy as np
+from time import time
+from simulation import Simulation_Base, paths
+from mip_matrix import MIP_matrix_solver
+from instrumentation import recorder
+
+
+def get_lib_points_max(simulation, ind_libs):
+    # Points of the best books every library can ship when it signs up first
+    num_books_max = np.maximum(simulation.num_days - simulation.lib_days[ind_libs], 0) * simulation.lib_ships[ind_libs]
+    starts = simulation.lib_books_indptr[ind_libs]
+    counts = np.minimum(simulation.lib_books_indptr[ind_libs + 1] - starts, num_books_max)
+    points_cum = np.concatenate([[0], np.cumsum(simulation.book_points[simulation.lib_books_indices])])
+    return points_cum[starts + counts] - points_cum[starts]
+
+def get_knapsack_bound(profits, weights, capacity, max_cells=5*10**7):
+    # Exact 0/1 knapsack by dynamic programming over the capacity when the table is small enough,
+    # the fractional (Dantzig) bound otherwise
+    if len(profits) * (capacity + 1) <= max_cells:
+        table = np.zeros(capacity + 1)
+        for profit, weight in zip(profits.tolist(), weights.tolist()):
+            if weight <= capacity:
+                np.maximum(table[weight:], table[:capacity+1-weight] + profit, out=table[weight:])
+        return table[-1]
+    order = np.argsort(-profits / weights, kind='stable')
+    weights_cum = np.cumsum(weights[order])
+    num_full = int(np.searchsorted(weights_cum, capacity, side='right'))
+    bound = profits[order[:num_full]].sum()
+    if num_full < len(order):
+        capacity_left = capacity - (weights_cum[num_full-1] if num_full else 0)
+        bound += profits[order[num_full]] * capacity_left / weights[order[num_full]]
+    return bound
+
+
+def get_schedule_bound(simulation, ind_libs, days_available, max_cells=5*10**7):
+    # A library that finishes its signup on day t ships at most rate * (num_days - t) points, rate being its best
+    # books of one day. For these linear profits Smith's rule (rate / signup days, descending) orders any chosen
+    # set optimally, so a dynamic program over the finishing day in that order gives the exact maximum.
+    if len(ind_libs) * (days_available + 1) > max_cells:
+        return None
+    starts = simulation.lib_books_indptr[ind_libs]
+    counts = np.minimum(simulation.lib_books_indptr[ind_libs + 1] - starts, simulation.lib_ships[ind_libs])
+    points_cum = np.concatenate([[0], np.cumsum(simulation.book_points[simulation.lib_books_indices])])
+    rates = (points_cum[starts + counts] - points_cum[starts]).astype(float)
+    days = simulation.lib_days[ind_libs]
+    days_remaining = simulation.num_days - np.arange(days_available + 1)
+    table = np.full(days_available + 1, -np.inf)
+    table[0] = 0
+    for lib in np.argsort(-rates / days, kind='stable').tolist():
+        d = int(days[lib])
+        if d <= days_available:
+            np.maximum(table[d:], table[:days_available+1-d] + rates[lib] * days_remaining[d:], out=table[d:])
+    return table.max()
+
+
+class Upper_Bound():
+    # Upper bounds on the score of any solution, the smallest one counts:
+    #   books: points of all books that some library holds
+    #   knapsack: libraries as items with their signup days as weight and their best possible points as profit,
+    #     book overlaps and the signup order are ignored
+    #   schedule: libraries ship their best day of books every day, book overlaps are ignored
+    #   lp: LP relaxation of get_best_libs_unlimited_ships, shipping capacities are ignored
+    # Only libraries that ship at least one book count, so their signup days sum up to at most num_days - 1.
+    def __init__(self, simulation, lp=True, knapsack=True, schedule=True, time_limit=60):
+        self.simulation = simulation
+        self.bounds = dict()
+        self.times = dict()
+        self.ind_libs = np.flatnonzero(simulation.lib_days < simulation.num_days)
+        self.days_available = simulation.num_days - 1
+        t0 = time()
+        book_reachable = np.zeros(simulation.num_books, dtype=bool)
+        book_reachable[simulation.lib_books_indices] = True
+        self.bounds["books"] = int(simulation.book_points[book_reachable].sum())
+        self.times["books"] = time() - t0
+        if knapsack:
+            t0 = time()
+            profits = get_lib_points_max(simulation, self.ind_libs).astype(float)
+            self.bounds["knapsack"] = int(np.floor(get_knapsack_bound(profits, simulation.lib_days[self.ind_libs], self.days_available) + 1e-6))
+            self.times["knapsack"] = time() - t0
+        if schedule:
+            t0 = time()
+            bound = get_schedule_bound(simulation, self.ind_libs, self.days_available)
+            if bound is not None:
+                self.bounds["schedule"] = int(np.floor(bound + 1e-6))
+            self.times["schedule"] = time() - t0
+        # The LP is the expensive one, time_limit keeps it from stalling a pipeline on large instances like D
+        if lp:
+            t0 = time()
+            bound = self.get_lp_bound(time_limit)
+            if bound is not None:
+                self.bounds["lp"] = bound
+            self.times["lp"] = time() - t0
+        self.upper_bound = min(self.bounds.values())
+        for name, value in self.bounds.items():
+            recorder.set("bounds." + name, value)
+            recorder.add_time("bounds." + name, self.times[name])
+
+    def get_lp_bound(self, time_limit=None):
+        mip = MIP_matrix_solver(self.simulation, time_limit=time_limit)
+        builder, libs = mip.get_best_libs_model(self.ind_libs, self.days_available)
+        builder.relax()
+        solver_result = mip.solve(builder)
+        # An LP stopped by the time limit gives no valid bound
+        if solver_result.status != 0 or solver_result.fun is None:
+            return None
+        return int(np.floor(-solver_result.fun + 1e-6))
+
+    def get_gap(self, score):
+        return (self.upper_bound - score) / max(self.upper_bound, 1)
+
+
+class Gap_Monitor():
+    # Tracks the gap of the scores a solver loop reports, should_stop turns True once it is below threshold
+    def __init__(self, bound, threshold=0, silent=False):
+        self.bound = bound
+        self.threshold = threshold
+        self.silent = silent
+        self.t0 = time()
+        self.score_best = 0
+        self.gap = 1
+
+    def update(self, score):
+        if score > self.score_best:
+            self.score_best = score
+            self.gap = self.bound.get_gap(score)
+            recorder.append("bounds.gap", (time() - self.t0, int(score), float(self.gap)))
+            if not self.silent:
+                print("score {:10d} upper bound {:10d} gap {:.4%}".format(int(score), int(self.bound.upper_bound), self.gap))
+        return self.gap
+
+    def should_stop(self, score=None):
+        if score is not None:
+            self.update(score)
+        return self.gap <= self.threshold
+
+
+if __name__ == "__main__":
+    from greedy import get_greedy_ordering
+    from flow_solver import Flow_solver
+    from lns import get_num_active
+    parser = argparse.ArgumentParser()
+    parser.add_argument("numbers", type=int, nargs="*", default=[0, 1, 2, 3, 4, 5])
+    parser.add_argument("--no_lp", action="store_true")
+    args = parser.parse_args()
+    for number in args.numbers:
+        sim = Simulation_Base(number, silent=True)
+        bound = Upper_Bound(sim, lp=not args.no_lp)
+        ind_libs = get_greedy_ordering(sim)
+        score = -Flow_solver(sim).get_energy(ind_libs[:get_num_active(sim, ind_libs)])
+        times = " ".join("{} {:.2f}s".format(name, seconds) for name, seconds in bound.times.items())
+        print("{:40s} {} greedy {:10d} gap {:.4%} ({})".format(paths[number], bound.bounds, score, bound.get_gap(score), times))
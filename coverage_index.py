@@ -0,0 +1,203 @@
+import argparse
+import heapq
+import numpy as np
+from time import time
+from simulation import Simulation_Base, paths
+from instrumentation import recorder
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    # Older numpy, the bits of every byte from a table
+    byte_counts = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(words):
+        words = np.ascontiguousarray(words, dtype=np.uint64)
+        return byte_counts[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def pack(mask):
+    # Bool mask over books as uint64 words, bit i of word w is book 64 * w + i
+    num_words = (len(mask) + 63) // 64
+    padded = np.zeros(num_words * 64, dtype=bool)
+    padded[:len(mask)] = mask
+    return np.packbits(padded, bitorder='little').view(np.uint64)
+
+def unpack(words, num_books):
+    return np.unpackbits(words.view(np.uint8), bitorder='little')[:num_books].astype(bool)
+
+
+class Coverage_Index():
+    # Book sets of the libraries as blocked bitsets: every library keeps only its non-empty 64-bit words,
+    # as CSR rows of (word id, bits) sorted by word id.
+    def __init__(self, num_books, lib_books_indptr, lib_books_indices):
+        t0 = time()
+        self.num_books = num_books
+        self.num_libs = len(lib_books_indptr) - 1
+        self.num_words = (num_books + 63) // 64
+        self.lib_books_indptr = lib_books_indptr
+        self.lib_books_indices = lib_books_indices
+        self.lib_num_books = np.diff(lib_books_indptr)
+        pair_libs = np.repeat(np.arange(self.num_libs), self.lib_num_books)
+        # One key per (lib, word), the bits of all books falling into the same word are or-ed together
+        keys = pair_libs * self.num_words + lib_books_indices // 64
+        bits = np.left_shift(np.uint64(1), (lib_books_indices % 64).astype(np.uint64))
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.word_bits = np.zeros(len(self.keys), dtype=np.uint64)
+        np.bitwise_or.at(self.word_bits, inverse, bits)
+        self.word_ids = self.keys % self.num_words
+        self.word_libs = self.keys // self.num_words
+        self.lib_words_indptr = np.zeros(self.num_libs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.word_libs, minlength=self.num_libs), out=self.lib_words_indptr[1:])
+        self.time_build = time() - t0
+        recorder.add_time("coverage_index.build", self.time_build)
+
+    def get_lib_bits(self, lib):
+        lo, hi = self.lib_words_indptr[lib], self.lib_words_indptr[lib+1]
+        return self.word_ids[lo:hi], self.word_bits[lo:hi]
+
+    def get_word_rows(self, libs):
+        # Positions of the words of libs, grouped by library
+        libs = np.asarray(libs, dtype=np.int64)
+        starts, ends = self.lib_words_indptr[libs], self.lib_words_indptr[libs + 1]
+        counts = ends - starts
+        rows = np.repeat(np.arange(len(libs)), counts)
+        ind = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return rows, ind
+
+    def get_words(self, libs, word_ids):
+        # Bits of library libs[i] in word word_ids[i], 0 if the library has no book there
+        keys = np.asarray(libs, dtype=np.int64) * self.num_words + word_ids
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[pos] == keys, self.word_bits[pos], np.uint64(0))
+
+    def get_num_books_new(self, scanned, libs=None):
+        # Books of every library that are not set in the packed scanned mask
+        if libs is None:
+            new = popcount(self.word_bits & ~scanned[self.word_ids])
+            return np.bincount(self.word_libs, weights=new, minlength=self.num_libs).astype(np.int64)
+        rows, ind = self.get_word_rows(libs)
+        new = popcount(self.word_bits[ind] & ~scanned[self.word_ids[ind]])
+        return np.bincount(rows, weights=new, minlength=len(libs)).astype(np.int64)
+
+    def get_num_books_in(self, mask, libs=None):
+        # Books of every library inside a bool or packed book mask
+        if mask.dtype == bool:
+            mask = pack(mask)
+        return self.get_num_books_new(~mask, libs)
+
+    def get_points_new(self, scanned, book_points, libs=None):
+        # Points of the books of every library whose bit is not set in the packed scanned mask
+        if libs is None:
+            libs = np.arange(self.num_libs)
+        libs = np.asarray(libs, dtype=np.int64)
+        starts, ends = self.lib_books_indptr[libs], self.lib_books_indptr[libs + 1]
+        counts = ends - starts
+        books = self.lib_books_indices[np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        is_new = (scanned[books // 64] >> (books % 64).astype(np.uint64)) & np.uint64(1) == 0
+        return np.bincount(np.repeat(np.arange(len(libs)), counts), weights=np.where(is_new, book_points[books], 0), minlength=len(libs))
+
+    def get_union(self, libs):
+        # Packed mask of all books of libs
+        union = np.zeros(self.num_words, dtype=np.uint64)
+        rows, ind = self.get_word_rows(libs)
+        np.bitwise_or.at(union, self.word_ids[ind], self.word_bits[ind])
+        return union
+
+    def get_coverage(self, libs, book_points=None):
+        # Number of distinct books of libs, or their points
+        union = self.get_union(libs)
+        if book_points is None:
+            return int(popcount(union).sum())
+        return int(book_points[unpack(union, self.num_books)].sum())
+
+    def get_overlap(self, libs_a, libs_b=None, chunk_size=2**22):
+        # Matrix of shared books between libs_a and libs_b. Words of both sides are joined on their word id, so
+        # only words that both libraries have are compared, in chunks of at most about chunk_size word pairs.
+        libs_a = np.asarray(libs_a, dtype=np.int64)
+        libs_b = libs_a if libs_b is None else np.asarray(libs_b, dtype=np.int64)
+        rows_a, ind_a = self.get_word_rows(libs_a)
+        rows_b, ind_b = self.get_word_rows(libs_b)
+        order = np.argsort(self.word_ids[ind_b], kind='stable')
+        rows_b, ind_b = rows_b[order], ind_b[order]
+        word_ids_b = self.word_ids[ind_b]
+        lo = np.searchsorted(word_ids_b, self.word_ids[ind_a], side='left')
+        counts = np.searchsorted(word_ids_b, self.word_ids[ind_a], side='right') - lo
+        overlap = np.zeros(len(libs_a) * len(libs_b), dtype=np.int64)
+        counts_cum = np.cumsum(counts)
+        start = 0
+        while start < len(ind_a):
+            end = max(int(np.searchsorted(counts_cum, (counts_cum[start-1] if start else 0) + chunk_size, side='right')), start + 1)
+            chunk_counts = counts[start:end]
+            pairs_a = np.repeat(np.arange(start, end), chunk_counts)
+            pairs_b = np.repeat(lo[start:end] - np.cumsum(chunk_counts) + chunk_counts, chunk_counts) + np.arange(chunk_counts.sum())
+            shared = popcount(self.word_bits[ind_a[pairs_a]] & self.word_bits[ind_b[pairs_b]])
+            overlap += np.bincount(rows_a[pairs_a] * len(libs_b) + rows_b[pairs_b], weights=shared, minlength=len(overlap)).astype(np.int64)
+            start = end
+        return overlap.reshape(len(libs_a), len(libs_b))
+
+    def is_subset(self, libs_a, libs_b):
+        # For every pair i, True if all books of libs_a[i] are held by libs_b[i]
+        libs_a = np.asarray(libs_a, dtype=np.int64)
+        libs_b = np.asarray(libs_b, dtype=np.int64)
+        rows, ind = self.get_word_rows(libs_a)
+        missing = self.word_bits[ind] & ~self.get_words(libs_b[rows], self.word_ids[ind])
+        return np.bincount(rows, weights=missing != 0, minlength=len(libs_a)) == 0
+
+
+def get_coverage_index(simulation):
+    return Coverage_Index(simulation.num_books, simulation.lib_books_indptr, simulation.lib_books_indices)
+
+def get_best_libs_greedy(simulation, ind_libs_available, days_available, index=None):
+    # Heuristic for get_best_libs_unlimited_ships: picks libraries by new points per signup day while they fit.
+    # New points only shrink as books get covered, so stale heap entries are upper bounds and only the popped
+    # library is rescored.
+    if index is None:
+        index = get_coverage_index(simulation)
+    ind_libs_available = np.asarray(ind_libs_available, dtype=np.int64)
+    lib_days = simulation.lib_days
+    scanned = np.zeros(index.num_words, dtype=np.uint64)
+    points = index.get_points_new(scanned, simulation.book_points, ind_libs_available)
+    heap = [(-p / lib_days[lib], lib) for lib, p in zip(ind_libs_available.tolist(), points.tolist()) if p > 0]
+    heapq.heapify(heap)
+    ind_libs_best = []
+    days_used = 0
+    while heap:
+        neg_ratio, lib = heapq.heappop(heap)
+        if days_used + lib_days[lib] > days_available:
+            continue
+        ratio = index.get_points_new(scanned, simulation.book_points, [lib])[0] / lib_days[lib]
+        if heap and ratio < -heap[0][0]:
+            if ratio > 0:
+                heapq.heappush(heap, (-ratio, lib))
+            continue
+        if ratio <= 0:
+            continue
+        ind_libs_best.append(lib)
+        days_used += lib_days[lib]
+        word_ids, bits = index.get_lib_bits(lib)
+        scanned[word_ids] |= bits
+    return ind_libs_best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("numbers", type=int, nargs="*", default=[1, 2, 3, 4, 5])
+    args = parser.parse_args()
+    for number in args.numbers:
+        sim = Simulation_Base(number, silent=True)
+        index = get_coverage_index(sim)
+        scanned = np.zeros(index.num_words, dtype=np.uint64)
+        t0 = time()
+        index.get_num_books_new(scanned)
+        time_marginal = time() - t0
+        libs = np.arange(min(sim.num_libs, 200))
+        t0 = time()
+        index.get_overlap(libs)
+        time_overlap = time() - t0
+        t0 = time()
+        ind_libs = get_best_libs_greedy(sim, np.flatnonzero(sim.lib_days < sim.num_days), sim.num_days - 1, index)
+        time_greedy = time() - t0
+        print("{:40s} words {:8d} build {:.3f}s marginal {:.4f}s overlap {}x{} {:.3f}s greedy libs {:6d} points {:10d} {:.3f}s".format(
+            paths[number], len(index.word_bits), index.time_build, time_marginal, len(libs), len(libs), time_overlap,
+            len(ind_libs), index.get_coverage(ind_libs, sim.book_points), time_greedy))
@@ -0,0 +1,181 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def get_lib_books_points_cum(simulation, exponent_book_points=1):
+    # Entry [lib, k] holds the (transformed) points of the k best books of lib
+    num_libs = simulation.num_libs
+    lib_num_books = np.diff(simulation.lib_books_indptr)
+    max_num_books = lib_num_books.max()
+    rows = np.repeat(np.arange(num_libs), lib_num_books)
+    cols = 1 + np.arange(len(simulation.lib_books_indices)) - np.repeat(simulation.lib_books_indptr[:-1], lib_num_books)
+    lib_books_points = np.zeros((num_libs, max_num_books + 1))
+    lib_books_points[rows, cols] = simulation.book_points[simulation.lib_books_indices] ** exponent_book_points
+    return np.cumsum(lib_books_points, axis=1)
+
+
+class Ordering_Energy():
+    def __init__(self, num_days, lib_days, lib_ships, lib_books_points_cum, ind_libs):
+        self.num_days = num_days
+        self.lib_days = lib_days
+        self.lib_ships = lib_ships
+        self.lib_books_points_cum = lib_books_points_cum
+        self.max_num_books = lib_books_points_cum.shape[1] - 1
+        self.reset(ind_libs)
+
+    def get_points(self, ind_libs, days_used):
+        # np.minimum/np.maximum instead of np.clip, it has far less call overhead on small windows
+        books_remaining = np.minimum(np.maximum((self.num_days - days_used) * self.lib_ships[ind_libs], 0), self.max_num_books)
+        return self.lib_books_points_cum[ind_libs, books_remaining]
+
+    def get_energy(self, ind_libs):
+        return - self.get_points(ind_libs, np.cumsum(self.lib_days[ind_libs])).sum()
+
+    def get_energies(self, orderings):
+        # One row per ordering, all of them with a single 2-D cumsum and gather
+        days_used = np.cumsum(self.lib_days[orderings], axis=1)
+        points = self.get_points(orderings, days_used)
+        return - points.sum(axis=1), days_used, points
+
+    def reset(self, ind_libs):
+        self.ind_libs = np.array(ind_libs)
+        self.days_used = np.cumsum(self.lib_days[self.ind_libs])
+        self.points = self.get_points(self.ind_libs, self.days_used)
+        self.energy = - self.points.sum()
+        self.pending = None
+
+    def propose(self, lo, window):
+        # Energy of the ordering with ind_libs[lo:lo+len(window)] replaced by window
+        hi = lo + len(window)
+        days_before = self.days_used[lo-1] if lo else 0
+        if days_before >= self.num_days:
+            # Every library from lo on signs up too late to ship anything, before and after the move
+            self.pending = (lo, hi, window, None, None, None, None)
+            return self.energy
+        days_used = days_before + np.add.accumulate(self.lib_days[window])
+        points = self.get_points(window, days_used)
+        delta = self.points[lo:hi].sum() - points.sum()
+        days_used_tail = None
+        points_tail = None
+        tail_shift = days_used[-1] - self.days_used[hi-1]
+        if tail_shift != 0:
+            days_used_tail = self.days_used[hi:] + tail_shift
+            points_tail = self.get_points(self.ind_libs[hi:], days_used_tail)
+            delta += self.points[hi:].sum() - points_tail.sum()
+        self.pending = (lo, hi, window, days_used, points, days_used_tail, points_tail)
+        return self.energy + delta
+
+    def propose_swap(self, lo, hi):
+        window = self.ind_libs[lo:hi+1].copy()
+        window[0] = self.ind_libs[hi]
+        window[-1] = self.ind_libs[lo]
+        return self.propose(lo, window)
+
+    def propose_shift(self, lo, hi, forward=True):
+        # Moves ind_libs[lo] behind ind_libs[hi-1] (forward) or ind_libs[hi-1] in front of ind_libs[lo]
+        if forward:
+            window = np.concatenate([self.ind_libs[lo+1:hi], self.ind_libs[lo:lo+1]])
+        else:
+            window = np.concatenate([self.ind_libs[hi-1:hi], self.ind_libs[lo:hi-1]])
+        return self.propose(lo, window)
+
+    def propose_orderings(self, orderings):
+        energies, days_used, points = self.get_energies(orderings)
+        self.pending_orderings = (orderings, energies, days_used, points)
+        return energies
+
+    def accept_ordering(self, k):
+        orderings, energies, days_used, points = self.pending_orderings
+        self.ind_libs = orderings[k].copy()
+        self.days_used = days_used[k].copy()
+        self.points = points[k].copy()
+        self.energy = energies[k]
+        self.pending_orderings = None
+
+    def accept(self):
+        lo, hi, window, days_used, points, days_used_tail, points_tail = self.pending
+        if days_used is None:
+            # Libraries past the deadline score nothing, but their signup days still have to stay consistent
+            days_before = self.days_used[lo-1] if lo else 0
+            days_used = days_before + np.cumsum(self.lib_days[window])
+            self.days_used[hi:] += days_used[-1] - self.days_used[hi-1]
+            points = self.points[lo:hi]
+        self.energy += self.points[lo:hi].sum() - points.sum()
+        self.ind_libs[lo:hi] = window
+        self.days_used[lo:hi] = days_used
+        self.points[lo:hi] = points
+        if days_used_tail is not None:
+            self.energy += self.points[hi:].sum() - points_tail.sum()
+            self.days_used[hi:] = days_used_tail
+            self.points[hi:] = points_tail
+        self.pending = None
+
+
+def get_points_approx(ind_book_sorted, book_points, book_libs_indptr, book_libs_indices, lib_ind_libs, ind_lib_books_ship_remaining, ind_lib_books_inventory_remaining, ind_lib_ratio):
+    # Every book goes to the library with the highest ratio of remaining ships to remaining inventory
+    points_total = 0
+    for book in ind_book_sorted:
+        ind_lib_best = -1
+        for k in range(book_libs_indptr[book], book_libs_indptr[book+1]):
+            ind_lib = lib_ind_libs[book_libs_indices[k]]
+            # Same tie and nan handling as np.argmax: first maximum wins, a nan counts as maximum
+            if ind_lib_best < 0 or ind_lib_ratio[ind_lib] > ind_lib_ratio[ind_lib_best] or (ind_lib_ratio[ind_lib] != ind_lib_ratio[ind_lib] and ind_lib_ratio[ind_lib_best] == ind_lib_ratio[ind_lib_best]):
+                ind_lib_best = ind_lib
+        if ind_lib_books_ship_remaining[ind_lib_best] > 0:
+            points_total += book_points[book]
+            ind_lib_books_ship_remaining[ind_lib_best] -= 1
+            ind_lib_books_inventory_remaining[ind_lib_best] -= 1
+            if ind_lib_books_inventory_remaining[ind_lib_best] > 0:
+                ind_lib_ratio[ind_lib_best] = ind_lib_books_ship_remaining[ind_lib_best] / ind_lib_books_inventory_remaining[ind_lib_best]
+            else:
+                ind_lib_ratio[ind_lib_best] = np.inf if ind_lib_books_ship_remaining[ind_lib_best] > 0 else np.nan
+    return points_total
+
+if njit is not None:
+    get_points_approx_compiled = njit(cache=True)(get_points_approx)
+
+
+class Approx_Energy():
+    # Compiled version of Simulation_E.get_energy_approx on CSR arrays, giving the same scores
+    def __init__(self, simulation, ind_libs_available):
+        self.num_days = simulation.num_days
+        self.num_libs = simulation.num_libs
+        self.book_points = np.asarray(simulation.book_points)
+        self.lib_days = simulation.lib_days
+        self.lib_ships = simulation.lib_ships
+        self.lib_num_books = simulation.lib_num_books
+
+        lib_available = np.zeros(simulation.num_libs, dtype=bool)
+        lib_available[ind_libs_available] = True
+        mask = lib_available[simulation.book_libs_indices]
+        self.book_libs_indices = simulation.book_libs_indices[mask]
+        self.book_libs_indptr = np.zeros(simulation.num_books + 1, dtype=np.int64)
+        book_ids = np.repeat(np.arange(simulation.num_books), np.diff(simulation.book_libs_indptr))
+        np.cumsum(np.bincount(book_ids[mask], minlength=simulation.num_books), out=self.book_libs_indptr[1:])
+
+        book_num_libs_available = np.diff(self.book_libs_indptr)
+        ind_book_available = np.where(book_num_libs_available > 0)[0]
+        book_importance = self.book_points[ind_book_available]
+        self.ind_book_sorted = ind_book_available[np.argsort(-book_importance)]
+
+        if njit is not None:
+            self.get_points = get_points_approx_compiled
+        else:
+            self.get_points = self.get_points_lists
+
+    def get_points_lists(self, ind_book_sorted, book_points, book_libs_indptr, book_libs_indices, *args):
+        # Without numba the loop runs faster on Python lists than on numpy scalars
+        return get_points_approx(ind_book_sorted.tolist(), book_points.tolist(), book_libs_indptr.tolist(), book_libs_indices.tolist(), *[arg.tolist() for arg in args])
+
+    def get_energy(self, ind_libs):
+        days_remaining = self.num_days - np.cumsum(self.lib_days[ind_libs])
+        ind_lib_books_ship_remaining = np.clip(days_remaining * self.lib_ships[ind_libs], 0, None)
+        ind_lib_books_inventory_remaining = np.array(self.lib_num_books[ind_libs])
+        lib_ind_libs = np.zeros(self.num_libs, dtype=np.int64)
+        lib_ind_libs[ind_libs] = np.arange(len(ind_libs))
+        ind_lib_ratio = ind_lib_books_ship_remaining / ind_lib_books_inventory_remaining
+        return - self.get_points(self.ind_book_sorted, self.book_points, self.book_libs_indptr, self.book_libs_indices, lib_ind_libs, ind_lib_books_ship_remaining, ind_lib_books_inventory_remaining, ind_lib_ratio)
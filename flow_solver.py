@@ -0,0 +1,154 @@
+import argparse
+import numpy as np
+from collections import deque
+from time import time
+from simulation import Simulation_Base, paths
+from instrumentation import recorder
+
+
+class Flow_solver():
+    # Exact book assignment for a fixed library order without an external solver.
+    # The book sets that fit into the library capacities form a transversal matroid, so taking books
+    # by decreasing points and keeping every book for which an augmenting path exists is optimal.
+    def __init__(self, simulation):
+        self.number = simulation.number
+        self.silent = simulation.silent
+        self.num_books = simulation.num_books
+        self.num_libs = simulation.num_libs
+        self.num_days = simulation.num_days
+        self.book_points = simulation.book_points
+        self.lib_days = simulation.lib_days
+        self.lib_ships = simulation.lib_ships
+        self.lib_books_indptr = simulation.lib_books_indptr
+        self.lib_books_indices = simulation.lib_books_indices
+        self.book_libs_indptr = simulation.book_libs_indptr
+        self.book_libs_indices = simulation.book_libs_indices
+        self.time_solve = 0
+
+    def get_book_libs_available(self, ind_libs, book_points_available):
+        # Book -> positions in ind_libs, only for books with points in one of the libraries
+        lib_pos = np.full(self.num_libs, -1, dtype=np.int64)
+        lib_pos[ind_libs] = np.arange(len(ind_libs))
+        pair_pos = lib_pos[self.book_libs_indices]
+        pair_books = np.repeat(np.arange(self.num_books), np.diff(self.book_libs_indptr))
+        mask = (pair_pos >= 0) & (book_points_available[pair_books] != 0)
+        pair_pos, pair_books = pair_pos[mask], pair_books[mask]
+        ind_books = np.unique(pair_books)
+        ind_books = ind_books[np.argsort(-book_points_available[ind_books], kind='stable')]
+        book_libs = dict()
+        for book, pos in zip(pair_books.tolist(), pair_pos.tolist()):
+            book_libs.setdefault(book, []).append(pos)
+        return ind_books.tolist(), book_libs
+
+    def find_augmenting_path(self, book, book_libs, lib_movable, lib_load, lib_capacity, dead):
+        parent = dict()
+        queue = deque()
+        for pos in book_libs[book]:
+            if not dead[pos] and pos not in parent:
+                parent[pos] = (book, -1)
+                queue.append(pos)
+        while queue:
+            pos = queue.popleft()
+            for moved in lib_movable[pos]:
+                for next_pos in book_libs[moved]:
+                    if dead[next_pos] or next_pos in parent:
+                        continue
+                    parent[next_pos] = (moved, pos)
+                    if lib_load[next_pos] < lib_capacity[next_pos]:
+                        return next_pos, parent
+                    queue.append(next_pos)
+        # Everything reached is full and only reaches itself, no later book can get through these libraries either
+        for pos in parent:
+            dead[pos] = True
+        return -1, parent
+
+    def assign(self, book, pos, book_libs, lib_movable, lib_books):
+        lib_books[pos].add(book)
+        if len(book_libs[book]) > 1:
+            lib_movable[pos].add(book)
+
+    def unassign(self, book, pos, lib_movable, lib_books):
+        lib_books[pos].discard(book)
+        lib_movable[pos].discard(book)
+
+    def get_optimal_books_for_ordered_libs(self, ind_libs_best, days_available=None, book_points_available=None, solverName=None):
+        t0 = time()
+        if days_available is None:
+            days_available = self.num_days
+        if book_points_available is None:
+            book_points_available = self.book_points
+        ind_libs_best = np.asarray(ind_libs_best, dtype=np.int64)
+        days_remaining = days_available - np.cumsum(self.lib_days[ind_libs_best])
+        lib_capacity = np.maximum(days_remaining * self.lib_ships[ind_libs_best], 0).tolist()
+        ind_books, book_libs = self.get_book_libs_available(ind_libs_best, book_points_available)
+
+        num_libs = len(ind_libs_best)
+        lib_load = [0] * num_libs
+        lib_books = [set() for _ in range(num_libs)]
+        lib_movable = [set() for _ in range(num_libs)]
+        dead = [capacity == 0 for capacity in lib_capacity]
+        for book in ind_books:
+            free_pos = -1
+            for pos in book_libs[book]:
+                if not dead[pos] and lib_load[pos] < lib_capacity[pos]:
+                    free_pos = pos
+                    break
+            if free_pos >= 0:
+                self.assign(book, free_pos, book_libs, lib_movable, lib_books)
+                lib_load[free_pos] += 1
+                continue
+            free_pos, parent = self.find_augmenting_path(book, book_libs, lib_movable, lib_load, lib_capacity, dead)
+            if free_pos < 0:
+                continue
+            # Shift every book on the path one library further, the first library takes the new book
+            lib_load[free_pos] += 1
+            pos = free_pos
+            while True:
+                moved, prev_pos = parent[pos]
+                if prev_pos >= 0:
+                    self.unassign(moved, prev_pos, lib_movable, lib_books)
+                self.assign(moved, pos, book_libs, lib_movable, lib_books)
+                if prev_pos < 0:
+                    break
+                pos = prev_pos
+
+        self.time_solve = time() - t0
+        recorder.add_time("flow.solve", self.time_solve)
+        result = []
+        for pos, lib in enumerate(ind_libs_best):
+            books = sorted(lib_books[pos], key=lambda book: -book_points_available[book])
+            result.append((lib, books))
+        return result
+
+    def get_energy(self, ind_libs):
+        # Exact score of an ordering, usable with annealing.Full_Energy
+        result = self.get_optimal_books_for_ordered_libs(ind_libs)
+        return - sum(int(self.book_points[books].sum()) for lib, books in result if len(books))
+
+
+def get_test_ordering(simulation):
+    # Libraries with the shortest signup first, as many as fit into the available days
+    ind_libs = np.argsort(simulation.lib_days, kind='stable')
+    days_used = np.cumsum(simulation.lib_days[ind_libs])
+    return ind_libs[days_used < simulation.num_days]
+
+def cross_check(numbers, time_limit=600):
+    from mip_matrix import MIP_matrix_solver
+    for number in numbers:
+        sim = Simulation_Base(number, silent=True)
+        ind_libs = get_test_ordering(sim)
+        flow = Flow_solver(sim)
+        sim.solution = flow.get_optimal_books_for_ordered_libs(ind_libs)
+        score_flow, valid_flow = sim.get_score(), sim.check_solution()
+        mip = MIP_matrix_solver(sim, time_limit=time_limit)
+        sim.solution = mip.get_optimal_books_for_ordered_libs(ind_libs)
+        score_mip = sim.get_score()
+        print("{:40s} libs {:6d} flow {:10d} ({:7.3f}s, valid {}) mip {:10d} ({:7.3f}s)".format(paths[number], len(ind_libs), score_flow, flow.time_solve, valid_flow, score_mip, mip.time_build + mip.time_solve))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("numbers", type=int, nargs="*", default=[1, 2, 3, 4, 5])
+    parser.add_argument("--time_limit", type=float, default=600)
+    args = parser.parse_args()
+    cross_check(args.numbers, args.time_limit)
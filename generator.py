@@ -0,0 +1,188 @@
+import argparse
+import os
+import tempfile
+import numpy as np
+from time import time
+from simulation import format_ints
+
+# Base sizes follow the datasets they are modelled on, scale multiplies books and libraries (and days if scale_days)
+profiles = {
+    # Like C: small libraries, books drawn uniformly
+    "uniform": dict(num_books=100000, num_libs=10000, num_days=100000, points=(1, 600), lib_size=("uniform", 10, 20),
+                    lib_days=(10, 1000), lib_ships=(1, 100000), popularity=0, scale_days=False),
+    # Like D: every book in 2 to 3 libraries, equal points, two days signup and one book per day for every library
+    "tough": dict(num_books=78600, num_libs=30000, num_days=30001, points=(65, 65), book_degree=(2, 3),
+                  lib_days=(2, 2), lib_ships=(1, 1), scale_days=True),
+    # Like E, with a long tail: lognormal library sizes and Zipf distributed book popularity
+    "long_tail": dict(num_books=100000, num_libs=1000, num_days=200, points=(1, 250), lib_size=("lognormal", 300, 1.0),
+                      lib_days=(1, 10), lib_ships=(1, 2), popularity=1.0, scale_days=False),
+}
+
+# Libraries are generated and written in blocks of at most about this many (library, book) pairs, every block
+# has its own seed so the file only depends on the parameters and the seed
+pairs_per_block = 2**18
+
+
+class Instance_Generator():
+    # Random instance in the input format, written library block by library block. Memory grows with the
+    # number of books and libraries, not with the number of (library, book) pairs.
+    #   lib_size: ("uniform", lo, hi) or ("lognormal", median, sigma), books per library before duplicates are dropped
+    #   popularity: Zipf exponent of the books drawn by the libraries, 0 draws all books equally often
+    #   book_degree: (lo, hi) libraries per book instead of lib_size / popularity, like D. Every round partitions
+    #     a shuffled subset of the books among all libraries, so a book landing twice in one library loses a degree.
+    def __init__(self, num_books, num_libs, num_days, points=(1, 1000), lib_size=("uniform", 1, 100), lib_days=(1, 10),
+                 lib_ships=(1, 10), popularity=0, book_degree=None, seed=0):
+        if book_degree is not None and num_books < num_libs:
+            raise ValueError("book_degree needs at least as many books as libraries")
+        self.num_books = num_books
+        self.num_libs = num_libs
+        self.num_days = num_days
+        self.lib_size = lib_size
+        self.popularity = popularity
+        self.book_degree = book_degree
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        self.book_points = rng.randint(points[0], points[1] + 1, size=num_books)
+        self.lib_days = rng.randint(lib_days[0], lib_days[1] + 1, size=num_libs)
+        self.lib_ships = rng.randint(lib_ships[0], lib_ships[1] + 1, size=num_libs)
+        if book_degree is not None:
+            self.init_rounds(rng)
+        else:
+            self.lib_sizes = self.get_lib_sizes(rng)
+            if popularity > 0:
+                # Popularity follows the rank of a book, the ranks are shuffled over the book ids
+                weights = 1 / np.arange(1, num_books + 1) ** popularity
+                self.popularity_cum = np.cumsum(weights / weights.sum())
+                self.book_ranked = rng.permutation(num_books)
+
+    def get_lib_sizes(self, rng):
+        kind, a, b = self.lib_size
+        if kind == "uniform":
+            sizes = rng.randint(a, b + 1, size=self.num_libs)
+        elif kind == "lognormal":
+            sizes = np.round(a * np.exp(b * rng.randn(self.num_libs))).astype(np.int64)
+        else:
+            raise ValueError("unknown lib_size " + kind)
+        return np.clip(sizes, 1, self.num_books)
+
+    def init_rounds(self, rng):
+        # Round r holds the books with a degree above r, shuffled and cut into one block per library.
+        # The blocks of round 0 cover all books and are never empty, so no library stays empty.
+        degrees = rng.randint(self.book_degree[0], self.book_degree[1] + 1, size=self.num_books)
+        self.rounds = []
+        for r in range(self.book_degree[1]):
+            books = np.flatnonzero(degrees > r)
+            books = books[rng.permutation(len(books))].astype(np.int32)
+            weights = rng.uniform(0.5, 1.5, size=self.num_libs)
+            if r == 0:
+                sizes = 1 + rng.multinomial(len(books) - self.num_libs, weights / weights.sum())
+            else:
+                sizes = rng.multinomial(len(books), weights / weights.sum())
+            indptr = np.zeros(self.num_libs + 1, dtype=np.int64)
+            np.cumsum(sizes, out=indptr[1:])
+            self.rounds.append((books, indptr))
+
+    def get_lib_num_pairs(self):
+        if self.book_degree is not None:
+            return sum(np.diff(indptr) for books, indptr in self.rounds)
+        return self.lib_sizes
+
+    def get_blocks(self):
+        pairs_cum = np.concatenate([[0], np.cumsum(self.get_lib_num_pairs())])
+        blocks = []
+        lo = 0
+        while lo < self.num_libs:
+            hi = int(np.searchsorted(pairs_cum, pairs_cum[lo] + pairs_per_block, side='right')) - 1
+            hi = min(max(hi, lo + 1), self.num_libs)
+            blocks.append((lo, hi))
+            lo = hi
+        return blocks
+
+    def get_block(self, lo, hi):
+        # (library, book) pairs of libraries lo to hi, sorted by library, no duplicates
+        rng = np.random.RandomState([self.seed, lo])
+        if self.book_degree is not None:
+            libs, books = [], []
+            for round_books, indptr in self.rounds:
+                libs.append(np.repeat(np.arange(lo, hi), np.diff(indptr[lo:hi+1])))
+                books.append(round_books[indptr[lo]:indptr[hi]])
+            libs, books = np.concatenate(libs), np.concatenate(books).astype(np.int64)
+        else:
+            sizes = self.lib_sizes[lo:hi]
+            libs = np.repeat(np.arange(lo, hi), sizes)
+            if self.popularity > 0:
+                books = self.book_ranked[np.minimum(np.searchsorted(self.popularity_cum, rng.random_sample(len(libs))), self.num_books - 1)]
+            else:
+                books = rng.randint(0, self.num_books, size=len(libs))
+        keys = np.unique(libs * self.num_books + books)
+        return keys // self.num_books, keys % self.num_books
+
+    def format_block(self, lo, hi):
+        # "num_books days ships" and the books line of every library as one int array with its separators
+        libs, books = self.get_block(lo, hi)
+        lib_num_books = np.bincount(libs - lo, minlength=hi - lo)
+        starts = np.cumsum(lib_num_books + 3) - (lib_num_books + 3)
+        values = np.empty((lib_num_books + 3).sum(), dtype=np.int64)
+        seps = np.full(len(values), ord(" "), dtype=np.uint8)
+        is_book = np.ones(len(values), dtype=bool)
+        for offset, column in enumerate([lib_num_books, self.lib_days[lo:hi], self.lib_ships[lo:hi]]):
+            values[starts + offset] = column
+            is_book[starts + offset] = False
+        values[is_book] = books
+        seps[starts + 2] = ord("\n")
+        seps[starts + 2 + lib_num_books] = ord("\n")
+        return format_ints(values, seps), len(books)
+
+    def write(self, path, chunk_size=10**6):
+        # Written next to the target and renamed over it, like the submissions
+        t0 = time()
+        num_pairs = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write("{} {} {}\n".format(self.num_books, self.num_libs, self.num_days).encode())
+                for lo in range(0, self.num_books, chunk_size):
+                    points = self.book_points[lo:lo+chunk_size]
+                    seps = np.full(len(points), ord(" "), dtype=np.uint8)
+                    if lo + chunk_size >= self.num_books:
+                        seps[-1] = ord("\n")
+                    f.write(format_ints(points, seps))
+                for lo, hi in self.get_blocks():
+                    data, num_block_pairs = self.format_block(lo, hi)
+                    f.write(data)
+                    num_pairs += num_block_pairs
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return {"num_books": self.num_books, "num_libs": self.num_libs, "num_days": self.num_days, "num_pairs": num_pairs,
+                "size_mb": os.path.getsize(path) / 2**20, "generate_seconds": time() - t0}
+
+
+def get_profile_generator(profile, scale=1, seed=0, **kwargs):
+    # kwargs override the scaled profile
+    params = dict(profiles[profile])
+    scale_days = params.pop("scale_days")
+    params["num_books"] = int(round(params["num_books"] * scale))
+    params["num_libs"] = max(int(round(params["num_libs"] * scale)), 1)
+    if scale_days:
+        params["num_days"] = int(round(params["num_days"] * scale))
+    params.update(kwargs)
+    return Instance_Generator(seed=seed, **params)
+
+def generate(path, profile, scale=1, seed=0, **kwargs):
+    return get_profile_generator(profile, scale, seed, **kwargs).write(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=str)
+    parser.add_argument("--profile", type=str, default="uniform", choices=list(profiles))
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num_books", type=int, default=None)
+    parser.add_argument("--num_libs", type=int, default=None)
+    parser.add_argument("--num_days", type=int, default=None)
+    args = parser.parse_args()
+    overrides = {name: value for name, value in [("num_books", args.num_books), ("num_libs", args.num_libs), ("num_days", args.num_days)] if value is not None}
+    print(args.path, generate(args.path, args.profile, args.scale, args.seed, **overrides))
@@ -0,0 +1,111 @@
+import argparse
+import heapq
+import numpy as np
+from time import time
+from simulation import Simulation_Base, paths
+from instrumentation import recorder
+
+
+class Greedy_solver():
+    # Signs up the library with the most points per signup day until no library fits anymore.
+    # Scores only decrease over time (fewer days left, more books scanned), so a heap with stale
+    # entries works: a popped library is rescored and only taken if it still beats the next entry.
+    def __init__(self, simulation, ind_libs_available=None):
+        self.num_books = simulation.num_books
+        self.num_libs = simulation.num_libs
+        self.num_days = simulation.num_days
+        self.book_points = simulation.book_points
+        self.lib_days = simulation.lib_days
+        self.lib_ships = simulation.lib_ships
+        self.lib_books_indptr = simulation.lib_books_indptr
+        self.lib_books_indices = simulation.lib_books_indices
+        self.book_libs_indptr = simulation.book_libs_indptr
+        self.book_libs_indices = simulation.book_libs_indices
+        if ind_libs_available is None:
+            ind_libs_available = np.arange(self.num_libs)
+        self.ind_libs_available = np.asarray(ind_libs_available, dtype=np.int64)
+        self.time_solve = 0
+
+    def get_lib_books_unscanned(self, lib, days_used):
+        # Best unscanned books of lib that it can still ship when signing up now
+        num_books_max = (self.num_days - days_used - self.lib_days[lib]) * self.lib_ships[lib]
+        if num_books_max <= 0:
+            return self.lib_books_indices[:0]
+        books = self.lib_books_indices[self.lib_books_indptr[lib]:self.lib_books_indptr[lib+1]]
+        return books[~self.scanned[books]][:num_books_max]
+
+    def get_lib_score(self, lib, days_used):
+        return self.book_points[self.get_lib_books_unscanned(lib, days_used)].sum() / self.lib_days[lib]
+
+    def push(self, lib, days_used):
+        self.lib_version[lib] += 1
+        score = self.get_lib_score(lib, days_used)
+        if score > 0:
+            heapq.heappush(self.heap, (-score, lib, self.lib_version[lib]))
+
+    def run(self):
+        t0 = time()
+        self.scanned = np.zeros(self.num_books, dtype=bool)
+        self.lib_version = np.zeros(self.num_libs, dtype=np.int64)
+        self.lib_picked = np.zeros(self.num_libs, dtype=bool)
+        self.heap = []
+        days_used = 0
+        for lib in self.ind_libs_available.tolist():
+            self.push(lib, days_used)
+
+        self.ind_libs_best = []
+        self.solution = []
+        while self.heap:
+            neg_score, lib, version = heapq.heappop(self.heap)
+            if version != self.lib_version[lib]:
+                continue
+            score = self.get_lib_score(lib, days_used)
+            if self.heap and score < -self.heap[0][0]:
+                if score > 0:
+                    heapq.heappush(self.heap, (-score, lib, version))
+                continue
+            if score <= 0:
+                continue
+            books = self.get_lib_books_unscanned(lib, days_used)
+            self.scanned[books] = True
+            self.lib_picked[lib] = True
+            self.lib_version[lib] += 1
+            days_used += self.lib_days[lib]
+            self.ind_libs_best.append(lib)
+            self.solution.append((lib, books.tolist()))
+            # Rescore the libraries that lost books, all others are caught lazily when popped
+            starts, ends = self.book_libs_indptr[books], self.book_libs_indptr[books + 1]
+            ind = np.repeat(ends - (ends - starts).cumsum(), ends - starts) + np.arange((ends - starts).sum())
+            for lib_shared in np.unique(self.book_libs_indices[ind]).tolist():
+                if not self.lib_picked[lib_shared] and self.lib_version[lib_shared] > 0:
+                    self.push(lib_shared, days_used)
+        self.ind_libs_best = np.array(self.ind_libs_best, dtype=np.int64)
+        self.time_solve = time() - t0
+        recorder.add_time("greedy.run", self.time_solve)
+        return self.ind_libs_best
+
+    def get_ordering(self):
+        # Greedy picks first, the other available libraries behind them by signup days
+        self.run()
+        ind_libs_rest = self.ind_libs_available[~self.lib_picked[self.ind_libs_available]]
+        ind_libs_rest = ind_libs_rest[np.argsort(self.lib_days[ind_libs_rest], kind='stable')]
+        return np.concatenate([self.ind_libs_best, ind_libs_rest])
+
+
+def get_greedy_ordering(simulation, ind_libs_available=None):
+    return Greedy_solver(simulation, ind_libs_available).get_ordering()
+
+
+if __name__ == "__main__":
+    from flow_solver import Flow_solver
+    parser = argparse.ArgumentParser()
+    parser.add_argument("numbers", type=int, nargs="*", default=[0, 1, 2, 3, 4, 5])
+    args = parser.parse_args()
+    for number in args.numbers:
+        sim = Simulation_Base(number, silent=True)
+        greedy = Greedy_solver(sim)
+        greedy.run()
+        sim.solution = greedy.solution
+        score_greedy = sim.get_score()
+        sim.solution = Flow_solver(sim).get_optimal_books_for_ordered_libs(greedy.ind_libs_best)
+        print("{:40s} libs {:6d} greedy {:10d} ({:7.3f}s) optimal books {:10d}".format(paths[number], len(greedy.ind_libs_best), score_greedy, greedy.time_solve, sim.get_score()))
@@ -0,0 +1,81 @@
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from time import time
+
+
+class Recorder():
+    # In-memory timers, counters and trajectories. When disabled every call returns right away,
+    # hot loops should keep their own counts and report them once per chunk.
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.timers = defaultdict(float)
+        self.timer_counts = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.values = dict()
+        self.trajectories = defaultdict(list)
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        t0 = time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time() - t0)
+
+    def add_time(self, name, seconds):
+        if self.enabled:
+            self.timers[name] += seconds
+            self.timer_counts[name] += 1
+
+    def count(self, name, num=1):
+        if self.enabled:
+            self.counters[name] += num
+
+    def set(self, name, value):
+        if self.enabled:
+            self.values[name] = value
+
+    def append(self, name, value):
+        if self.enabled:
+            self.trajectories[name].append(value)
+
+    def get_report(self):
+        timers = {name: {"seconds": seconds, "count": self.timer_counts[name]} for name, seconds in self.timers.items()}
+        return {"timers": timers, "counters": dict(self.counters), "values": self.values, "trajectories": dict(self.trajectories)}
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.get_report(), f, indent=1, default=float)
+
+    def print_report(self):
+        for name, seconds in sorted(self.timers.items(), key=lambda item: -item[1]):
+            print("{:50s} {:10.3f}s {:8d}x".format(name, seconds, self.timer_counts[name]))
+        for name, value in sorted(self.counters.items()):
+            print("{:50s} {:12d}".format(name, value))
+        for name, value in sorted(self.values.items()):
+            print("{:50s} {}".format(name, value))
+
+
+# Shared by all solvers of a process, off unless a run switches it on
+recorder = Recorder(enabled=False)
+
+def record_model(name, time_build, time_solve, num_variables, num_constraints):
+    recorder.add_time(name + ".build", time_build)
+    recorder.add_time(name + ".solve", time_solve)
+    recorder.count(name + ".variables", num_variables)
+    recorder.count(name + ".constraints", num_constraints)
+    recorder.append(name + ".models", (time_build, time_solve, num_variables, num_constraints))
+
+def enable():
+    recorder.enabled = True
+    return recorder
+
+def disable():
+    recorder.enabled = False
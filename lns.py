@@ -0,0 +1,149 @@
+import argparse
+import numpy as np
+from multiprocessing import Pool, TimeoutError, cpu_count
+from time import time
+from simulation import Simulation_Base, paths
+from mip_matrix import MIP_matrix_solver
+from flow_solver import Flow_solver
+from greedy import get_greedy_ordering
+from instrumentation import recorder
+
+
+def get_num_active(simulation, ind_libs):
+    # Libraries behind this position sign up too late to ship anything
+    days_used = np.cumsum(simulation.lib_days[ind_libs])
+    return int(np.searchsorted(days_used, simulation.num_days))
+
+def get_windows(num_active, window, offset):
+    # Disjoint windows, so reordering one never changes the signup days of another
+    return [(lo, min(lo + window, num_active)) for lo in range(offset, num_active - 1, window)]
+
+def init_worker(number, time_limit, gap):
+    global worker_solver
+    simulation = Simulation_Base(number, silent=True)
+    worker_solver = MIP_matrix_solver(simulation, time_limit=time_limit, gap=gap)
+
+def get_book_positions(num_books, assignment):
+    # Position of the library every book is shipped by in the ordering, -1 for books not shipped
+    book_positions = np.full(num_books, -1, dtype=np.int64)
+    for position, (lib, books) in enumerate(assignment):
+        book_positions[books] = position
+    return book_positions
+
+def get_books_fixed(book_positions, lo, hi):
+    # Books shipped by the libraries outside the window
+    return np.flatnonzero((book_positions >= 0) & ((book_positions < lo) | (book_positions >= hi)))
+
+def solve_window(args):
+    # Every window gets at most its time limit and never runs past the deadline of the search
+    ind_libs, lo, hi, books_fixed, time_limit, deadline = args
+    time_remaining = deadline - time()
+    if time_remaining <= 0:
+        return lo, hi, None
+    worker_solver.time_limit = time_remaining if time_limit is None else min(time_limit, time_remaining)
+    result = worker_solver.get_optimal_ordering_and_books_for_subsection(ind_libs, lo, hi, books_fixed=books_fixed)
+    if result is None:
+        return lo, hi, None
+    return lo, hi, np.array([lib for lib, books in result[lo:hi]])
+
+def get_results_until(results, deadline, grace=1):
+    # Results of imap_unordered as they arrive, stops waiting for the rest once the deadline has passed
+    while True:
+        try:
+            yield results.next(timeout=max(deadline - time(), 0) + grace)
+        except (StopIteration, TimeoutError):
+            return
+
+def merge_windows(flow, ind_libs, energy, solutions):
+    # All window solutions at once first, one by one if they compete for the same books
+    ind_libs_next = ind_libs.copy()
+    for lo, hi, window in solutions:
+        ind_libs_next[lo:hi] = window
+    energy_next = flow.get_energy(ind_libs_next)
+    if energy_next <= energy:
+        return ind_libs_next, energy_next
+    for lo, hi, window in solutions:
+        ind_libs_next = ind_libs.copy()
+        ind_libs_next[lo:hi] = window
+        energy_next = flow.get_energy(ind_libs_next)
+        if energy_next < energy:
+            ind_libs, energy = ind_libs_next, energy_next
+    return ind_libs, energy
+
+def run_lns(number, ind_libs, window=10, budget=600, time_limit=60, gap=None, num_workers=None, silent=False, callback=None):
+    # Sliding window large neighbourhood search: every batch reorders disjoint windows of the active libraries
+    # with the MIP ordering model, consecutive batches shift the windows by half a window so they overlap.
+    # The books the current assignment ships from libraries outside a window are fixed in its model.
+    # time_limit is per window and capped by the remaining budget, windows still running when the budget is
+    # used up are dropped with the pool.
+    # callback(ind_libs, energy) runs after every batch, returning True stops the search
+    t0 = time()
+    deadline = t0 + budget
+    simulation = Simulation_Base(number, silent=True)
+    flow = Flow_solver(simulation)
+    ind_libs = np.array(ind_libs)
+    num_active = get_num_active(simulation, ind_libs)
+    ind_libs_active = ind_libs[:num_active]
+    ind_libs_inactive = ind_libs[num_active:]
+    energy = flow.get_energy(ind_libs_active)
+    if num_workers is None:
+        num_workers = cpu_count()
+
+    if num_workers > 1:
+        pool = Pool(num_workers, initializer=init_worker, initargs=(number, time_limit, gap))
+    else:
+        pool = None
+        init_worker(number, time_limit, gap)
+    num_batch = 0
+    num_stale = 0
+    try:
+        while time() < deadline and num_stale < 2:
+            offset = (num_batch % 2) * (window // 2)
+            book_positions = get_book_positions(simulation.num_books, flow.get_optimal_books_for_ordered_libs(ind_libs_active))
+            tasks = [(ind_libs_active, lo, hi, get_books_fixed(book_positions, lo, hi), time_limit, deadline) for lo, hi in get_windows(num_active, window, offset)]
+            solutions = []
+            t_batch = time()
+            if pool is not None:
+                results = get_results_until(pool.imap_unordered(solve_window, tasks), deadline)
+            else:
+                results = map(solve_window, tasks)
+            for lo, hi, window_libs in results:
+                if window_libs is not None and not np.array_equal(window_libs, ind_libs_active[lo:hi]):
+                    solutions.append((lo, hi, window_libs))
+                if time() >= deadline:
+                    # Windows not solved yet are dropped, the finished ones are still merged
+                    break
+            recorder.add_time("lns.windows", time() - t_batch)
+            recorder.count("lns.windows_solved", len(tasks))
+            recorder.count("lns.windows_changed", len(solutions))
+            energy_next = energy
+            if solutions:
+                ind_libs_active, energy_next = merge_windows(flow, ind_libs_active, energy, solutions)
+            # Both offsets without improvement means every window is locally optimal
+            num_stale = num_stale + 1 if energy_next >= energy else 0
+            energy = energy_next
+            recorder.append("lns.energy", (time() - t0, float(energy)))
+            num_batch += 1
+            if not silent:
+                print("batch {:4d} windows {:4d} changed {:4d} score {:10d} time {:8.1f}s".format(num_batch, len(tasks), len(solutions), -energy, time() - t0))
+            if callback is not None and callback(np.concatenate([ind_libs_active, ind_libs_inactive]), energy):
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    return np.concatenate([ind_libs_active, ind_libs_inactive]), energy
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("number", type=int)
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=600)
+    parser.add_argument("--time_limit", type=float, default=60)
+    parser.add_argument("--num_workers", type=int, default=None)
+    args = parser.parse_args()
+    simulation = Simulation_Base(args.number, silent=True)
+    ind_libs, energy = run_lns(args.number, get_greedy_ordering(simulation), args.window, args.budget, args.time_limit, num_workers=args.num_workers)
+    print(paths[args.number], -energy)
@@ -0,0 +1,379 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import milp, LinearConstraint, Bounds
+from time import time
+from instrumentation import recorder, record_model
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+
+class Model_Builder():
+    # Collects variable blocks and constraint rows as COO triplets
+    def __init__(self):
+        self.num_variables = 0
+        self.objective = []
+        self.lb = []
+        self.ub = []
+        self.integrality = []
+        self.rows = []
+        self.cols = []
+        self.vals = []
+        self.row_lb = []
+        self.row_ub = []
+        self.num_constraints = 0
+
+    def add_variables(self, num, lb=0, ub=1, integral=False, objective=0):
+        start = self.num_variables
+        self.num_variables += num
+        self.objective.append(np.broadcast_to(np.asarray(objective, dtype=float), (num,)))
+        self.lb.append(np.broadcast_to(np.asarray(lb, dtype=float), (num,)))
+        self.ub.append(np.broadcast_to(np.asarray(ub, dtype=float), (num,)))
+        self.integrality.append(np.full(num, int(integral)))
+        return np.arange(start, start + num)
+
+    def add_constraints(self, num, rows, cols, vals, lb=-np.inf, ub=np.inf):
+        # rows are local to this block of num constraints
+        start = self.num_constraints
+        self.num_constraints += num
+        self.rows.append(start + np.asarray(rows, dtype=np.int64))
+        self.cols.append(np.asarray(cols, dtype=np.int64))
+        self.vals.append(np.broadcast_to(np.asarray(vals, dtype=float), (len(self.rows[-1]),)))
+        self.row_lb.append(np.broadcast_to(np.asarray(lb, dtype=float), (num,)))
+        self.row_ub.append(np.broadcast_to(np.asarray(ub, dtype=float), (num,)))
+        return np.arange(start, start + num)
+
+    def relax(self):
+        # LP relaxation of the model, every variable continuous within its bounds
+        self.integrality = [np.zeros_like(integrality) for integrality in self.integrality]
+
+    def get_matrix(self):
+        return sp.csr_array((np.concatenate(self.vals), (np.concatenate(self.rows), np.concatenate(self.cols))), shape=(self.num_constraints, self.num_variables))
+
+    def solve(self, options, sense=-1):
+        c = sense * np.concatenate(self.objective)
+        constraints = LinearConstraint(self.get_matrix(), np.concatenate(self.row_lb), np.concatenate(self.row_ub))
+        bounds = Bounds(np.concatenate(self.lb), np.concatenate(self.ub))
+        return milp(c, constraints=constraints, integrality=np.concatenate(self.integrality), bounds=bounds, options=options)
+
+
+class MIP_matrix_solver():
+    # Builds the models of MIP_solver directly as sparse matrices from the CSR instance arrays and solves them with HiGHS
+    def __init__(self, simulation, time_limit=None, gap=None):
+        self.number = simulation.number
+        self.silent = simulation.silent
+        self.num_books = simulation.num_books
+        self.num_libs = simulation.num_libs
+        self.num_days = simulation.num_days
+        self.book_points = simulation.book_points
+        self.lib_num_books = simulation.lib_num_books
+        self.lib_days = simulation.lib_days
+        self.lib_ships = simulation.lib_ships
+        self.lib_books_indptr = simulation.lib_books_indptr
+        self.lib_books_indices = simulation.lib_books_indices
+        self.time_limit = time_limit
+        self.gap = gap
+        self.time_build = 0
+        self.time_solve = 0
+        self.num_variables = 0
+        self.num_constraints = 0
+
+    def get_options(self):
+        options = {"disp": False}
+        if self.time_limit is not None:
+            options["time_limit"] = self.time_limit
+        if self.gap is not None:
+            options["mip_rel_gap"] = self.gap
+        return options
+
+    def get_pairs(self, ind_libs):
+        # All (position of lib in ind_libs, book) pairs, books of every lib in CSR order
+        ind_libs = np.asarray(ind_libs, dtype=np.int64)
+        counts = self.lib_books_indptr[ind_libs + 1] - self.lib_books_indptr[ind_libs]
+        starts = np.zeros(len(ind_libs), dtype=np.int64)
+        np.cumsum(counts[:-1], out=starts[1:])
+        offsets = np.repeat(self.lib_books_indptr[ind_libs] - starts, counts)
+        pair_books = self.lib_books_indices[offsets + np.arange(counts.sum())]
+        pair_libs = np.repeat(np.arange(len(ind_libs)), counts)
+        return pair_libs, pair_books
+
+    def get_book_rows(self, pair_books):
+        # Local constraint row for every distinct book
+        ind_books, pair_rows = np.unique(pair_books, return_inverse=True)
+        return ind_books, pair_rows
+
+    def solve(self, builder):
+        t0 = time()
+        solver_result = builder.solve(self.get_options())
+        self.time_solve = time() - t0
+        self.num_variables = builder.num_variables
+        self.num_constraints = builder.num_constraints
+        record_model("mip_matrix", self.time_build, self.time_solve, self.num_variables, self.num_constraints)
+        # Can be used to see solver results
+        # print(solver_result)
+        return solver_result
+
+    def get_result_books(self, ind_libs, pair_libs, pair_books, pair_values):
+        selected = pair_values > 1e-9
+        counts = np.bincount(pair_libs[selected], minlength=len(ind_libs))
+        books = np.split(pair_books[selected], np.cumsum(counts)[:-1])
+        return [(lib, lib_books.tolist()) for lib, lib_books in zip(ind_libs, books)]
+
+    def get_optimal_books_for_ordered_libs(self, ind_libs_best, days_available=None, book_points_available=None, solverName="highs"):
+        t0 = time()
+        if days_available is None:
+            days_available = self.num_days
+        if book_points_available is None:
+            book_points_available = self.book_points
+        ind_libs_best = np.asarray(ind_libs_best, dtype=np.int64)
+        days_remaining = days_available - np.cumsum(self.lib_days[ind_libs_best])
+        lib_num_books_available = np.maximum(days_remaining * self.lib_ships[ind_libs_best], 0)
+
+        # Books without points do not change the objective and are left out of the model
+        pair_libs, pair_books = self.get_pairs(ind_libs_best)
+        mask = book_points_available[pair_books] != 0
+        pair_libs, pair_books = pair_libs[mask], pair_books[mask]
+        num_pairs = len(pair_books)
+        ind_books, pair_rows = self.get_book_rows(pair_books)
+
+        builder = Model_Builder()
+        lib_books = builder.add_variables(num_pairs, integral=True, objective=book_points_available[pair_books])
+        builder.add_constraints(len(ind_books), pair_rows, lib_books, 1, ub=1)
+        builder.add_constraints(len(ind_libs_best), pair_libs, lib_books, 1, ub=lib_num_books_available)
+        self.time_build = time() - t0
+
+        solver_result = self.solve(builder)
+        return self.get_result_books(ind_libs_best, pair_libs, pair_books, solver_result.x[lib_books])
+
+    def get_best_libs_model(self, ind_libs_available, days_available):
+        ind_libs_available = np.asarray(ind_libs_available, dtype=np.int64)
+        pair_libs, pair_books = self.get_pairs(ind_libs_available)
+        ind_books, pair_rows = self.get_book_rows(pair_books)
+
+        builder = Model_Builder()
+        books = builder.add_variables(len(ind_books), objective=self.book_points[ind_books])
+        libs = builder.add_variables(len(ind_libs_available), integral=True)
+        rows = np.concatenate([np.arange(len(ind_books)), pair_rows])
+        cols = np.concatenate([books, libs[pair_libs]])
+        vals = np.concatenate([np.ones(len(ind_books)), -np.ones(len(pair_rows))])
+        builder.add_constraints(len(ind_books), rows, cols, vals, ub=0)
+        builder.add_constraints(1, np.zeros(len(libs), dtype=np.int64), libs, self.lib_days[ind_libs_available], ub=days_available)
+        return builder, libs
+
+    def get_best_libs_based_on_remaining_libs(self, ind_libs_available, book_points_available, days_available, solverName="highs"):
+        t0 = time()
+        builder, libs = self.get_best_libs_model(ind_libs_available, days_available)
+        self.time_build = time() - t0
+        solver_result = self.solve(builder)
+        return [lib for lib, value in zip(ind_libs_available, solver_result.x[libs]) if value > 0.5]
+
+    def get_best_libs_unlimited_ships(self, ind_libs_available, days_available, solverName="highs"):
+        return self.get_best_libs_based_on_remaining_libs(ind_libs_available, None, days_available, solverName)
+
+    def get_ordering_model(self, ind_libs_available, lo, hi, days_available, book_points_available, books_fixed=None):
+        # Libraries in [lo, hi) get a free position, all others keep their place and capacity. With books_fixed the
+        # others are left out of the model: the books they ship (books_fixed) are constants the window cannot take,
+        # so the model only grows with the window.
+        ind_libs_available = np.asarray(ind_libs_available, dtype=np.int64)
+        num_libs = len(ind_libs_available)
+        num_reorder = hi - lo
+        days_available_reorder = days_available - self.lib_days[ind_libs_available[:lo]].sum()
+        days_remaining = days_available - np.cumsum(self.lib_days[ind_libs_available])
+        lib_num_books_available = np.maximum(days_remaining * self.lib_ships[ind_libs_available], 0)
+
+        if books_fixed is None:
+            pair_libs, pair_books = self.get_pairs(ind_libs_available)
+            mask = book_points_available[pair_books] != 0
+        else:
+            pair_libs, pair_books = self.get_pairs(ind_libs_available[lo:hi])
+            pair_libs += lo
+            book_fixed = np.zeros(self.num_books, dtype=bool)
+            book_fixed[books_fixed] = True
+            mask = (book_points_available[pair_books] != 0) & ~book_fixed[pair_books]
+        pair_libs, pair_books = pair_libs[mask], pair_books[mask]
+        num_pairs = len(pair_books)
+        ind_books, pair_rows = self.get_book_rows(pair_books)
+        num_books = len(ind_books)
+
+        builder = Model_Builder()
+        books = builder.add_variables(num_books, objective=book_points_available[ind_books])
+        lib_books = builder.add_variables(num_pairs)
+        lib_index = builder.add_variables(num_reorder * num_reorder, integral=True).reshape(num_reorder, num_reorder)
+        times_remaining = builder.add_variables(num_reorder, ub=self.num_days)
+        lib_times_remaining = builder.add_variables(num_reorder, ub=2*self.num_days)
+
+        # every_book_once and use_books
+        builder.add_constraints(num_books, pair_rows, lib_books, 1, ub=1)
+        rows = np.concatenate([np.arange(num_books), pair_rows])
+        cols = np.concatenate([books, lib_books])
+        vals = np.concatenate([np.ones(num_books), -np.ones(num_pairs)])
+        builder.add_constraints(num_books, rows, cols, vals, ub=0)
+
+        # one_place_per_lib and one_lib_per_place
+        reorder_rows = np.repeat(np.arange(num_reorder), num_reorder)
+        builder.add_constraints(num_reorder, reorder_rows, lib_index.ravel(), 1, lb=1, ub=1)
+        builder.add_constraints(num_reorder, reorder_rows, lib_index.T.ravel(), 1, lb=1, ub=1)
+
+        # remaining_times: times_remaining[t] = times_remaining[t-1] - sum_l lib_index[l, t] * lib_days[l]
+        reorder_days = self.lib_days[ind_libs_available[lo:hi]]
+        rows = np.concatenate([np.arange(num_reorder), np.arange(1, num_reorder), np.tile(np.arange(num_reorder), num_reorder)])
+        cols = np.concatenate([times_remaining, times_remaining[:-1], lib_index.ravel()])
+        vals = np.concatenate([np.ones(num_reorder), -np.ones(num_reorder - 1), np.repeat(reorder_days, num_reorder)])
+        rhs = np.zeros(num_reorder)
+        rhs[0] = days_available_reorder
+        builder.add_constraints(num_reorder, rows, cols, vals, lb=rhs, ub=rhs)
+
+        # lib_remaining_times: lib_times_remaining[l] <= times_remaining[t] + days_available * (1 - lib_index[l, t])
+        num_rows = num_reorder * num_reorder
+        lib_of_row, time_of_row = np.divmod(np.arange(num_rows), num_reorder)
+        rows = np.tile(np.arange(num_rows), 3)
+        cols = np.concatenate([lib_times_remaining[lib_of_row], times_remaining[time_of_row], lib_index.ravel()])
+        vals = np.concatenate([np.ones(num_rows), -np.ones(num_rows), np.full(num_rows, days_available)])
+        builder.add_constraints(num_rows, rows, cols, vals, ub=days_available)
+
+        # lib_max_num_books for reordered libraries, max_books_per_lib for all others
+        is_reorder = (pair_libs >= lo) & (pair_libs < hi)
+        rows = np.concatenate([pair_libs[is_reorder] - lo, np.arange(num_reorder)])
+        cols = np.concatenate([lib_books[is_reorder], lib_times_remaining])
+        vals = np.concatenate([np.ones(is_reorder.sum()), -self.lib_ships[ind_libs_available[lo:hi]]])
+        builder.add_constraints(num_reorder, rows, cols, vals, ub=0)
+        if books_fixed is None:
+            ind_fixed = np.concatenate([np.arange(lo), np.arange(hi, num_libs)])
+            fixed_rows = np.full(num_libs, -1)
+            fixed_rows[ind_fixed] = np.arange(len(ind_fixed))
+            builder.add_constraints(len(ind_fixed), fixed_rows[pair_libs[~is_reorder]], lib_books[~is_reorder], 1, ub=lib_num_books_available[ind_fixed])
+        return builder, pair_libs, pair_books, lib_books, lib_index
+
+    def get_ordering_result(self, ind_libs_available, lo, hi, solver_result, pair_libs, pair_books, lib_books, lib_index):
+        if solver_result.x is None:
+            # Time limit reached before any feasible solution was found
+            return None
+        ind_libs_available = np.asarray(ind_libs_available, dtype=np.int64)
+        result_books = self.get_result_books(ind_libs_available, pair_libs, pair_books, solver_result.x[lib_books])
+        positions = np.argmax(solver_result.x[lib_index], axis=0)
+        order = np.concatenate([np.arange(lo), lo + positions, np.arange(hi, len(ind_libs_available))])
+        return [result_books[ind] for ind in order]
+
+    def get_optimal_ordering_and_books(self, ind_libs_available, days_available=None, book_points_available=None, solverName="highs"):
+        t0 = time()
+        if days_available is None:
+            days_available = self.num_days
+        if book_points_available is None:
+            book_points_available = self.book_points
+        model = self.get_ordering_model(ind_libs_available, 0, len(ind_libs_available), days_available, book_points_available)
+        self.time_build = time() - t0
+        solver_result = self.solve(model[0])
+        return self.get_ordering_result(ind_libs_available, 0, len(ind_libs_available), solver_result, *model[1:])
+
+    def get_optimal_ordering_and_books_for_subsection(self, ind_libs_available, lo, hi, solverName="highs", books_fixed=None):
+        # With books_fixed the libraries outside [lo, hi) are returned without books, see get_ordering_model
+        t0 = time()
+        model = self.get_ordering_model(ind_libs_available, lo, hi, self.num_days, self.book_points, books_fixed)
+        self.time_build = time() - t0
+        solver_result = self.solve(model[0])
+        return self.get_ordering_result(ind_libs_available, lo, hi, solver_result, *model[1:])
+
+
+class Persistent_Book_Model():
+    # Book assignment model over a fixed set of candidate libraries that is built once and kept in HiGHS.
+    # A new ordering only changes the capacity rows, and the previous assignment is used as warm start.
+    def __init__(self, simulation, ind_libs_available, book_points_available=None, time_limit=None, gap=None):
+        if highspy is None:
+            raise ImportError("Persistent_Book_Model needs highspy")
+        t0 = time()
+        self.num_days = simulation.num_days
+        self.num_libs = simulation.num_libs
+        self.lib_days = simulation.lib_days
+        self.lib_ships = simulation.lib_ships
+        self.book_points = simulation.book_points if book_points_available is None else book_points_available
+        self.ind_libs_available = np.asarray(ind_libs_available, dtype=np.int64)
+
+        matrix_solver = MIP_matrix_solver(simulation)
+        pair_libs, pair_books = matrix_solver.get_pairs(self.ind_libs_available)
+        mask = self.book_points[pair_books] != 0
+        self.pair_libs = self.ind_libs_available[pair_libs[mask]]
+        self.pair_books = pair_books[mask]
+        self.num_pairs = len(self.pair_books)
+        group_start = np.flatnonzero(np.diff(self.pair_libs, prepend=-1) != 0)
+        self.pair_group_start = np.repeat(group_start, np.diff(np.append(group_start, self.num_pairs)))
+        ind_books, pair_rows = matrix_solver.get_book_rows(self.pair_books)
+        self.num_book_rows = len(ind_books)
+        self.lib_row = np.full(self.num_libs, -1, dtype=np.int64)
+        self.lib_row[self.ind_libs_available] = self.num_book_rows + np.arange(len(self.ind_libs_available))
+
+        self.time_limit = time_limit
+        self.gap = gap
+        self.highs = highspy.Highs()
+        self.highs.setOptionValue("output_flag", False)
+        if time_limit is not None:
+            self.highs.setOptionValue("time_limit", float(time_limit))
+        if gap is not None:
+            self.highs.setOptionValue("mip_rel_gap", float(gap))
+        self.highs.changeObjectiveSense(highspy.ObjSense.kMaximize)
+        costs = self.book_points[self.pair_books].astype(float)
+        self.highs.addCols(self.num_pairs, costs, np.zeros(self.num_pairs), np.ones(self.num_pairs), 0, np.array([], dtype=np.int32), np.array([], dtype=np.int32), np.array([], dtype=float))
+        self.highs.changeColsIntegrality(self.num_pairs, np.arange(self.num_pairs, dtype=np.int32), np.full(self.num_pairs, highspy.HighsVarType.kInteger))
+
+        num_rows = self.num_book_rows + len(self.ind_libs_available)
+        rows = np.concatenate([pair_rows, self.lib_row[self.pair_libs]])
+        cols = np.tile(np.arange(self.num_pairs), 2)
+        matrix = sp.csr_array((np.ones(len(rows)), (rows, cols)), shape=(num_rows, self.num_pairs))
+        self.lib_num_books_available = np.zeros(self.num_libs, dtype=np.int64)
+        upper = np.concatenate([np.ones(self.num_book_rows), np.zeros(len(self.ind_libs_available))])
+        self.highs.addRows(num_rows, np.full(num_rows, -highspy.kHighsInf), upper, matrix.nnz, matrix.indptr[:-1].astype(np.int32), matrix.indices.astype(np.int32), matrix.data)
+        self.pair_values = np.zeros(self.num_pairs)
+        self.time_build = time() - t0
+        self.time_update = 0
+        self.time_solve = 0
+        self.num_changed = 0
+
+    def set_capacities(self, lib_num_books_available):
+        changed = np.where(lib_num_books_available != self.lib_num_books_available)[0]
+        self.num_changed = len(changed)
+        if len(changed):
+            upper = lib_num_books_available[changed].astype(float)
+            self.highs.changeRowsBounds(len(changed), self.lib_row[changed].astype(np.int32), np.full(len(changed), -highspy.kHighsInf), upper)
+        self.lib_num_books_available = lib_num_books_available
+
+    def set_warm_start(self):
+        # Books of every library are in CSR order, best first, so keeping the first ones trims to the new capacity
+        selected = self.pair_values > 0.5
+        selected_cum = np.cumsum(selected)
+        rank = selected_cum - (selected_cum - selected)[self.pair_group_start] - 1
+        selected &= rank < self.lib_num_books_available[self.pair_libs]
+        solution = highspy.HighsSolution()
+        solution.col_value = selected.astype(float).tolist()
+        solution.value_valid = True
+        self.highs.setSolution(solution)
+
+    def get_optimal_books_for_ordered_libs(self, ind_libs_best, days_available=None, book_points_available=None, solverName=None):
+        if book_points_available is not None and book_points_available is not self.book_points:
+            raise ValueError("Persistent_Book_Model is built for fixed book points")
+        t0 = time()
+        if days_available is None:
+            days_available = self.num_days
+        ind_libs_best = np.asarray(ind_libs_best, dtype=np.int64)
+        if np.any(self.lib_row[ind_libs_best] < 0):
+            raise ValueError("ordering contains libraries the model was not built for")
+        days_remaining = days_available - np.cumsum(self.lib_days[ind_libs_best])
+        lib_num_books_available = np.zeros(self.num_libs, dtype=np.int64)
+        lib_num_books_available[ind_libs_best] = np.maximum(days_remaining * self.lib_ships[ind_libs_best], 0)
+        self.set_capacities(lib_num_books_available)
+        self.set_warm_start()
+        t1 = time()
+        self.highs.run()
+        self.pair_values = np.asarray(self.highs.getSolution().col_value)
+        t2 = time()
+        self.time_update = t1 - t0
+        self.time_solve = t2 - t1
+        recorder.add_time("persistent_book_model.update", self.time_update)
+        recorder.add_time("persistent_book_model.solve", self.time_solve)
+        recorder.count("persistent_book_model.changed_rows", self.num_changed)
+
+        selected = self.pair_values > 0.5
+        lib_books = dict((lib, []) for lib in ind_libs_best)
+        for lib, book in zip(self.pair_libs[selected].tolist(), self.pair_books[selected].tolist()):
+            lib_books[lib].append(book)
+        return [(lib, lib_books[lib]) for lib in ind_libs_best]
@@ -1,9 +1,48 @@
+import os
+import signal
 import numpy as np
 import pyomo.kernel as pmo
 import pyomo.environ
+from contextlib import contextmanager
+from multiprocessing import get_context
+from multiprocessing.connection import wait
+from time import time
+from instrumentation import recorder, record_model
+from coverage_index import Coverage_Index, unpack
+
+# Option names of time limit, relative gap and threads for every backend, None if the backend has no such option
+solver_option_names = {
+    "cbc": ("sec", "ratioGap", "threads"),
+    "scip": ("limits/time", "limits/gap", None),
+    "glpk": ("tmlim", "mipgap", None),
+    "gurobi": ("TimeLimit", "MIPGap", "Threads"),
+    "cplex": ("timelimit", "mipgap", "threads"),
+    "highs": ("time_limit", "mip_rel_gap", "threads"),
+    "appsi_highs": ("time_limit", "mip_rel_gap", "threads"),
+}
+portfolio_solvers = ["scip", "cbc", "gurobi", "cplex", "glpk"]
+
+def get_available_solvers(solver_names=portfolio_solvers):
+    return [name for name in solver_names if pmo.SolverFactory(name).available(exception_flag=False)]
+
+def get_portfolio_entry(entry):
+    # A portfolio entry is a solver name or a (solver name, options) pair
+    if isinstance(entry, str):
+        return entry, dict()
+    return entry[0], dict(entry[1])
+
+def kill_process_group(process):
+    # Solver binaries run as children of the portfolio process, the whole group goes down with it
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # Killed before it became a group leader
+        process.kill()
+    process.join()
+
 
 class MIP_solver():
-    def __init__(self, simulation):
+    def __init__(self, simulation, time_limit=None, gap=None, threads=None, grace=10):
         self.number = simulation.number
         self.silent = simulation.silent
         self.num_books = simulation.num_books
@@ -17,15 +56,145 @@ class MIP_solver():
         self.lib_books_sets = simulation.lib_books_sets
         self.book_num_libs = simulation.book_num_libs
         self.book_libs_lists = simulation.book_libs_lists
-
-    def get_solver(self, solverName):
+        self.lib_books_indptr = simulation.lib_books_indptr
+        self.lib_books_indices = simulation.lib_books_indices
+        self.coverage_index = None
+        self.time_build = 0
+        self.time_solve = 0
+        self.num_variables = 0
+        self.num_constraints = 0
+        self.time_limit = time_limit
+        self.gap = gap
+        self.threads = threads
+        # Seconds a portfolio waits past the time limit for the solvers to report their incumbents
+        self.grace = grace
+        self.portfolio_results = []
+
+    @contextmanager
+    def limits(self, time_limit=None, gap=None, threads=None):
+        # Limits for the solves inside the block, e.g. with mip.limits(time_limit=60, gap=0.01): ...
+        # Limits left at None keep their current value
+        previous = self.time_limit, self.gap, self.threads
+        if time_limit is not None:
+            self.time_limit = time_limit
+        if gap is not None:
+            self.gap = gap
+        if threads is not None:
+            self.threads = threads
+        try:
+            yield self
+        finally:
+            self.time_limit, self.gap, self.threads = previous
+
+    def get_solver(self, solverName, options=None):
         solver = pmo.SolverFactory(solverName)
+        time_limit, gap, threads = self.time_limit, self.gap, self.threads
         if solverName == "cbc":
-            solver.options["threads"] = 4
-            solver.options["sec"] = 300
+            # The former fixed settings stay the defaults
+            time_limit = 300 if time_limit is None else time_limit
+            threads = 4 if threads is None else threads
+        names = solver_option_names.get(solverName, (None, None, None))
+        for name, value in zip(names, (time_limit, gap, threads)):
+            if name is not None and value is not None:
+                solver.options[name] = value
+        for name, value in (options or dict()).items():
+            solver.options[name] = value
         return solver
 
+    def start_build(self):
+        # Kept out of the model methods, some of them use time as a loop variable
+        self.t0 = time()
+
+    def get_books_available(self, ind_libs_available):
+        # Distinct books of the libraries as the union of their packed book sets
+        if self.coverage_index is None:
+            self.coverage_index = Coverage_Index(self.num_books, self.lib_books_indptr, self.lib_books_indices)
+        return np.flatnonzero(unpack(self.coverage_index.get_union(ind_libs_available), self.num_books))
+
+    def get_variables(self):
+        return list(self.model.components(ctype=pmo.variable._ctype))
+
+    def run_portfolio_entry(self, solverName, options, connection):
+        # Runs in a forked copy of the process that owns the model, only the variable values travel back
+        os.setpgrp()
+        t0 = time()
+        try:
+            solver_result = self.get_solver(solverName, options).solve(self.model, load_solutions=False)
+            termination = str(solver_result.solver.termination_condition)
+            values = None
+            if len(solver_result.solution) > 0:
+                self.model.load_solution(solver_result.solution(0))
+                values = [variable.value for variable in self.get_variables()]
+            objective = pmo.value(self.model.objective, exception=False) if values is not None else None
+            connection.send((solverName, termination, termination == "optimal", objective, values, time() - t0))
+        except Exception as e:
+            connection.send((solverName, "error: {}".format(e), False, None, None, time() - t0))
+        finally:
+            connection.close()
+
+    def solve_portfolio(self, entries):
+        # Every entry solves the model in its own process. The first proven optimal result wins and the others are
+        # killed, otherwise the best incumbent reported until time_limit + grace
+        entries = [get_portfolio_entry(entry) for entry in entries]
+        context = get_context("fork")
+        processes = dict()
+        for solverName, options in entries:
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=self.run_portfolio_entry, args=(solverName, options, sender), daemon=True)
+            process.start()
+            sender.close()
+            processes[receiver] = process
+        deadline = None if self.time_limit is None else time() + self.time_limit + self.grace
+        sense = self.model.objective.sense
+        self.portfolio_results = []
+        best = None
+        try:
+            while processes:
+                timeout = None if deadline is None else max(deadline - time(), 0)
+                ready = wait(list(processes), timeout)
+                if not ready:
+                    break
+                for receiver in ready:
+                    try:
+                        result = receiver.recv()
+                    except EOFError:
+                        result = (processes[receiver].name, "crashed", False, None, None, None)
+                    kill_process_group(processes.pop(receiver))
+                    self.portfolio_results.append(result[:4] + result[5:])
+                    objective = result[3]
+                    if objective is not None and (best is None or (objective - best[3]) * sense < 0):
+                        best = result
+                if best is not None and best[2]:
+                    break
+        finally:
+            for process in processes.values():
+                kill_process_group(process)
+        if best is None:
+            raise RuntimeError("no solver of the portfolio found a solution: {}".format(self.portfolio_results))
+        for variable, value in zip(self.get_variables(), best[4]):
+            variable.value = value
+        recorder.set("mip_solver.portfolio.winner", best[0])
+        recorder.count("mip_solver.portfolio.optimal" if best[2] else "mip_solver.portfolio.incumbent")
+        return best[:4] + best[5:]
+
+    def solve(self, solverName):
+        # A list of solver names or (solver name, options) pairs is solved as portfolio, "portfolio" uses every installed solver
+        t1 = time()
+        if solverName == "portfolio":
+            solverName = get_available_solvers()
+        if isinstance(solverName, (list, tuple)):
+            solver_result = self.solve_portfolio(solverName)
+        else:
+            solver_result = self.get_solver(solverName).solve(self.model)
+        self.time_build = t1 - self.t0
+        self.time_solve = time() - t1
+        self.num_variables = len(self.get_variables())
+        self.num_constraints = sum(1 for _ in self.model.components(ctype=pmo.constraint._ctype))
+        record_model("mip_solver", self.time_build, self.time_solve, self.num_variables, self.num_constraints)
+        return solver_result
+
     def get_optimal_books_for_ordered_libs(self, ind_libs_best, days_available=None, book_points_available=None, solverName="scip"):
+        self.start_build()
         if days_available is None:
             days_available = self.num_days
         if book_points_available is None:
@@ -80,8 +249,7 @@ class MIP_solver():
             
         self.model.objective = pmo.objective(sum(book_points_available[book] * self.model.books[book] for book in ind_books_available), sense=-1)         
 
-        solver = self.get_solver(solverName)
-        solver_result = solver.solve(self.model)  
+        solver_result = self.solve(solverName)
         
         # Can be used to see solver results
         # print(solver_result)
@@ -94,12 +262,8 @@ class MIP_solver():
         return result
     
     def get_best_libs_based_on_remaining_libs(self, ind_libs_available, book_points_available, days_available, solverName="scip"):        
-        ind_books_available = set()
-        for lib in ind_libs_available:
-            books = self.lib_books_lists[lib]
-            for book in books:
-                ind_books_available.add(book)
-        ind_books_available = np.array(list(ind_books_available))
+        self.start_build()
+        ind_books_available = self.get_books_available(ind_libs_available)
         
         book_libs_lists_available = [[] for _ in range(self.num_books)]
         for lib in ind_libs_available:
@@ -127,8 +291,7 @@ class MIP_solver():
             
         self.model.objective = pmo.objective(sum(self.book_points[book] * self.model.books[book] for book in ind_books_available), sense=-1)
         
-        solver = self.get_solver(solverName)
-        solver_result = solver.solve(self.model)  
+        solver_result = self.solve(solverName)
         
         result = []
         for lib in ind_libs_available:
@@ -137,12 +300,8 @@ class MIP_solver():
         return result
 
     def get_best_libs_unlimited_ships(self, ind_libs_available, days_available, solverName="scip"):
-        ind_books_available = set()
-        for lib in ind_libs_available:
-            books = self.lib_books_lists[lib]
-            for book in books:
-                ind_books_available.add(book)
-        ind_books_available = np.array(list(ind_books_available))
+        self.start_build()
+        ind_books_available = self.get_books_available(ind_libs_available)
         
         book_libs_lists_available = [[] for _ in range(self.num_books)]
         for lib in ind_libs_available:
@@ -171,8 +330,7 @@ class MIP_solver():
         self.model.objective = pmo.objective(sum(self.book_points[book] * self.model.books[book] for book in ind_books_available), sense=-1)         
         
 
-        solver = self.get_solver(solverName)
-        solver_result = solver.solve(self.model)  
+        solver_result = self.solve(solverName)
         
         result = []
         for lib in ind_libs_available:
@@ -181,6 +339,7 @@ class MIP_solver():
         return result
 
     def get_optimal_ordering_and_books(self, ind_libs_available, days_available=None, book_points_available=None, solverName="scip"):
+        self.start_build()
         if days_available is None:
             days_available = self.num_days
         if book_points_available is None:
@@ -266,8 +425,7 @@ class MIP_solver():
       
         self.model.objective = pmo.objective(sum(book_points_available[book] * self.model.books[book] for book in ind_books_available), sense=-1)                     
 
-        solver = self.get_solver(solverName)
-        solver_result = solver.solve(self.model)  
+        solver_result = self.solve(solverName)
 
         result = []
         for index in range(len(ind_libs_available)):
@@ -310,6 +468,7 @@ class MIP_solver():
 
 
     def get_optimal_ordering_and_books_for_subsection(self, ind_libs_available, lo, hi, solverName="scip"):
+        self.start_build()
         days_available = self.num_days
         book_points_available = self.book_points
         ind_books_available = set()
@@ -408,8 +567,7 @@ class MIP_solver():
                 
         self.model.objective = pmo.objective(sum(book_points_available[book] * self.model.books[book] for book in ind_books_available), sense=-1)                     
 
-        solver = self.get_solver(solverName)
-        solver_result = solver.solve(self.model)  
+        solver_result = self.solve(solverName)
 
 
         # Can be used to see solver results
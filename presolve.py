@@ -0,0 +1,177 @@
+import argparse
+import numpy as np
+from time import time
+from simulation import Simulation_Base, paths, get_csr_transpose, write_submission_arrays, read_submission_arrays
+from scoring import encode_solution, decode_solution
+from coverage_index import Coverage_Index
+from instrumentation import recorder
+
+
+def get_csr_pairs(rows, indices, num_rows):
+    # CSR of (row, index) pairs sorted by row
+    indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_rows), out=indptr[1:])
+    return indptr, indices
+
+def get_dominated_libs(num_books, lib_days, lib_ships, lib_books_indptr, lib_books_indices):
+    # Library a is dominated by b if b holds all books of a, signs up no slower and ships no slower.
+    # Identical libraries dominate each other, the one with the lower index is kept.
+    # Only the holders of the rarest book of a can hold all of its books, so just these pairs are checked
+    # on the packed book sets.
+    num_libs = len(lib_days)
+    lib_num_books = np.diff(lib_books_indptr)
+    index = Coverage_Index(num_books, lib_books_indptr, lib_books_indices)
+    book_num_libs = np.bincount(lib_books_indices, minlength=num_books)
+    ind_libs = np.flatnonzero(lib_num_books > 0)
+    keys = book_num_libs[lib_books_indices] * num_books + lib_books_indices
+    book_rarest = np.minimum.reduceat(keys, lib_books_indptr[ind_libs]) % num_books if len(ind_libs) else ind_libs
+    # Holders of the rarest books only, the transpose of all pairs is not needed
+    is_rarest = np.zeros(num_books, dtype=bool)
+    is_rarest[book_rarest] = True
+    pair_libs = np.repeat(np.arange(num_libs), lib_num_books)
+    mask = is_rarest[lib_books_indices]
+    book_libs_indptr, book_libs_indices = get_csr_transpose(*get_csr_pairs(pair_libs[mask], lib_books_indices[mask], num_libs), num_books)
+    counts = book_num_libs[book_rarest]
+    starts = book_libs_indptr[book_rarest]
+    a = np.repeat(ind_libs, counts)
+    b = book_libs_indices[np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+    mask = (a != b) & (lib_num_books[b] >= lib_num_books[a]) & (lib_days[b] <= lib_days[a]) & (lib_ships[b] >= lib_ships[a])
+    a, b = a[mask], b[mask]
+    identical = (lib_num_books[a] == lib_num_books[b]) & (lib_days[a] == lib_days[b]) & (lib_ships[a] == lib_ships[b])
+    mask = ~identical | (b < a)
+    a, b = a[mask], b[mask]
+    dominated = np.zeros(num_libs, dtype=bool)
+    dominated[a[index.is_subset(a, b)]] = True
+    return dominated
+
+class Presolved_Simulation(Simulation_Base):
+    # Smaller copy of an instance: books without points or without library, libraries that cannot finish
+    # their signup or hold no books anymore are removed, optionally also dominated libraries. lib_ids and
+    # book_ids map the new indices back to the original ones.
+    # Removing dominated libraries is not exact, a library whose books are all held by a better one can
+    # still be worth signing up when the better one runs out of shipping days.
+    # number is None: the workers of lns, annealing and tempering load their instance from number and would
+    # silently solve the original one, so they refuse a presolved instance. Submissions are read and written
+    # in original indices through self.original.
+    def __init__(self, simulation, remove_dominated=False):
+        t0 = time()
+        self.number = None
+        self.silent = simulation.silent
+        self.original = simulation
+        self.reductions = dict()
+
+        lib_keep = simulation.lib_days < simulation.num_days
+        self.reductions["libs_no_signup"] = int((~lib_keep).sum())
+        book_keep = self.get_books_reachable(simulation, lib_keep)
+        self.reductions["books_unreachable"] = int((~book_keep).sum())
+        book_keep &= simulation.book_points > 0
+        self.reductions["books_zero_points"] = int((~book_keep).sum()) - self.reductions["books_unreachable"]
+        lib_indptr, lib_indices = self.get_lib_books(simulation, book_keep)
+        lib_empty = lib_keep & (np.diff(lib_indptr) == 0)
+        self.reductions["libs_empty"] = int(lib_empty.sum())
+        lib_keep &= ~lib_empty
+        if remove_dominated:
+            # Dominated libraries are only compared among the kept ones, their dominators are never removed
+            ind_libs = np.flatnonzero(lib_keep)
+            indptr, indices = self.get_csr_rows(lib_indptr, lib_indices, ind_libs)
+            dominated = get_dominated_libs(simulation.num_books, simulation.lib_days[ind_libs], simulation.lib_ships[ind_libs], indptr, indices)
+            lib_keep[ind_libs[dominated]] = False
+            self.reductions["libs_dominated"] = int(dominated.sum())
+
+        self.lib_ids = np.flatnonzero(lib_keep)
+        self.book_ids = np.flatnonzero(book_keep)
+        self.lib_map = np.full(simulation.num_libs, -1, dtype=np.int64)
+        self.lib_map[self.lib_ids] = np.arange(len(self.lib_ids))
+        self.book_map = np.full(simulation.num_books, -1, dtype=np.int64)
+        self.book_map[self.book_ids] = np.arange(len(self.book_ids))
+
+        # Books keep their order inside every library, so they stay sorted by points
+        lib_books_indptr, lib_books_indices = self.get_csr_rows(lib_indptr, lib_indices, self.lib_ids)
+        lib_books_indices = self.book_map[lib_books_indices]
+        num_books, num_libs = len(self.book_ids), len(self.lib_ids)
+        book_libs_indptr, book_libs_indices = get_csr_transpose(lib_books_indptr, lib_books_indices, num_books)
+        self.set_instance((num_books, num_libs, simulation.num_days, simulation.book_points[self.book_ids], np.diff(lib_books_indptr),
+                           simulation.lib_days[self.lib_ids], simulation.lib_ships[self.lib_ids], lib_books_indptr, lib_books_indices,
+                           book_libs_indptr, book_libs_indices))
+        self.time_presolve = time() - t0
+        recorder.add_time("presolve", self.time_presolve)
+
+    def get_books_reachable(self, simulation, lib_keep):
+        books = np.repeat(np.arange(simulation.num_books), np.diff(simulation.book_libs_indptr))
+        return np.bincount(books[lib_keep[simulation.book_libs_indices]], minlength=simulation.num_books) > 0
+
+    def get_lib_books(self, simulation, book_keep):
+        keep = book_keep[simulation.lib_books_indices]
+        libs = np.repeat(np.arange(simulation.num_libs), np.diff(simulation.lib_books_indptr))
+        lib_indptr = np.zeros(simulation.num_libs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(libs[keep], minlength=simulation.num_libs), out=lib_indptr[1:])
+        return lib_indptr, simulation.lib_books_indices[keep]
+
+    def get_csr_rows(self, indptr, indices, rows):
+        starts, ends = indptr[rows], indptr[rows + 1]
+        rows_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(ends - starts, out=rows_indptr[1:])
+        ind = np.repeat(starts - rows_indptr[:-1], ends - starts) + np.arange(rows_indptr[-1])
+        return rows_indptr, indices[ind]
+
+    def map_ordering(self, ind_libs):
+        # Original library ordering in presolved indices, removed libraries are dropped
+        ind_libs = self.lib_map[np.asarray(ind_libs, dtype=np.int64)]
+        return ind_libs[ind_libs >= 0]
+
+    def unmap_ordering(self, ind_libs):
+        return self.lib_ids[np.asarray(ind_libs, dtype=np.int64)]
+
+    def get_original_solution(self, solution=None):
+        if solution is None:
+            self.sync_solution()
+            solution = self.solution
+        libs, lib_indptr, books = encode_solution(solution)
+        return decode_solution(self.lib_ids[libs], lib_indptr, self.book_ids[books])
+
+    def write(self, atomic=True):
+        write_submission_arrays(self.original.number, *encode_solution(self.get_original_solution()), atomic=atomic)
+
+    def read_submission(self):
+        # Books removed by presolve have no points and are dropped, a removed library has no presolved index
+        libs, lib_indptr, books = read_submission_arrays(self.original.number)
+        if np.any(self.lib_map[libs] < 0):
+            raise ValueError("submission signs up libraries removed by presolve")
+        book_keep = self.book_map[books] >= 0
+        lib_num_books = np.bincount(np.repeat(np.arange(len(libs)), np.diff(lib_indptr))[book_keep], minlength=len(libs))
+        lib_indptr = np.zeros(len(libs) + 1, dtype=np.int64)
+        np.cumsum(lib_num_books, out=lib_indptr[1:])
+        self.solution = decode_solution(self.lib_map[libs], lib_indptr, self.book_map[books[book_keep]])
+        self.check_solution()
+
+    def get_stats(self):
+        original = self.original
+        return dict(self.reductions, libs=(original.num_libs, self.num_libs), books=(original.num_books, self.num_books),
+                    pairs=(len(original.lib_books_indices), len(self.lib_books_indices)), time_presolve=self.time_presolve)
+
+
+def presolve(simulation, remove_dominated=False):
+    return Presolved_Simulation(simulation, remove_dominated)
+
+
+if __name__ == "__main__":
+    from greedy import get_greedy_ordering
+    from flow_solver import Flow_solver
+    from lns import get_num_active
+    parser = argparse.ArgumentParser()
+    parser.add_argument("numbers", type=int, nargs="*", default=[0, 1, 2, 3, 4, 5])
+    parser.add_argument("--remove_dominated", action="store_true")
+    args = parser.parse_args()
+    for number in args.numbers:
+        sim = Simulation_Base(number, silent=True)
+        reduced = presolve(sim, args.remove_dominated)
+        print(paths[number], reduced.get_stats())
+        # Same greedy ordering solved on both instances, the presolved one mapped back. Libraries that sign up
+        # after the deadline are cut off, so any violation left is a real one.
+        ind_libs = get_greedy_ordering(sim)
+        ind_libs = ind_libs[:get_num_active(sim, ind_libs)]
+        sim.solution = Flow_solver(sim).get_optimal_books_for_ordered_libs(ind_libs)
+        score, num_violations = sim.get_score(), len(sim.get_violations())
+        reduced.solution = Flow_solver(reduced).get_optimal_books_for_ordered_libs(reduced.map_ordering(ind_libs))
+        sim.solution = reduced.get_original_solution()
+        print("score original {} presolved {} violations original {} presolved {}".format(score, sim.get_score(), num_violations, len(sim.get_violations())))
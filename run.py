@@ -0,0 +1,267 @@
+import os
+import io
+import signal
+import argparse
+import numpy as np
+from time import time
+from simulation import Simulation_Base, paths, write_file, write_submission_arrays
+from scoring import encode_solution
+from energy import Ordering_Energy, get_lib_books_points_cum
+from annealing import Annealer, Geometric_Schedule, Move_Shift, Move_Swap, Move_Explore, Move_Random_Swap
+from flow_solver import Flow_solver
+from greedy import get_greedy_ordering
+from lns import run_lns, get_num_active
+from bounds import Upper_Bound, Gap_Monitor
+from instrumentation import recorder, enable
+
+checkpoint_dir = 'data/checkpoints'
+stages = ['greedy', 'anneal', 'lns']
+
+
+def get_checkpoint_path(number):
+    return os.path.join(checkpoint_dir, os.path.basename(paths[number])[:-4] + ".npz")
+
+def write_checkpoint(path, state):
+    # Same atomic replace as the submissions, a job killed while writing keeps its previous checkpoint
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    buffer = io.BytesIO()
+    np.savez(buffer, **state)
+    write_file(path, buffer.getvalue(), atomic=True)
+
+def read_checkpoint(path):
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+def get_rng_state(rng):
+    name, keys, pos, has_gauss, cached_gaussian = rng.get_state()
+    return {"rng_keys": keys, "rng_pos": pos, "rng_has_gauss": has_gauss, "rng_cached_gaussian": cached_gaussian}
+
+def set_rng_state(rng, state):
+    rng.set_state(("MT19937", state["rng_keys"], int(state["rng_pos"]), int(state["rng_has_gauss"]), float(state["rng_cached_gaussian"])))
+
+
+class Runner():
+    # Runs the stages of a pipeline on one dataset until they finish or the wall clock budget is used up.
+    # The best ordering, the current stage and the annealing state go to a checkpoint every
+    # checkpoint_interval seconds, on SIGTERM/SIGINT and at the end, so a stopped job resumes where it was.
+    # With a gap threshold the run also ends once the best score is that close to the upper bound of bounds.py.
+    def __init__(self, number, pipeline, budget, checkpoint_path=None, checkpoint_interval=300, seed=1337, silent=False, gap=None, bound_time_limit=60):
+        self.t0 = time()
+        self.number = number
+        self.pipeline = pipeline
+        self.budget = budget
+        self.checkpoint_path = get_checkpoint_path(number) if checkpoint_path is None else checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.seed = seed
+        self.silent = silent
+        self.simulation = Simulation_Base(number, silent=True)
+        self.flow = Flow_solver(self.simulation)
+        self.stage = 0
+        self.elapsed_before = 0
+        self.ind_libs = None
+        self.ind_libs_best = None
+        self.score_best = 0
+        self.score_written = 0
+        self.stage_state = dict()
+        self.time_checkpoint = time()
+        self.num_checkpoints = 0
+        self.stopped = False
+        self.gap_monitor = None
+        if gap is not None:
+            bound = Upper_Bound(self.simulation, lp=bound_time_limit > 0, time_limit=bound_time_limit)
+            self.gap_monitor = Gap_Monitor(bound, gap, silent=True)
+            self.log("upper bound", bound.upper_bound, bound.bounds)
+
+    def log(self, *args):
+        if not self.silent:
+            print("[{:8.1f}s]".format(self.get_elapsed()), *args, flush=True)
+
+    def get_elapsed(self):
+        return self.elapsed_before + time() - self.t0
+
+    def get_remaining(self):
+        # The budget is per invocation, a resumed job gets its full budget again
+        return self.budget - (time() - self.t0)
+
+    def should_stop(self):
+        if self.gap_monitor is not None and self.gap_monitor.should_stop():
+            return True
+        return self.stopped or self.get_remaining() <= 0
+
+    def handle_signal(self, signum, frame):
+        self.log("signal", signum, "received, stopping after the current chunk")
+        self.stopped = True
+
+    def resume(self):
+        state = read_checkpoint(self.checkpoint_path)
+        if int(state["number"]) != self.number or list(state["pipeline"]) != list(self.pipeline):
+            raise ValueError("checkpoint {} belongs to dataset {} pipeline {}".format(self.checkpoint_path, int(state["number"]), list(state["pipeline"])))
+        self.stage = int(state["stage"])
+        self.elapsed_before = float(state["elapsed"])
+        self.ind_libs = state["ind_libs"]
+        self.ind_libs_best = state["ind_libs_best"]
+        self.score_best = self.score_written = int(state["score_best"])
+        if self.gap_monitor is not None:
+            self.gap_monitor.update(self.score_best)
+        self.stage_state = {key: value for key, value in state.items() if key.startswith(("anneal_", "rng_"))}
+        self.log("resumed", self.checkpoint_path, "stage", self.pipeline[self.stage] if self.stage < len(self.pipeline) else "done", "score", self.score_best)
+
+    def set_best(self, ind_libs, score):
+        if score > self.score_best:
+            self.score_best = score
+            self.ind_libs_best = np.array(ind_libs)
+            if self.gap_monitor is not None:
+                self.gap_monitor.update(score)
+                self.log("score", score, "gap {:.4%}".format(self.gap_monitor.gap))
+
+    def update_best(self, ind_libs):
+        score = -self.flow.get_energy(ind_libs[:get_num_active(self.simulation, ind_libs)])
+        self.set_best(ind_libs, score)
+        return score
+
+    def checkpoint(self, stage_state=None):
+        if stage_state is not None:
+            self.stage_state = stage_state
+        state = dict(number=self.number, pipeline=np.array(self.pipeline), stage=self.stage, elapsed=self.get_elapsed(),
+                     ind_libs=self.ind_libs, ind_libs_best=self.ind_libs_best, score_best=self.score_best, **self.stage_state)
+        write_checkpoint(self.checkpoint_path, state)
+        self.time_checkpoint = time()
+        self.num_checkpoints += 1
+        recorder.count("run.checkpoints")
+        if self.score_best > self.score_written:
+            self.write()
+        self.log("checkpoint stage", self.pipeline[self.stage] if self.stage < len(self.pipeline) else "done", "score", self.score_best)
+
+    def checkpoint_due(self):
+        return time() - self.time_checkpoint >= self.checkpoint_interval
+
+    def write(self):
+        ind_libs = self.ind_libs_best[:get_num_active(self.simulation, self.ind_libs_best)]
+        self.simulation.solution = self.flow.get_optimal_books_for_ordered_libs(ind_libs)
+        write_submission_arrays(self.number, *encode_solution(self.simulation.solution), atomic=True)
+        self.score_written = self.score_best
+
+    def run_greedy(self, args):
+        self.ind_libs = get_greedy_ordering(self.simulation)
+        self.update_best(self.ind_libs)
+
+    def get_moves(self, args, ind_libs, boundary):
+        # Moves of Solver_E around the deadline when there are libraries behind it, plain random swaps otherwise
+        if boundary < len(ind_libs):
+            return [Move_Shift(boundary, args.max_distance), Move_Swap(boundary, args.max_distance), Move_Explore(boundary)]
+        return [Move_Random_Swap()]
+
+    def run_anneal(self, args):
+        lib_books_points_cum = get_lib_books_points_cum(self.simulation, args.exponent)
+        energy = Ordering_Energy(self.simulation.num_days, self.simulation.lib_days, self.simulation.lib_ships, lib_books_points_cum, self.ind_libs)
+        # The boundary is fixed at the start of the stage and kept in the checkpoint, so a resumed run draws the same moves
+        boundary = int(self.stage_state.get("anneal_boundary", get_num_active(self.simulation, self.ind_libs) + args.boundary_margin))
+        annealer = Annealer(energy, self.get_moves(args, self.ind_libs, boundary), args.temperature, Geometric_Schedule(args.factor, args.interval),
+                            seed=self.seed, num_tries=args.num_tries, rule=args.rule)
+        if "anneal_step" in self.stage_state:
+            annealer.step = int(self.stage_state["anneal_step"])
+            annealer.temperature = float(self.stage_state["anneal_temperature"])
+            annealer.energy_best = float(self.stage_state["anneal_energy_best"])
+            annealer.ind_libs_best = self.stage_state["anneal_ind_libs_best"]
+            set_rng_state(annealer.rng, self.stage_state)
+
+        def get_state():
+            return dict(anneal_boundary=boundary, anneal_step=annealer.step, anneal_temperature=annealer.temperature, anneal_energy_best=annealer.energy_best,
+                        anneal_ind_libs_best=annealer.ind_libs_best, **get_rng_state(annealer.rng))
+
+        while annealer.step < args.num_steps and not self.should_stop():
+            annealer.run(min(args.chunk_steps, args.num_steps - annealer.step))
+            self.ind_libs = energy.ind_libs
+            if self.checkpoint_due():
+                self.update_best(annealer.ind_libs_best)
+                self.log("anneal step", annealer.step, "energy", energy.energy, "temperature", annealer.temperature)
+                self.checkpoint(get_state())
+        self.update_best(annealer.ind_libs_best)
+        if annealer.step < args.num_steps:
+            return get_state()
+        self.ind_libs = np.array(annealer.ind_libs_best)
+
+    def run_lns(self, args):
+        def callback(ind_libs, energy):
+            self.ind_libs = ind_libs
+            self.set_best(ind_libs, -energy)
+            if self.checkpoint_due():
+                self.checkpoint()
+            return self.should_stop()
+
+        remaining = self.get_remaining()
+        if remaining > 0:
+            # The search and every window in it end with the budget, windows still running are dropped with the pool
+            self.ind_libs, energy = run_lns(self.number, self.ind_libs, args.window, remaining, min(args.time_limit, remaining),
+                                            num_workers=args.num_workers, silent=self.silent, callback=callback)
+            self.update_best(self.ind_libs)
+        return None if not self.should_stop() else dict()
+
+    def run(self, args):
+        previous_handlers = {signum: signal.signal(signum, self.handle_signal) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            if self.ind_libs is None:
+                # Without a greedy stage the pipeline starts from the libraries sorted by signup days
+                self.ind_libs = np.argsort(self.simulation.lib_days, kind='stable')
+                self.update_best(self.ind_libs)
+            while self.stage < len(self.pipeline) and not self.should_stop():
+                name = self.pipeline[self.stage]
+                self.log("stage", name)
+                with recorder.phase("run." + name):
+                    stage_state = getattr(self, "run_" + name)(args)
+                if stage_state is not None:
+                    # Stage interrupted, its state goes into the checkpoint and it continues on resume
+                    self.checkpoint(stage_state)
+                    break
+                self.stage += 1
+                self.stage_state = dict()
+                self.checkpoint()
+            else:
+                # Stopped before a stage ran, e.g. when the starting ordering already closes the gap
+                if self.num_checkpoints == 0 or self.score_best > self.score_written:
+                    self.checkpoint()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        return self.ind_libs_best, self.score_best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("number", type=int)
+    parser.add_argument("--pipeline", type=str, nargs="+", choices=stages, default=['greedy', 'anneal', 'lns'])
+    parser.add_argument("--budget", type=float, default=3600)
+    parser.add_argument("--checkpoint", type=str, default=None)
+    parser.add_argument("--checkpoint_interval", type=float, default=300)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--silent", action="store_true")
+    parser.add_argument("--report", type=str, default=None)
+    parser.add_argument("--gap", type=float, default=None)
+    parser.add_argument("--bound_time_limit", type=float, default=60)
+    # Annealing stage
+    parser.add_argument("--num_steps", type=int, default=2000000)
+    parser.add_argument("--chunk_steps", type=int, default=10000)
+    parser.add_argument("--temperature", type=float, default=50000)
+    parser.add_argument("--factor", type=float, default=1.05)
+    parser.add_argument("--interval", type=int, default=10000)
+    parser.add_argument("--exponent", type=float, default=1)
+    parser.add_argument("--boundary_margin", type=int, default=10)
+    parser.add_argument("--max_distance", type=int, default=20)
+    parser.add_argument("--num_tries", type=int, default=1)
+    parser.add_argument("--rule", type=str, choices=["mtm", "best"], default="mtm")
+    # LNS stage
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument("--time_limit", type=float, default=60)
+    parser.add_argument("--num_workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.report is not None:
+        enable()
+    runner = Runner(args.number, args.pipeline, args.budget, args.checkpoint, args.checkpoint_interval, args.seed, args.silent, args.gap, args.bound_time_limit)
+    if args.resume and os.path.exists(runner.checkpoint_path):
+        runner.resume()
+    ind_libs_best, score_best = runner.run(args)
+    print(paths[args.number], score_best)
+    if args.report is not None:
+        recorder.dump(args.report)
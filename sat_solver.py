@@ -0,0 +1,264 @@
+import argparse
+import numpy as np
+from multiprocessing import Pool, TimeoutError, cpu_count
+from time import time
+from simulation import Simulation_Base
+from instrumentation import recorder
+
+try:
+    from pycryptosat import Solver as Cryptosat_Solver
+except ImportError:
+    Cryptosat_Solver = None
+
+try:
+    from pysat.solvers import Solver as Pysat_Solver
+except ImportError:
+    Pysat_Solver = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+class Library_CNF():
+    # Every book in exactly two libraries becomes a variable that picks one of them (positive literal the
+    # first, negative the second), every book in three libraries a clause that at least one of them is picked
+    def __init__(self, simulation):
+        book_num_libs = np.diff(simulation.book_libs_indptr)
+        self.num_libs = simulation.num_libs
+        ind_books2 = np.flatnonzero(book_num_libs == 2)
+        ind_books3 = np.flatnonzero(book_num_libs == 3)
+        libs2 = simulation.book_libs_indices[simulation.book_libs_indptr[ind_books2][:, None] + np.arange(2)]
+        libs3 = simulation.book_libs_indices[simulation.book_libs_indptr[ind_books3][:, None] + np.arange(3)]
+        self.num_variables = len(ind_books2)
+        self.variable_libs = libs2
+
+        self.lib_literal = np.zeros(self.num_libs, dtype=np.int32)
+        variables = np.arange(1, self.num_variables + 1, dtype=np.int32)
+        self.lib_literal[libs2[:, 0]] = variables
+        self.lib_literal[libs2[:, 1]] = -variables
+        if len(np.unique(libs2)) != 2 * self.num_variables:
+            raise ValueError("every library has to belong to exactly one book with two libraries")
+        self.clauses = self.lib_literal[libs3]
+        if (self.clauses == 0).any():
+            raise ValueError("book with three libraries references a library without variable")
+
+    def write_dimacs(self, path, chunk_size=2**16):
+        # Clauses go out in chunks, so the text of the whole formula never has to be in memory
+        with open(path, 'w') as f:
+            f.write("p cnf {} {}\n".format(self.num_variables, len(self.clauses)))
+            for start in range(0, len(self.clauses), chunk_size):
+                chunk = self.clauses[start:start+chunk_size]
+                np.savetxt(f, np.column_stack([chunk, np.zeros(len(chunk), dtype=np.int32)]), fmt="%d")
+
+    def get_libs(self, assignment):
+        # assignment[variable] is True if the first library of the variable is picked
+        return np.where(assignment[1:], self.variable_libs[:, 0], self.variable_libs[:, 1])
+
+    def is_satisfied(self, assignment):
+        values = assignment[np.abs(self.clauses)] == (self.clauses > 0)
+        return bool(values.any(axis=1).all())
+
+
+def probsat(num_variables, clauses, seed, max_flips, cb=2.38, eps=1.0):
+    # Local search of Balint and Schoening: flip a variable of a random unsatisfied clause, chosen with
+    # probability (eps + break)^-cb, where break counts the clauses that would become unsatisfied
+    np.random.seed(seed)
+    num_clauses, width = clauses.shape
+    # Occurrences of every literal, literal index 2 * variable + (literal < 0)
+    num_literals = 2 * (num_variables + 1)
+    counts = np.zeros(num_literals + 1, dtype=np.int64)
+    for c in range(num_clauses):
+        for k in range(width):
+            lit = clauses[c, k]
+            counts[2 * abs(lit) + (lit < 0) + 1] += 1
+    occ_indptr = np.cumsum(counts)
+    occ = np.empty(occ_indptr[-1], dtype=np.int64)
+    fill = occ_indptr[:-1].copy()
+    for c in range(num_clauses):
+        for k in range(width):
+            lit = clauses[c, k]
+            ind = 2 * abs(lit) + (lit < 0)
+            occ[fill[ind]] = c
+            fill[ind] += 1
+
+    assignment = np.random.rand(num_variables + 1) < 0.5
+    num_true = np.zeros(num_clauses, dtype=np.int64)
+    unsat = np.empty(num_clauses, dtype=np.int64)
+    unsat_pos = np.full(num_clauses, -1, dtype=np.int64)
+    num_unsat = 0
+    for c in range(num_clauses):
+        for k in range(width):
+            lit = clauses[c, k]
+            if assignment[abs(lit)] == (lit > 0):
+                num_true[c] += 1
+        if num_true[c] == 0:
+            unsat[num_unsat] = c
+            unsat_pos[c] = num_unsat
+            num_unsat += 1
+
+    probs = np.empty(width)
+    for flip in range(max_flips):
+        if num_unsat == 0:
+            return assignment, 0, flip
+        c = unsat[np.random.randint(num_unsat)]
+        total = 0.0
+        for k in range(width):
+            var = abs(clauses[c, k])
+            # Clauses that only the current literal of var satisfies break when var flips
+            true_ind = 2 * var + (not assignment[var])
+            num_break = 0
+            for j in range(occ_indptr[true_ind], occ_indptr[true_ind + 1]):
+                if num_true[occ[j]] == 1:
+                    num_break += 1
+            probs[k] = (eps + num_break) ** -cb
+            total += probs[k]
+        r = np.random.rand() * total
+        k = 0
+        while k < width - 1 and r >= probs[k]:
+            r -= probs[k]
+            k += 1
+        var = abs(clauses[c, k])
+        true_ind = 2 * var + (not assignment[var])
+        false_ind = 2 * var + assignment[var]
+        assignment[var] = not assignment[var]
+        for j in range(occ_indptr[false_ind], occ_indptr[false_ind + 1]):
+            d = occ[j]
+            num_true[d] += 1
+            if num_true[d] == 1:
+                last = unsat[num_unsat - 1]
+                unsat[unsat_pos[d]] = last
+                unsat_pos[last] = unsat_pos[d]
+                unsat_pos[d] = -1
+                num_unsat -= 1
+        for j in range(occ_indptr[true_ind], occ_indptr[true_ind + 1]):
+            d = occ[j]
+            num_true[d] -= 1
+            if num_true[d] == 0:
+                unsat[num_unsat] = d
+                unsat_pos[d] = num_unsat
+                num_unsat += 1
+    return assignment, num_unsat, max_flips
+
+if njit is not None:
+    probsat_compiled = njit(cache=True)(probsat)
+else:
+    # Same loop in plain Python, orders of magnitude slower, so get_backends only offers probsat with numba
+    probsat_compiled = probsat
+
+
+def read_dimacs(path):
+    # Clauses of a DIMACS file as a flat int32 buffer, each clause terminated by 0
+    with open(path, 'r') as f:
+        lines = [line for line in f if not line.startswith(("c", "p"))]
+    return np.fromstring("".join(lines), dtype=np.int32, sep=' ')
+
+def shuffle_clauses(clauses, seed):
+    # Same formula in another clause and literal order, which sends CDCL solvers down different search paths
+    rng = np.random.RandomState(seed)
+    clauses = clauses[rng.permutation(len(clauses))]
+    return np.take_along_axis(clauses, np.argsort(rng.rand(*clauses.shape), axis=1), axis=1)
+
+def solve_instance(args):
+    # satisfied is True or False for a proven answer, None if the backend gave up
+    backend, num_variables, clauses, seed, max_flips, max_tries = args
+    t0 = time()
+    clauses = shuffle_clauses(clauses, seed)
+    if backend == "probsat":
+        # Restarts with a new seed until a solution is found or max_tries runs failed, the portfolio stops it otherwise.
+        # Local search cannot prove a formula unsatisfiable, it only gives up.
+        clauses = clauses.astype(np.int64)
+        satisfied = None
+        restart = 0
+        while max_tries is None or restart < max_tries:
+            assignment, num_unsat, num_flips = probsat_compiled(num_variables, clauses, (seed + restart) % 2**32, max_flips)
+            if num_unsat == 0:
+                satisfied = True
+                break
+            restart += 1
+        if satisfied is None:
+            assignment = None
+    elif backend == "cryptosat":
+        solver = Cryptosat_Solver(threads=1)
+        solver.add_clauses(clauses.tolist())
+        satisfied, solution = solver.solve()
+        assignment = np.array([False] + list(solution[1:]), dtype=bool) if satisfied else None
+    else:
+        with Pysat_Solver(name=backend, bootstrap_with=clauses.tolist()) as solver:
+            satisfied = solver.solve()
+            assignment = None
+            if satisfied:
+                assignment = np.zeros(num_variables + 1, dtype=bool)
+                model = np.array(solver.get_model())
+                assignment[np.abs(model)] = model > 0
+    return backend, seed, satisfied, assignment, time() - t0
+
+def get_backends():
+    backends = []
+    if njit is not None:
+        backends.append("probsat")
+    if Cryptosat_Solver is not None:
+        backends.append("cryptosat")
+    if Pysat_Solver is not None:
+        backends += ["cadical153", "glucose4", "minisat22"]
+    return backends
+
+def run_portfolio(cnf, backends=None, num_instances=None, seed=1337, num_workers=None, max_flips=10**8, max_tries=10, timeout=None):
+    # Differently seeded instances of all backends in parallel, the first one that finds an answer wins. Instances
+    # that give up do not count, satisfied is None if all of them gave up or no answer came within timeout seconds.
+    # probsat gives up after max_tries restarts, it cannot prove a formula unsatisfiable.
+    if backends is None:
+        backends = get_backends()
+    if not backends:
+        raise ImportError("the SAT portfolio needs pycryptosat or python-sat")
+    if num_workers is None:
+        num_workers = cpu_count()
+    if num_instances is None:
+        num_instances = max(num_workers, len(backends))
+    seeds = np.random.SeedSequence(seed).generate_state(num_instances)
+    tasks = [(backends[i % len(backends)], cnf.num_variables, cnf.clauses, int(instance_seed), max_flips, max_tries) for i, instance_seed in enumerate(seeds)]
+
+    t0 = time()
+    deadline = None if timeout is None else t0 + timeout
+    backend, instance_seed, satisfied, assignment, seconds = None, None, None, None, None
+    pool = Pool(num_workers)
+    try:
+        results = pool.imap_unordered(solve_instance, tasks)
+        while True:
+            try:
+                backend, instance_seed, satisfied, assignment, seconds = results.next(timeout=None if deadline is None else max(deadline - time(), 0))
+            except (StopIteration, TimeoutError):
+                break
+            if satisfied is True or satisfied is False:
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+    time_to_solution = time() - t0
+    recorder.add_time("sat.portfolio", time_to_solution)
+    recorder.set("sat.backend", backend)
+    return satisfied, assignment, {"backend": backend, "seed": instance_seed, "time_solve": seconds, "time_to_solution": time_to_solution}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=3)
+    parser.add_argument("--dimacs", type=str, default=None)
+    parser.add_argument("--backends", type=str, nargs="*", default=None)
+    parser.add_argument("--num_instances", type=int, default=None)
+    parser.add_argument("--num_workers", type=int, default=None)
+    parser.add_argument("--max_tries", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=None)
+    args = parser.parse_args()
+    t0 = time()
+    sim = Simulation_Base(args.number, silent=True)
+    cnf = Library_CNF(sim)
+    print("variables {} clauses {} build {:.3f}s".format(cnf.num_variables, len(cnf.clauses), time() - t0))
+    if args.dimacs is not None:
+        cnf.write_dimacs(args.dimacs)
+    satisfied, assignment, stats = run_portfolio(cnf, args.backends, args.num_instances, num_workers=args.num_workers, max_tries=args.max_tries, timeout=args.timeout)
+    print("satisfied", satisfied, stats)
+    if satisfied:
+        ind_libs = cnf.get_libs(assignment)
+        print("libs {} formula satisfied {} total {:.3f}s".format(len(ind_libs), cnf.is_satisfied(assignment), time() - t0))
@@ -0,0 +1,120 @@
+import numpy as np
+from collections import namedtuple
+
+# kind is one of the keys of violation_kinds, position is the index of the library in the solution
+Violation = namedtuple("Violation", ["kind", "position", "lib", "value"])
+
+violation_kinds = {
+    "lib_out_of_range": "library id does not exist",
+    "book_out_of_range": "book id does not exist",
+    "lib_used": "library signed up more than once",
+    "no_days": "no days remaining to sign up library",
+    "book_not_in_lib": "book is not in library",
+    "book_repeated": "book shipped multiple times by library",
+    "too_many_books": "more books than library can ship",
+}
+
+
+def encode_solution(solution):
+    # Flat encoding of [(lib, books), ...]: books of libs[i] are books[lib_indptr[i]:lib_indptr[i+1]]
+    libs = np.array([lib for lib, books in solution], dtype=np.int64)
+    lib_num_books = [len(books) for lib, books in solution]
+    lib_indptr = np.zeros(len(solution) + 1, dtype=np.int64)
+    np.cumsum(lib_num_books, out=lib_indptr[1:])
+    books = np.fromiter((book for lib, books in solution for book in books), dtype=np.int64, count=lib_indptr[-1])
+    return libs, lib_indptr, books
+
+def decode_solution(libs, lib_indptr, books):
+    books = books.tolist()
+    lib_indptr = lib_indptr.tolist()
+    return [(lib, books[lib_indptr[i]:lib_indptr[i+1]]) for i, lib in enumerate(libs.tolist())]
+
+
+class Solution_Scorer():
+    def __init__(self, simulation):
+        self.num_books = simulation.num_books
+        self.num_libs = simulation.num_libs
+        self.num_days = simulation.num_days
+        self.book_points = simulation.book_points
+        self.lib_days = simulation.lib_days
+        self.lib_ships = simulation.lib_ships
+        # Sorted lib * num_books + book keys of all CSR entries for membership lookups
+        lib_num_books = np.diff(simulation.lib_books_indptr)
+        pair_libs = np.repeat(np.arange(self.num_libs, dtype=np.int64), lib_num_books)
+        self.pair_keys = np.sort(pair_libs * self.num_books + simulation.lib_books_indices)
+
+    def get_score(self, encoded):
+        libs, lib_indptr, books = encoded
+        scanned = np.zeros(self.num_books, dtype=bool)
+        scanned[books] = True
+        return int(self.book_points[scanned].sum())
+
+    def get_scores(self, encodings, max_mask_size=2**26):
+        # One scanned mask row per solution, as many rows at once as fit into max_mask_size
+        scores = np.zeros(len(encodings), dtype=np.int64)
+        num_rows = max(1, max_mask_size // self.num_books)
+        for start in range(0, len(encodings), num_rows):
+            chunk = encodings[start:start+num_rows]
+            rows = np.repeat(np.arange(len(chunk)), [len(books) for libs, lib_indptr, books in chunk])
+            scanned = np.zeros((len(chunk), self.num_books), dtype=bool)
+            scanned[rows, np.concatenate([books for libs, lib_indptr, books in chunk])] = True
+            scores[start:start+len(chunk)] = scanned @ self.book_points
+        return scores
+
+    def is_member(self, libs, books):
+        keys = libs * self.num_books + books
+        ind = np.minimum(np.searchsorted(self.pair_keys, keys), len(self.pair_keys) - 1)
+        return self.pair_keys[ind] == keys
+
+    def is_member_book(self, lib, book):
+        # Scalar is_member without array temporaries
+        key = lib * self.num_books + book
+        ind = int(self.pair_keys.searchsorted(key))
+        return ind < len(self.pair_keys) and int(self.pair_keys[ind]) == key
+
+    def check_solution(self, encoded):
+        # Every violation of the solution, an empty list means it is valid
+        libs, lib_indptr, books = encoded
+        violations = []
+        num_solution_libs = len(libs)
+        lib_num_books = np.diff(lib_indptr)
+        positions = np.repeat(np.arange(num_solution_libs), lib_num_books)
+
+        for ind in np.flatnonzero((libs < 0) | (libs >= self.num_libs)).tolist():
+            violations.append(Violation("lib_out_of_range", ind, int(libs[ind]), None))
+        for ind in np.flatnonzero((books < 0) | (books >= self.num_books)).tolist():
+            violations.append(Violation("book_out_of_range", int(positions[ind]), int(libs[positions[ind]]), int(books[ind])))
+        if violations:
+            # The other checks index the instance arrays with these ids
+            return violations
+
+        first_use = np.zeros(num_solution_libs, dtype=bool)
+        first_use[np.unique(libs, return_index=True)[1]] = True
+        for ind in np.flatnonzero(~first_use).tolist():
+            violations.append(Violation("lib_used", ind, int(libs[ind]), None))
+
+        days_remaining = self.num_days - np.cumsum(self.lib_days[libs])
+        for ind in np.flatnonzero(days_remaining < 0).tolist():
+            violations.append(Violation("no_days", ind, int(libs[ind]), int(days_remaining[ind])))
+
+        pair_libs = libs[positions]
+        for ind in np.flatnonzero(~self.is_member(pair_libs, books)).tolist():
+            violations.append(Violation("book_not_in_lib", int(positions[ind]), int(pair_libs[ind]), int(books[ind])))
+
+        keys, counts = np.unique(positions * self.num_books + books, return_counts=True)
+        for key in keys[counts > 1].tolist():
+            position, book = divmod(key, self.num_books)
+            violations.append(Violation("book_repeated", position, int(libs[position]), book))
+
+        lib_num_books_available = self.lib_ships[libs] * days_remaining
+        for ind in np.flatnonzero((days_remaining >= 0) & (lib_num_books > lib_num_books_available)).tolist():
+            violations.append(Violation("too_many_books", ind, int(libs[ind]), int(lib_num_books[ind])))
+        return violations
+
+    def check_solutions(self, encodings):
+        return [self.check_solution(encoded) for encoded in encodings]
+
+
+def print_violations(violations):
+    for violation in violations:
+        print("fail, {}: position {}, lib {}, value {}".format(violation_kinds[violation.kind], violation.position, violation.lib, violation.value))
@@ -1,62 +1,254 @@
+import os
+import json
+import hashlib
+import tempfile
+import shutil
 import numpy as np
+from functools import cached_property
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
+from scoring import Solution_Scorer, encode_solution, decode_solution, print_violations
+from solution import Solution_Builder
 
 paths = ['data/a_example.txt', 'data/b_read_on.txt', 'data/c_incunabula.txt', 'data/d_tough_choices.txt', 'data/e_so_many_books.txt', 'data/f_libraries_of_the_world.txt']
 length_paths = len(paths)
+cache_dir = 'data/cache'
+# Part of the cache directory name, bumped whenever read() changes the arrays so older caches are rebuilt
+cache_version = 2
+cache_arrays = ['book_points', 'lib_num_books', 'lib_days', 'lib_ships', 'lib_books_indptr', 'lib_books_indices', 'book_libs_indptr', 'book_libs_indices']
+
+def get_path(number):
+    # Instances are given by their index in paths or, like generated ones, by the path of their file
+    if number is None:
+        raise ValueError("instance has no file, a presolved instance cannot be loaded again from its number")
+    if isinstance(number, str):
+        return number
+    return paths[number]
+
+def get_submission_path(number):
+    return get_path(number)[:-4]+"_out.txt"
+
+def write_file(path, data, atomic=False):
+    if not atomic:
+        with open(path, 'wb') as f:
+            f.write(data)
+        return
+    # Written next to the target and renamed over it, an interrupted write leaves the old file intact
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def write(number, list_lists, atomic=False):
+    lines = [" ".join(map(str, lis)) for lis in list_lists]
+    write_file(get_submission_path(number), ("\n".join(lines) + "\n").encode(), atomic)
 
-def write(number, list_lists):
-    path = paths[number][:-4]+"_out.txt"
-    with open(path, 'w') as f:    
-        for lis in list_lists:
-            for e in lis[:-1]:
-                f.write(str(e) + " ")
-            f.write(str(lis[-1]) + "\n")
-        f.close()
-        
 def line_to_ints(line):
     return [int(s) for s in line.split(" ")]  
 
-def read_submission(number):
-    path = paths[number][:-4]+"_out.txt"
-    solution = []
-    with open(path, 'r') as f:    
-        num_libs = line_to_ints(f.readline())[0]
-        for i in range(num_libs):
-            lib, _ = line_to_ints(f.readline())
-            books = line_to_ints(f.readline())
-            solution.append((lib, books))
-        f.close()    
-    return solution
+def format_ints(values, seps):
+    # ASCII digits of non negative ints, each followed by its separator byte, without a str() per int
+    values = np.asarray(values, dtype=np.int64)
+    num_digits = np.ones(len(values), dtype=np.int64)
+    power = 10
+    while len(values) and power <= values.max():
+        num_digits += values >= power
+        power *= 10
+    ends = np.cumsum(num_digits + 1)
+    data = np.empty(ends[-1] if len(values) else 0, dtype=np.uint8)
+    data[ends - 1] = seps
+    rest = values.copy()
+    for digit in range(int(num_digits.max()) if len(values) else 0):
+        active = num_digits > digit
+        data[ends[active] - 2 - digit] = 48 + rest[active] % 10
+        rest //= 10
+    return data.tobytes()
 
-def read(number):
-    path = paths[number]
+def format_submission(libs, lib_indptr, books):
+    # The whole file as one int array [num_libs, lib, num_books, books..., lib, ...], libraries without books are left out
+    lib_num_books = np.diff(lib_indptr)
+    keep = lib_num_books > 0
+    libs, lib_num_books = libs[keep], lib_num_books[keep]
+    starts = 1 + np.cumsum(lib_num_books + 2) - (lib_num_books + 2)
+    values = np.empty(1 + (lib_num_books + 2).sum(), dtype=np.int64)
+    is_book = np.ones(len(values), dtype=bool)
+    is_book[[0]] = False
+    is_book[starts] = False
+    is_book[starts + 1] = False
+    values[0] = len(libs)
+    values[starts] = libs
+    values[starts + 1] = lib_num_books
+    values[is_book] = books[np.repeat(keep, np.diff(lib_indptr))]
+    seps = np.full(len(values), ord(" "), dtype=np.uint8)
+    seps[0] = ord("\n")
+    seps[starts + 1] = ord("\n")
+    seps[starts + 1 + lib_num_books] = ord("\n")
+    return format_ints(values, seps)
+
+def write_submission_arrays(number, libs, lib_indptr, books, atomic=True, path=None):
+    if path is None:
+        path = get_submission_path(number)
+    write_file(path, format_submission(libs, lib_indptr, books), atomic)
+
+def read_submission_arrays(number, path=None):
+    # Flat (libs, lib_indptr, books) encoding of scoring.py, parsed in one pass over all integers
+    if path is None:
+        path = get_submission_path(number)
+    ints = read_ints(path)
+    values = ints.tolist()
+    num_libs = values[0]
+    # Only the header lines are walked in Python, the books are taken with one mask
+    starts = []
+    pos = 1
+    for _ in range(num_libs):
+        starts.append(pos)
+        pos += 2 + values[pos+1]
+    starts = np.array(starts, dtype=np.int64)
+    libs = ints[starts]
+    lib_indptr = np.zeros(num_libs + 1, dtype=np.int64)
+    np.cumsum(ints[starts + 1], out=lib_indptr[1:])
+    is_book = np.ones(len(ints), dtype=bool)
+    is_book[[0]] = False
+    is_book[starts] = False
+    is_book[starts + 1] = False
+    return libs, lib_indptr, ints[is_book]
+
+def read_submission(number, path=None):
+    return decode_solution(*read_submission_arrays(number, path))
+
+def read_ints(path):
     with open(path, 'r') as f:
-        num_books, num_libs, num_days = line_to_ints(f.readline())
-        book_points = line_to_ints(f.readline())
-        lib_books_lists = []
-        lib_num_books = []
-        lib_days = []
-        lib_ships = []
-        for lib in range(num_libs):
-            lib_num_book, lib_day, lib_ship = line_to_ints(f.readline())
-            lib_num_books.append(lib_num_book)
-            lib_days.append(lib_day)
-            lib_ships.append(lib_ship)
-            lib_books_lists.append(line_to_ints(f.readline()))
-
-        book_points = np.array(book_points)
-        lib_num_books = np.array(lib_num_books)
-        lib_days = np.array(lib_days)
-        lib_ships = np.array(lib_ships)
-            
-    return num_books, num_libs, num_days, book_points, lib_num_books, lib_days, lib_ships, lib_books_lists
+        return np.fromstring(f.read(), dtype=np.int64, sep=' ')
+
+def get_csr_transpose(indptr, indices, num_cols):
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    indptr_transposed = np.zeros(num_cols + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=num_cols), out=indptr_transposed[1:])
+    return indptr_transposed, rows[order]
+
+def get_csr_lists(indptr, indices):
+    indices = indices.tolist()
+    indptr = indptr.tolist()
+    return [indices[lo:hi] for lo, hi in zip(indptr[:-1], indptr[1:])]
+
+def read(number):
+    ints = read_ints(get_path(number))
+    num_books, num_libs, num_days = [int(i) for i in ints[:3]]
+    book_points = ints[3:3+num_books]
+    
+    # Library blocks have variable length, only their start positions need a sequential pass
+    lib_starts = np.zeros(num_libs, dtype=np.int64)
+    pos = 3 + num_books
+    for lib in range(num_libs):
+        lib_starts[lib] = pos
+        pos += 3 + int(ints[pos])
+    lib_num_books = ints[lib_starts]
+    lib_days = ints[lib_starts + 1]
+    lib_ships = ints[lib_starts + 2]
+    
+    lib_books_indptr = np.zeros(num_libs + 1, dtype=np.int64)
+    np.cumsum(lib_num_books, out=lib_books_indptr[1:])
+    offsets = np.repeat(lib_starts + 3 - lib_books_indptr[:-1], lib_num_books)
+    lib_books_indices = ints[offsets + np.arange(lib_books_indptr[-1])]
+    
+    # Books of every library sorted by points, highest first
+    ind_lib = np.repeat(np.arange(num_libs), lib_num_books)
+    order = np.lexsort((-book_points[lib_books_indices], ind_lib))
+    lib_books_sorted = lib_books_indices[order]
+    # Tied books decide which of them get picked later on, libraries with ties keep the order of the original
+    # per library argsort()[::-1]
+    points_sorted = book_points[lib_books_sorted]
+    tied = (points_sorted[1:] == points_sorted[:-1]) & (ind_lib[1:] == ind_lib[:-1])
+    for lib in np.unique(ind_lib[1:][tied]).tolist():
+        books = lib_books_indices[lib_books_indptr[lib]:lib_books_indptr[lib+1]]
+        lib_books_sorted[lib_books_indptr[lib]:lib_books_indptr[lib+1]] = books[np.argsort(book_points[books])[::-1]]
+    lib_books_indices = lib_books_sorted
+    
+    return num_books, num_libs, num_days, book_points, lib_num_books, lib_days, lib_ships, lib_books_indptr, lib_books_indices
+
+def get_file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def get_cache_directory(file_hash):
+    return os.path.join(cache_dir, "{}-v{}".format(file_hash, cache_version))
+
+def get_cache_index_path(number):
+    name = os.path.basename(get_path(number))[:-4]
+    return os.path.join(cache_dir, name + ".json")
+
+def read_cache(number):
+    index_path = get_cache_index_path(number)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+    stat = os.stat(get_path(number))
+    # The hash is only recomputed when size or mtime of the source file changed
+    if index["mtime"] != stat.st_mtime_ns or index["size"] != stat.st_size:
+        if index["hash"] != get_file_hash(get_path(number)):
+            return None
+        write_cache_index(number, index["hash"], index["header"])
+    directory = get_cache_directory(index["hash"])
+    try:
+        # Plain ndarray views of the mapping, indexing np.memmap itself is several times slower in hot loops
+        arrays = [np.asarray(np.load(os.path.join(directory, name + ".npy"), mmap_mode='r')) for name in cache_arrays]
+    except (OSError, ValueError):
+        return None
+    return tuple(index["header"]) + tuple(arrays)
+
+def write_cache_index(number, file_hash, header):
+    stat = os.stat(get_path(number))
+    index = {"hash": file_hash, "mtime": stat.st_mtime_ns, "size": stat.st_size, "header": header}
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, get_cache_index_path(number))
+
+def write_cache(number, instance):
+    os.makedirs(cache_dir, exist_ok=True)
+    file_hash = get_file_hash(get_path(number))
+    directory = get_cache_directory(file_hash)
+    if not os.path.exists(directory):
+        # Arrays are written into a private directory first, so concurrent workers never see partial files
+        tmp_directory = tempfile.mkdtemp(dir=cache_dir)
+        for name, array in zip(cache_arrays, instance[3:]):
+            np.save(os.path.join(tmp_directory, name + ".npy"), np.ascontiguousarray(array))
+        try:
+            os.rename(tmp_directory, directory)
+        except OSError:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+    write_cache_index(number, file_hash, [int(i) for i in instance[:3]])
+
+def load(number, use_cache=True):
+    if use_cache:
+        instance = read_cache(number)
+        if instance is not None:
+            return instance
+    num_books, num_libs, num_days, book_points, lib_num_books, lib_days, lib_ships, lib_books_indptr, lib_books_indices = read(number)
+    book_libs_indptr, book_libs_indices = get_csr_transpose(lib_books_indptr, lib_books_indices, num_books)
+    instance = (num_books, num_libs, num_days, book_points, lib_num_books, lib_days, lib_ships, lib_books_indptr, lib_books_indices, book_libs_indptr, book_libs_indices)
+    if use_cache:
+        write_cache(number, instance)
+        return read_cache(number)
+    return instance
 
 
 class Simulation_Base():
     
     def transform_solution_into_submission(self):
+        self.sync_solution()
         self.submission = [[0]]
         for lib, books in self.solution:
             if len(books) > 0:
@@ -64,90 +256,59 @@ class Simulation_Base():
                 self.submission.append([lib, len(books)])
                 self.submission.append(books)
             
-    def write(self):
-        self.transform_solution_into_submission()
-        write(self.number, self.submission)
+    def write(self, atomic=True):
+        self.sync_solution()
+        write_submission_arrays(self.number, *encode_solution(self.solution), atomic=atomic)
         
     def read_submission(self):
         self.solution = read_submission(self.number)
         self.check_solution()
         
     def get_score(self):
-        set_books = set()
-        for lib, books in self.solution:
-            for book in books:
-                set_books.add(book)
-        ind_books = np.array(list(set_books))
-        if len(ind_books) > 0:
-            return np.sum(self.book_points[ind_books])
-        return 0
+        self.sync_solution()
+        return self.scorer.get_score(encode_solution(self.solution))
+    
+    def get_violations(self):
+        self.sync_solution()
+        return self.scorer.check_solution(encode_solution(self.solution))
     
     def check_solution(self):
-        libs_used = set()
-        days_remaining = self.num_days
-        for lib, books in self.solution:
-            if lib in libs_used:
-                print("fail, lib already used", lib)
-                return False
-            days_remaining -= self.lib_days[lib]
-            if days_remaining < 0:
-                print("fail, no days remaining to add lib", days_remaining)
-                return False
-            if len(set(books).difference(self.lib_books_sets[lib])) > 0:
-                print("fail, books are not in bib", set(books).difference(self.lib_books_sets))
-                return False
-            if len(set(books)) != len(books):
-                print("fail, book used multiple times in lib", books)
-                return False
-            if len(books) > self.lib_ships[lib] * days_remaining:
-                print("fail, to many books for this lib", len(books), days_remaining, self.lib_ships[lib])
-                return False
-        return True
+        violations = self.get_violations()
+        print_violations(violations)
+        return len(violations) == 0
     
     def init_solution(self):
         self.solution = []
-        self.lib_books_used = [set() for _ in range(self.num_libs)]
-        self.lib_ind_counter = 0
-        self.lib_ind = np.zeros(self.num_libs, dtype=int) - 1
-        self.time_solution_left = self.num_days
-        self.lib_remaining_books_ship = np.zeros(self.num_libs, dtype=int) - 1
-        self.libs_used = set()
+        self.solution_builder = Solution_Builder(self, self.scorer)
+    
+    @property
+    def solution(self):
+        return self.solution_current
+
+    @solution.setter
+    def solution(self, solution):
+        # A directly assigned solution is the current one, earlier builder changes must not overwrite it
+        self.solution_current = solution
+        if getattr(self, "solution_builder", None) is not None:
+            self.solution_builder.changed = False
+
+    def sync_solution(self):
+        # The builder only turns its arrays into self.solution when the solution is used
+        if self.solution_builder is not None and self.solution_builder.changed:
+            self.solution = self.solution_builder.get_solution()
+            self.solution_builder.changed = False
     
     def add_lib(self, lib):
-        if lib in self.libs_used:
-            if not self.silent:
-                print("flop, lib used:", lib)
-            return False
-        if self.time_solution_left - self.lib_days[lib] < 0:
-            if not self.silent:
-                print("flop, no more days left", self.time_solution_left)
-            return False
-        self.time_solution_left -= self.lib_days[lib]
-        self.solution.append((lib, []))
-        self.libs_used.add(lib)
-        self.lib_ind[lib] = self.lib_ind_counter
-        self.lib_ind_counter += 1
-        self.lib_remaining_books_ship[lib] = self.time_solution_left * self.lib_ships[lib]
-        return True
+        return self.solution_builder.add_lib(lib)
 
     def add_lib_book(self, lib, book):
-        if not book in self.lib_books_sets[lib]:
-            if not self.silent:
-                print("flop, book not in lib:", lib, book)
-            return False
-        if self.lib_remaining_books_ship[lib] < 1:
-            if not self.silent:
-                print("flop, no more books to ship:", lib, book)
-            return False
-        if book in self.lib_books_used[lib]:
-            if not self.silent:
-                print("flop, books already added to lib", lib, book)
-        self.solution[self.lib_ind[lib]][1].append(book)
-        self.lib_books_used[lib].add(book)
-        self.lib_remaining_books_ship[lib] -= 1
-        return True
+        return self.solution_builder.add_book(lib, book)
+    
+    def add_lib_books(self, lib, books):
+        return self.solution_builder.add_books(lib, books)
 
     def get_solution_stats(self):
+        self.sync_solution()
         lib_stats = []
         day = 0
         for lib, books in self.solution:
@@ -176,11 +337,35 @@ class Simulation_Base():
             sns.lineplot(data=data, x="day", y=column)
         
         
-    def __init__(self, number, silent = False):
+    def get_lib_books(self, lib):
+        return self.lib_books_indices[self.lib_books_indptr[lib]:self.lib_books_indptr[lib+1]]
+    
+    def get_book_libs(self, book):
+        return self.book_libs_indices[self.book_libs_indptr[book]:self.book_libs_indptr[book+1]]
+    
+    @cached_property
+    def lib_books_lists(self):
+        return get_csr_lists(self.lib_books_indptr, self.lib_books_indices)
+    
+    @cached_property
+    def lib_books_sets(self):
+        return [set(books) for books in self.lib_books_lists]
+    
+    @cached_property
+    def scorer(self):
+        return Solution_Scorer(self)
+    
+    @cached_property
+    def book_libs_lists(self):
+        return get_csr_lists(self.book_libs_indptr, self.book_libs_indices)
+        
+    def __init__(self, number, silent = False, use_cache = True):
         self.number = number
         self.silent = silent
-        num_books, num_libs, num_days, book_points, lib_num_books, lib_days, lib_ships, lib_books_lists = read(number)
+        self.set_instance(load(number, use_cache))
         
+    def set_instance(self, instance):
+        num_books, num_libs, num_days, book_points, lib_num_books, lib_days, lib_ships, lib_books_indptr, lib_books_indices, book_libs_indptr, book_libs_indices = instance
         self.num_books = num_books
         self.num_libs = num_libs
         self.num_days = num_days
@@ -188,16 +373,9 @@ class Simulation_Base():
         self.lib_num_books = lib_num_books
         self.lib_days = lib_days
         self.lib_ships = lib_ships
-        self.lib_books_lists = [list(np.array(books)[np.argsort(self.book_points[books])[::-1]]) for books in lib_books_lists]
-
-
-
-        self.lib_books_sets = [set(books) for books in self.lib_books_lists]
-
-        self.book_num_libs = np.zeros(self.num_books, dtype = int)        
-        self.book_libs_lists = [[] for _ in range(self.num_books)]        
-        for lib, books in enumerate(self.lib_books_lists):
-            for book in books:
-                self.book_libs_lists[book].append(lib)
-            self.book_num_libs[books] += 1
-
+        self.lib_books_indptr = lib_books_indptr
+        self.lib_books_indices = lib_books_indices
+        self.book_libs_indptr = book_libs_indptr
+        self.book_libs_indices = book_libs_indices
+        self.book_num_libs = np.diff(self.book_libs_indptr)
+        self.solution_builder = None
@@ -0,0 +1,143 @@
+import numpy as np
+from scoring import Solution_Scorer, encode_solution, decode_solution
+
+
+class Solution_Builder():
+    # Solution kept in preallocated arrays: library order, the library every book is shipped by and
+    # the books in the order they were added. Every book is shipped at most once.
+    def __init__(self, simulation, scorer=None):
+        self.silent = simulation.silent
+        self.num_books = simulation.num_books
+        self.num_libs = simulation.num_libs
+        self.num_days = simulation.num_days
+        self.lib_days = simulation.lib_days
+        self.lib_ships = simulation.lib_ships
+        self.scorer = Solution_Scorer(simulation) if scorer is None else scorer
+        self.reset()
+
+    def reset(self):
+        self.libs = np.full(self.num_libs, -1, dtype=np.int64)
+        self.num_solution_libs = 0
+        self.lib_position = np.full(self.num_libs, -1, dtype=np.int64)
+        self.lib_ships_remaining = np.zeros(self.num_libs, dtype=np.int64)
+        self.days_remaining = self.num_days
+        self.books = np.full(self.num_books, -1, dtype=np.int64)
+        self.num_solution_books = 0
+        self.book_lib = np.full(self.num_books, -1, dtype=np.int64)
+        self.changed = True
+
+    def add_lib(self, lib):
+        if self.lib_position[lib] >= 0:
+            if not self.silent:
+                print("flop, lib used:", lib)
+            return False
+        if self.days_remaining - self.lib_days[lib] < 0:
+            if not self.silent:
+                print("flop, no more days left", self.days_remaining)
+            return False
+        self.days_remaining -= self.lib_days[lib]
+        self.libs[self.num_solution_libs] = lib
+        self.lib_position[lib] = self.num_solution_libs
+        self.num_solution_libs += 1
+        self.lib_ships_remaining[lib] = self.days_remaining * self.lib_ships[lib]
+        self.changed = True
+        return True
+
+    def add_books(self, lib, books):
+        # Adds the books in the given order until the library cannot ship more, returns the number added
+        books = np.asarray(books, dtype=np.int64)
+        if self.lib_position[lib] < 0:
+            if not self.silent:
+                print("flop, lib not signed up:", lib)
+            return 0
+        in_range = (books >= 0) & (books < self.num_books)
+        if not self.silent and not in_range.all():
+            print("flop, books out of range:", lib, books[~in_range])
+        books = books[in_range]
+        mask = self.scorer.is_member(np.full(len(books), lib, dtype=np.int64), books)
+        if not self.silent and not mask.all():
+            print("flop, books not in lib:", lib, books[~mask])
+        shipped = self.book_lib[books] >= 0
+        if not self.silent and (mask & shipped).any():
+            print("flop, books already shipped:", lib, books[mask & shipped])
+        mask &= ~shipped
+        books = books[mask]
+        # Keep the first occurrence if books contains duplicates
+        books = books[np.sort(np.unique(books, return_index=True)[1])]
+        if len(books) > self.lib_ships_remaining[lib]:
+            if not self.silent:
+                print("flop, no more books to ship:", lib, books[self.lib_ships_remaining[lib]:])
+            books = books[:self.lib_ships_remaining[lib]]
+        num_added = len(books)
+        self.books[self.num_solution_books:self.num_solution_books+num_added] = books
+        self.num_solution_books += num_added
+        self.book_lib[books] = lib
+        self.lib_ships_remaining[lib] -= num_added
+        self.changed = True
+        return num_added
+
+    def add_book(self, lib, book):
+        # Same checks as add_books for a single book, on scalars only since it is called once per book
+        if not 0 <= book < self.num_books:
+            if not self.silent:
+                print("flop, book out of range:", lib, book)
+            return False
+        if self.lib_position[lib] < 0:
+            if not self.silent:
+                print("flop, lib not signed up:", lib)
+            return False
+        if not self.scorer.is_member_book(lib, book):
+            if not self.silent:
+                print("flop, book not in lib:", lib, book)
+            return False
+        if self.book_lib[book] >= 0:
+            if not self.silent:
+                print("flop, book already shipped:", lib, book)
+            return False
+        if self.lib_ships_remaining[lib] < 1:
+            if not self.silent:
+                print("flop, no more books to ship:", lib, book)
+            return False
+        self.books[self.num_solution_books] = book
+        self.num_solution_books += 1
+        self.book_lib[book] = lib
+        self.lib_ships_remaining[lib] -= 1
+        self.changed = True
+        return True
+
+    def get_encoded(self):
+        # Flat encoding of scoring.py, books grouped by the position of their library
+        libs = self.libs[:self.num_solution_libs].copy()
+        books = self.books[:self.num_solution_books]
+        positions = self.lib_position[self.book_lib[books]]
+        books = books[np.argsort(positions, kind='stable')]
+        lib_indptr = np.zeros(self.num_solution_libs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(positions, minlength=self.num_solution_libs), out=lib_indptr[1:])
+        return libs, lib_indptr, books
+
+    def get_solution(self):
+        return decode_solution(*self.get_encoded())
+
+    def set_encoded(self, libs, lib_indptr, books):
+        # Takes an existing solution as it is, without checking it. A book shipped by several libraries stays with the
+        # first one, like in the scorer, its later copies are dropped
+        self.reset()
+        libs, books = np.asarray(libs, dtype=np.int64), np.asarray(books, dtype=np.int64)
+        num_solution_libs = len(libs)
+        self.libs[:num_solution_libs] = libs
+        self.num_solution_libs = num_solution_libs
+        self.lib_position[libs] = np.arange(num_solution_libs)
+        days_remaining = self.num_days - np.cumsum(self.lib_days[libs])
+        self.days_remaining = self.num_days - int(self.lib_days[libs].sum())
+        positions = np.repeat(np.arange(num_solution_libs), np.diff(lib_indptr))
+        first = np.zeros(len(books), dtype=bool)
+        first[np.unique(books, return_index=True)[1]] = True
+        books, positions = books[first], positions[first]
+        lib_num_books = np.bincount(positions, minlength=num_solution_libs)
+        self.lib_ships_remaining[libs] = np.maximum(days_remaining * self.lib_ships[libs] - lib_num_books, 0)
+        self.books[:len(books)] = books
+        self.num_solution_books = len(books)
+        self.book_lib[books] = libs[positions]
+
+    def set_solution(self, solution):
+        self.set_encoded(*encode_solution(solution))
@@ -0,0 +1,67 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from energy import Ordering_Energy
+from annealing import Move_Shift, Move_Swap, Move_Explore, Move_Random_Swap
+
+
+def get_energy(rng, num_libs=40, num_days=60):
+    # Signup days add up to far more than num_days, so many libraries sit behind the deadline
+    lib_days = rng.randint(1, 8, size=num_libs)
+    lib_ships = rng.randint(1, 4, size=num_libs)
+    # Entry [lib, k] holds the points of the k best books, like get_lib_books_points_cum
+    lib_books_points = -np.sort(-rng.randint(0, 100, size=(num_libs, 30)), axis=1)
+    lib_books_points_cum = np.cumsum(np.column_stack([np.zeros(num_libs), lib_books_points]), axis=1)
+    return Ordering_Energy(num_days, lib_days, lib_ships, lib_books_points_cum, rng.permutation(num_libs))
+
+
+def assert_consistent(energy):
+    full = Ordering_Energy(energy.num_days, energy.lib_days, energy.lib_ships, energy.lib_books_points_cum, energy.ind_libs)
+    assert np.isclose(energy.energy, full.energy)
+    assert np.array_equal(energy.days_used, full.days_used)
+    assert np.allclose(energy.points, full.points)
+
+
+def test_incremental_energy_matches_full_recomputation():
+    rng = np.random.RandomState(0)
+    energy = get_energy(rng)
+    moves = [Move_Shift(30, 20), Move_Swap(30, 20), Move_Explore(10), Move_Random_Swap()]
+    for step in range(3000):
+        lo, window = moves[step % len(moves)](rng, energy.ind_libs)
+        ind_libs_next = energy.ind_libs.copy()
+        ind_libs_next[lo:lo+len(window)] = window
+        assert np.isclose(energy.propose(lo, window), energy.get_energy(ind_libs_next))
+        if rng.rand() < 0.5:
+            energy.accept()
+            assert np.array_equal(energy.ind_libs, ind_libs_next)
+            assert_consistent(energy)
+
+
+def test_moves_behind_the_deadline_keep_signup_days():
+    rng = np.random.RandomState(1)
+    energy = get_energy(rng)
+    for step in range(500):
+        boundary = int(np.searchsorted(energy.days_used, energy.num_days)) + 1
+        if boundary >= len(energy.ind_libs) - 1:
+            break
+        lo = rng.randint(boundary, len(energy.ind_libs) - 1)
+        hi = rng.randint(lo + 1, len(energy.ind_libs))
+        assert np.isclose(energy.propose_swap(lo, hi), energy.energy)
+        energy.accept()
+        assert_consistent(energy)
+
+
+def test_batch_moves_match_full_recomputation():
+    rng = np.random.RandomState(2)
+    energy = get_energy(rng)
+    for step in range(200):
+        orderings = np.array([rng.permutation(energy.ind_libs) for _ in range(4)])
+        energies = energy.propose_orderings(orderings)
+        assert np.allclose(energies, [energy.get_energy(ind_libs) for ind_libs in orderings])
+        energy.accept_ordering(rng.randint(4))
+        lo, window = Move_Random_Swap()(rng, energy.ind_libs)
+        energy.propose(lo, window)
+        energy.accept()
+        assert_consistent(energy)
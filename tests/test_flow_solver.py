@@ -0,0 +1,40 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from simulation import Simulation_Base
+from scoring import encode_solution
+from flow_solver import Flow_solver
+from mip_matrix import MIP_matrix_solver
+from generator import Instance_Generator
+
+
+def get_points(book_points, solution):
+    return sum(int(book_points[books].sum()) for lib, books in solution if len(books))
+
+
+@pytest.mark.parametrize("seed, params", [
+    (0, dict(lib_size=("uniform", 1, 20), lib_ships=(1, 3))),
+    (1, dict(book_degree=(2, 3), lib_days=(1, 3), lib_ships=(1, 1))),
+    (2, dict(lib_size=("lognormal", 10, 1.0), popularity=1.0, lib_ships=(1, 2))),
+])
+def test_flow_matches_mip_optimum(tmp_path, seed, params):
+    path = str(tmp_path / "instance.txt")
+    Instance_Generator(80, 15, 30, points=(0, 50), seed=seed, **params).write(path)
+    sim = Simulation_Base(path, silent=True, use_cache=False)
+    flow, mip = Flow_solver(sim), MIP_matrix_solver(sim)
+    rng = np.random.RandomState(seed)
+    for _ in range(10):
+        ind_libs = rng.permutation(sim.num_libs)
+        ind_libs = ind_libs[np.cumsum(sim.lib_days[ind_libs]) < sim.num_days]
+        sim.solution = flow.get_optimal_books_for_ordered_libs(ind_libs)
+        assert sim.scorer.check_solution(encode_solution(sim.solution)) == []
+        assert get_points(sim.book_points, sim.solution) == get_points(sim.book_points, mip.get_optimal_books_for_ordered_libs(ind_libs))
+        # Fewer days and points of a part of the books, like the window models use them
+        days_available = sim.num_days - int(rng.randint(0, 10))
+        book_points_available = np.where(rng.rand(sim.num_books) < 0.7, sim.book_points, 0)
+        result_flow = flow.get_optimal_books_for_ordered_libs(ind_libs, days_available, book_points_available)
+        result_mip = mip.get_optimal_books_for_ordered_libs(ind_libs, days_available, book_points_available)
+        assert get_points(book_points_available, result_flow) == get_points(book_points_available, result_mip)
@@ -0,0 +1,41 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from simulation import Simulation_Base, write_submission_arrays
+from presolve import presolve
+
+
+def get_simulation(tmp_path):
+    # Book 0 has no points, library 2 cannot finish its signup
+    path = tmp_path / "instance.txt"
+    path.write_text("5 3 6\n0 2 3 4 5\n3 1 2\n0 1 2\n3 2 1\n2 3 4\n1 7 1\n4\n")
+    return Simulation_Base(str(path), silent=True, use_cache=False)
+
+
+def test_presolved_instance_cannot_be_loaded_from_number(tmp_path):
+    reduced = presolve(get_simulation(tmp_path))
+    with pytest.raises(ValueError):
+        Simulation_Base(reduced.number, silent=True)
+
+
+def test_read_submission_maps_original_indices(tmp_path):
+    sim = get_simulation(tmp_path)
+    reduced = presolve(sim)
+    write_submission_arrays(sim.number, np.array([1, 0]), np.array([0, 2, 5]), np.array([4, 3, 2, 1, 0]), atomic=False)
+    reduced.init_solution()
+    reduced.read_submission()
+    assert reduced.get_original_solution() == [(1, [4, 3]), (0, [2, 1])]
+    sim.read_submission()
+    assert reduced.get_score() == sim.get_score()
+
+
+def test_read_submission_rejects_removed_libraries(tmp_path):
+    sim = get_simulation(tmp_path)
+    reduced = presolve(sim)
+    write_submission_arrays(sim.number, np.array([2]), np.array([0, 1]), np.array([4]), atomic=False)
+    reduced.init_solution()
+    with pytest.raises(ValueError):
+        reduced.read_submission()
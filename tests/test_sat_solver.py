@@ -0,0 +1,39 @@
+import os
+import sys
+from time import time
+from types import SimpleNamespace
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from simulation import Simulation_Base
+from sat_solver import Library_CNF, read_dimacs, run_portfolio
+
+
+def test_dimacs_round_trip(tmp_path):
+    # Books 0 and 1 in two libraries each, books 2 and 3 in three
+    path = tmp_path / "instance.txt"
+    path.write_text("4 4 10\n1 1 1 1\n2 2 1\n0 2\n2 2 1\n0 3\n3 2 1\n1 2 3\n3 2 1\n1 2 3\n")
+    cnf = Library_CNF(Simulation_Base(str(path), silent=True, use_cache=False))
+    assert cnf.num_variables == 2
+    cnf.write_dimacs(str(tmp_path / "formula.cnf"))
+    clauses = read_dimacs(str(tmp_path / "formula.cnf")).reshape(-1, 4)
+    assert (clauses[:, 3] == 0).all()
+    assert (clauses[:, :3] == cnf.clauses).all()
+
+
+def test_portfolio_ignores_backends_that_gave_up():
+    # All eight sign patterns of three variables, unsatisfiable, local search can only give up
+    signs = np.array([[a, b, c] for a in (1, -1) for b in (1, -1) for c in (1, -1)], dtype=np.int32)
+    cnf = SimpleNamespace(num_variables=3, clauses=signs * np.arange(1, 4, dtype=np.int32))
+    satisfied, assignment, stats = run_portfolio(cnf, ["probsat"], num_instances=2, num_workers=2, max_flips=100, max_tries=2)
+    assert satisfied is None
+    assert assignment is None
+
+
+def test_portfolio_timeout():
+    signs = np.array([[a, b, c] for a in (1, -1) for b in (1, -1) for c in (1, -1)], dtype=np.int32)
+    cnf = SimpleNamespace(num_variables=3, clauses=signs * np.arange(1, 4, dtype=np.int32))
+    t0 = time()
+    satisfied, assignment, stats = run_portfolio(cnf, ["probsat"], num_instances=2, num_workers=2, max_flips=1000, max_tries=None, timeout=1)
+    assert satisfied is None
+    assert time() - t0 < 10
@@ -0,0 +1,72 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from simulation import Simulation_Base
+from scoring import encode_solution
+from generator import Instance_Generator
+
+
+def get_score_sets(sim, solution):
+    # Set-based get_score of the original Simulation_Base
+    set_books = set()
+    for lib, books in solution:
+        for book in books:
+            set_books.add(book)
+    ind_books = np.array(list(set_books))
+    if len(ind_books) > 0:
+        return np.sum(sim.book_points[ind_books])
+    return 0
+
+def check_solution_sets(sim, solution):
+    # Set-based check_solution of the original Simulation_Base, without its prints
+    libs_used = set()
+    days_remaining = sim.num_days
+    for lib, books in solution:
+        if lib in libs_used:
+            return False
+        libs_used.add(lib)
+        days_remaining -= sim.lib_days[lib]
+        if days_remaining < 0:
+            return False
+        if len(set(books).difference(sim.lib_books_sets[lib])) > 0:
+            return False
+        if len(set(books)) != len(books):
+            return False
+        if len(books) > sim.lib_ships[lib] * days_remaining:
+            return False
+    return True
+
+def get_random_solution(rng, sim):
+    # Mostly valid solutions, with a few libraries signed up twice, foreign or repeated books and too many books
+    solution = []
+    for lib in rng.permutation(sim.num_libs)[:rng.randint(0, sim.num_libs + 1)].tolist():
+        books = sim.lib_books_lists[lib]
+        books = rng.choice(books, size=rng.randint(0, len(books) + 1), replace=False).tolist()
+        if rng.rand() < 0.05:
+            books.append(int(rng.randint(sim.num_books)))
+        if books and rng.rand() < 0.05:
+            books.append(books[0])
+        solution.append((lib, books))
+    if solution and rng.rand() < 0.05:
+        solution.append(solution[0])
+    return solution
+
+
+def test_scorer_matches_set_based_scoring(tmp_path):
+    path = str(tmp_path / "instance.txt")
+    Instance_Generator(60, 12, 40, points=(0, 20), lib_size=("uniform", 1, 15), lib_days=(1, 8), lib_ships=(1, 3), seed=3).write(path)
+    sim = Simulation_Base(path, silent=True, use_cache=False)
+    rng = np.random.RandomState(0)
+    solutions = [get_random_solution(rng, sim) for _ in range(500)]
+    encodings = [encode_solution(solution) for solution in solutions]
+    scores = sim.scorer.get_scores(encodings, max_mask_size=1000)
+    num_valid = 0
+    for solution, encoded, score in zip(solutions, encodings, scores):
+        assert sim.scorer.get_score(encoded) == get_score_sets(sim, solution) == score
+        is_valid = check_solution_sets(sim, solution)
+        assert (len(sim.scorer.check_solution(encoded)) == 0) == is_valid
+        num_valid += is_valid
+    # Both kinds of solutions have to be covered
+    assert 0 < num_valid < len(solutions)
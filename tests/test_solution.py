@@ -0,0 +1,56 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from simulation import Simulation_Base, write_submission_arrays
+from solution import Solution_Builder
+
+
+def get_simulation(tmp_path):
+    # 4 books, both libraries hold books 1 and 2
+    path = tmp_path / "instance.txt"
+    path.write_text("4 2 10\n1 2 3 4\n3 1 5\n0 1 2\n3 1 5\n1 2 3\n")
+    return Simulation_Base(str(path), silent=True, use_cache=False)
+
+
+def test_set_encoded_drops_books_repeated_across_libs(tmp_path):
+    sim = get_simulation(tmp_path)
+    builder = Solution_Builder(sim)
+    libs, lib_indptr, books = np.array([0, 1]), np.array([0, 3, 6]), np.array([0, 1, 2, 1, 2, 3])
+    builder.set_encoded(libs, lib_indptr, books)
+    libs_out, lib_indptr_out, books_out = builder.get_encoded()
+    assert libs_out.tolist() == [0, 1]
+    assert lib_indptr_out.tolist() == [0, 3, 4]
+    assert books_out.tolist() == [0, 1, 2, 3]
+    assert builder.scorer.get_score(builder.get_encoded()) == sim.scorer.get_score((libs, lib_indptr, books))
+
+
+def test_set_encoded_more_pairs_than_books(tmp_path):
+    sim = get_simulation(tmp_path)
+    builder = Solution_Builder(sim)
+    builder.set_encoded(np.array([0, 1]), np.array([0, 3, 8]), np.array([0, 1, 2, 1, 2, 3, 1, 2]))
+    assert builder.get_encoded()[2].tolist() == [0, 1, 2, 3]
+
+
+def test_read_submission_is_not_overwritten_by_builder(tmp_path):
+    sim = get_simulation(tmp_path)
+    sim.init_solution()
+    write_submission_arrays(sim.number, np.array([1]), np.array([0, 2]), np.array([3, 2]), atomic=False)
+    sim.read_submission()
+    assert sim.solution == [(1, [3, 2])]
+    assert sim.get_score() == 7
+
+
+def test_add_book_matches_add_books(tmp_path):
+    sim = get_simulation(tmp_path)
+    single, bulk = Solution_Builder(sim), Solution_Builder(sim)
+    for builder in (single, bulk):
+        builder.silent = True
+        builder.add_lib(0)
+        builder.add_lib(1)
+    candidates = [(0, 2), (0, 2), (0, 3), (1, 2), (1, 3), (0, -1), (1, -1), (1, 4), (0, 0), (0, 1), (1, 1)]
+    for lib, book in candidates:
+        assert single.add_book(lib, book) == (bulk.add_books(lib, [book]) == 1)
+    assert [array.tolist() for array in single.get_encoded()] == [array.tolist() for array in bulk.get_encoded()]
+    assert single.get_encoded()[2].tolist() == [2, 0, 1, 3]
@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from simulation import Simulation_Base, write_submission_arrays, read_submission_arrays, line_to_ints
+from scoring import encode_solution, decode_solution
+from flow_solver import Flow_solver
+from generator import Instance_Generator
+
+
+def write_lines(path, solution):
+    # Line writer of the original Simulation_Base.write, libraries without books are left out
+    submission = [[0]]
+    for lib, books in solution:
+        if len(books) > 0:
+            submission[0][0] += 1
+            submission.append([lib, len(books)])
+            submission.append(books)
+    with open(path, 'w') as f:
+        for lis in submission:
+            for e in lis[:-1]:
+                f.write(str(e) + " ")
+            f.write(str(lis[-1]) + "\n")
+
+def read_lines(path):
+    # Line reader of the original read_submission
+    solution = []
+    with open(path, 'r') as f:
+        num_libs = line_to_ints(f.readline())[0]
+        for i in range(num_libs):
+            lib, _ = line_to_ints(f.readline())
+            books = line_to_ints(f.readline())
+            solution.append((lib, books))
+    return solution
+
+def get_solutions(sim, rng):
+    flow = Flow_solver(sim)
+    solutions = [[], [(3, [])], [(0, [5]), (1, [])]]
+    for _ in range(20):
+        ind_libs = rng.permutation(sim.num_libs)
+        solutions.append(flow.get_optimal_books_for_ordered_libs(ind_libs[np.cumsum(sim.lib_days[ind_libs]) < sim.num_days]))
+    return solutions
+
+
+def test_bulk_writer_matches_line_writer(tmp_path):
+    path = str(tmp_path / "instance.txt")
+    Instance_Generator(5000, 40, 200, lib_size=("uniform", 1, 400), lib_ships=(1, 20), seed=4).write(path)
+    sim = Simulation_Base(path, silent=True, use_cache=False)
+    for k, solution in enumerate(get_solutions(sim, np.random.RandomState(0))):
+        path_lines, path_arrays = str(tmp_path / "lines_{}.txt".format(k)), str(tmp_path / "arrays_{}.txt".format(k))
+        write_lines(path_lines, solution)
+        write_submission_arrays(sim.number, *encode_solution(solution), path=path_arrays)
+        with open(path_lines, 'rb') as f_lines, open(path_arrays, 'rb') as f_arrays:
+            assert f_lines.read() == f_arrays.read()
+        # Both readers give the solution without its empty libraries back
+        expected = [(lib, books) for lib, books in solution if len(books)]
+        assert read_lines(path_arrays) == expected
+        assert decode_solution(*read_submission_arrays(sim.number, path=path_lines)) == expected